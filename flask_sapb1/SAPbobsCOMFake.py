@@ -0,0 +1,647 @@
+"""In-process stand-in for the SAP B1 DI API.
+
+Implements the subset of Company, Documents, Document_Lines,
+BusinessPartners, ContactEmployees and Recordset used by the extension,
+so the write path can be exercised and benchmarked without a Windows box
+running SAP B1.  Select it with DIAPI = 'SAPbobsCOMFake'.
+
+Documents and business partners are kept in memory, or in the SQLite
+company database of flask_sapb1.mssqlfake when CompanyDB is the path of
+such a file, so orders added through the fake are visible to the SQL reads.
+
+Every method call and property access sleeps for the latency configured
+with setLatency() to mimic cross-process COM calls.
+"""
+import datetime
+import os
+import threading
+import time
+
+from . import mssqlfake
+
+LATENCY = {
+    'connect': 0.0,
+    'call': 0.0,
+    'property': 0.0
+}
+
+
+def setLatency(connect=None, call=None, property=None):
+    """Set the seconds injected per Connect(), per method call and per property get/put.
+    """
+    for key, value in (('connect', connect), ('call', call), ('property', property)):
+        if value is not None:
+            LATENCY[key] = value
+
+
+def _delay(kind):
+    if LATENCY[kind]:
+        time.sleep(LATENCY[kind])
+
+
+class constants:
+    BoRecordset = 300
+    oBusinessPartners = 2
+    oCreditNotes = 14
+    oDeliveryNotes = 15
+    oDownPayments = 203
+    oInvoices = 13
+    oOrders = 17
+    oPurchaseCreditNotes = 19
+    oPurchaseDeliveryNotes = 20
+    oPurchaseInvoices = 18
+    oPurchaseOrders = 22
+    oPurchaseReturns = 21
+    oQuotations = 23
+    oReturns = 16
+    dst_MSSQL = 1
+    dst_MSSQL2005 = 4
+    dst_MSSQL2008 = 6
+    dst_MSSQL2012 = 7
+    dst_MSSQL2014 = 8
+    dst_MSSQL2016 = 10
+    ln_English = 3
+    ln_English_Gb = 8
+    ln_English_Sg = 6
+    ln_English_Cy = 21
+    tNO = 0
+    tYES = 1
+
+
+class Store(object):
+    """In-memory backing store of the fake company: documents by object type
+    and DocEntry, and business partners with their contact employees.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = {}
+        self.businessPartners = {}
+        self._docEntries = {}
+        self._cntctCodes = 0
+
+    def nextDocEntry(self, objType):
+        with self._lock:
+            self._docEntries[objType] = self._docEntries.get(objType, 0) + 1
+            return self._docEntries[objType]
+
+    def nextCntctCode(self):
+        with self._lock:
+            self._cntctCodes = self._cntctCodes + 1
+            return self._cntctCodes
+
+    def saveDocument(self, objType, document):
+        with self._lock:
+            self.documents.setdefault(objType, {})[document['header']['DocEntry']] = document
+
+    def loadDocument(self, objType, docEntry):
+        with self._lock:
+            return self.documents.get(objType, {}).get(int(docEntry))
+
+    def addBusinessPartner(self, cardCode, cardName='', cardType='C'):
+        with self._lock:
+            self.businessPartners[cardCode] = {
+                'header': {'CardCode': cardCode, 'CardName': cardName, 'CardType': cardType},
+                'contacts': []
+            }
+
+    def saveBusinessPartner(self, businessPartner):
+        with self._lock:
+            self.businessPartners[businessPartner['header']['CardCode']] = businessPartner
+
+    def loadBusinessPartner(self, cardCode):
+        with self._lock:
+            return self.businessPartners.get(cardCode)
+
+
+STORE = Store()
+
+
+class SQLiteStore(Store):
+    """Store writing documents and contacts to the tables of a
+    flask_sapb1.mssqlfake company database.
+    """
+    HEADER_COLUMNS = {
+        'DocEntry': 'DocEntry', 'DocNum': 'DocNum', 'ObjType': 'ObjType', 'CardCode': 'CardCode',
+        'CardName': 'CardName', 'NumAtCard': 'NumAtCard', 'DocDate': 'DocDate', 'DocDueDate': 'DocDueDate',
+        'DocCurrency': 'DocCur', 'ContactPersonCode': 'CntctCode', 'TransportationCode': 'TrnspCode',
+        'PaymentMethod': 'PeyMethod', 'DiscountPercent': 'DiscPrcnt', 'DocTotal': 'DocTotal',
+        'Comments': 'Comments', 'DocumentStatus': 'DocStatus', 'Address': 'Address', 'Address2': 'Address2'
+    }
+    LINE_COLUMNS = {
+        'LineNum': 'LineNum', 'ItemCode': 'ItemCode', 'ItemDescription': 'Dscription', 'Quantity': 'Quantity',
+        'Price': 'Price', 'TaxCode': 'TaxCode', 'LineTotal': 'LineTotal', 'WarehouseCode': 'WhsCode',
+        'BaseType': 'BaseType', 'BaseEntry': 'BaseEntry', 'BaseLine': 'BaseLine'
+    }
+    ADDRESS_COLUMNS = dict([('{0}To{1}'.format(part, name), name + suffix)
+                            for part, suffix in (('Ship', 'S'), ('Bill', 'B'))
+                            for name in ('Street', 'StreetNo', 'Block', 'Building', 'City', 'ZipCode', 'County',
+                                         'State', 'Country')])
+    CONTACT_COLUMNS = {
+        'InternalCode': 'CntctCode', 'Name': 'Name', 'FirstName': 'FirstName', 'LastName': 'LastName',
+        'E_Mail': 'E_MailL', 'Phone1': 'Tel1', 'Address': 'Address'
+    }
+
+    def __init__(self, path):
+        super(SQLiteStore, self).__init__()
+        self.path = path
+        self._conn = mssqlfake.connect(database=path)
+        self._columns = {}
+        # Reentrant: _ensureColumn reads the column cache through _tableColumns.
+        self._lock = threading.RLock()
+
+    def _execute(self, sql, params=()):
+        cursor = self._conn.sqlite.cursor()
+        cursor.execute(sql, params)
+        return cursor
+
+    def _tableColumns(self, table):
+        with self._lock:
+            if table not in self._columns:
+                self._columns[table] = [row[1] for row in self._execute("PRAGMA table_info({0})".format(table))]
+            return self._columns[table]
+
+    def _ensureColumn(self, table, column):
+        with self._lock:
+            if column.lower() not in [name.lower() for name in self._tableColumns(table)]:
+                self._execute("ALTER TABLE {0} ADD COLUMN {1} TEXT".format(table, column))
+                self._columns.pop(table, None)
+
+    def _insert(self, table, row):
+        columns = sorted(row.keys())
+        self._execute("INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(
+            table, ", ".join(columns), ", ".join(['?'] * len(columns))), [self._value(row[c]) for c in columns])
+
+    def _value(self, value):
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            return datetime.datetime(value.year, value.month, value.day)
+        if isinstance(value, (str, type(u''))) and len(value) == 10 and value[4:5] == '-' and value[7:8] == '-':
+            return datetime.datetime.strptime(value, "%Y-%m-%d")
+        return mssqlfake.sqlValue(value)
+
+    def _next(self, key, sql):
+        with self._lock:
+            if key not in self._docEntries:
+                self._docEntries[key] = self._execute(sql).fetchone()[0] or 0
+            self._docEntries[key] = self._docEntries[key] + 1
+            return self._docEntries[key]
+
+    def nextDocEntry(self, objType):
+        header, line = mssqlfake.DOCUMENT_TABLES[objType]
+        return self._next(objType, "SELECT MAX(DocEntry) FROM {0}".format(header))
+
+    def nextCntctCode(self):
+        return self._next('OCPR', "SELECT MAX(CntctCode) FROM OCPR")
+
+    def saveDocument(self, objType, document):
+        header, line = mssqlfake.DOCUMENT_TABLES[objType]
+        docEntry = document['header']['DocEntry']
+        row = dict((column, document['header'][name]) for name, column in self.HEADER_COLUMNS.items()
+                   if name in document['header'])
+        row['CANCELED'] = 'Y' if document['header'].get('Cancelled') == constants.tYES else 'N'
+        row['DocStatus'] = 'C' if row['CANCELED'] == 'Y' else row.get('DocStatus') or 'O'
+        row['DocTotal'] = row.get('DocTotal') or sum(float(l.get('LineTotal') or 0) for l in document['lines'])
+        row['UpdateDate'] = datetime.datetime.now().replace(microsecond=0)
+        row.setdefault('DocDate', row['UpdateDate'])
+        row.setdefault('CreateDate', row['UpdateDate'])
+        address = document.get('address', {})
+        if address:
+            row['Address'] = ", ".join([str(address[k]) for k in sorted(address) if k.startswith('BillTo')])
+            row['Address2'] = ", ".join([str(address[k]) for k in sorted(address) if k.startswith('ShipTo')])
+        for name, value in document.get('userFields', {}).items():
+            self._ensureColumn(header, name)
+            row[name] = value
+        with self._lock:
+            self._insert(header, row)
+            self._execute("DELETE FROM {0} WHERE DocEntry = ?".format(line), (docEntry,))
+            if address:
+                addressRow = dict((column, address[name]) for name, column in self.ADDRESS_COLUMNS.items()
+                                  if name in address)
+                addressRow['DocEntry'] = docEntry
+                addressRow['ObjType'] = str(objType)
+                self._insert(line[0:-1] + '12', addressRow)
+            for values in document['lines']:
+                lineRow = dict((column, values[name]) for name, column in self.LINE_COLUMNS.items() if name in values)
+                lineRow['DocEntry'] = docEntry
+                lineRow['ObjType'] = str(objType)
+                lineRow['LineStatus'] = row['DocStatus']
+                lineRow['OpenQty'] = values.get('Quantity')
+                self._insert(line, lineRow)
+            self._conn.commit()
+
+    def loadDocument(self, objType, docEntry):
+        header, line = mssqlfake.DOCUMENT_TABLES[objType]
+        with self._lock:
+            cursor = self._execute("SELECT * FROM {0} WHERE DocEntry = ?".format(header), (int(docEntry),))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            row = dict(zip([c[0] for c in cursor.description], row))
+            cursor = self._execute("SELECT * FROM {0} WHERE DocEntry = ? ORDER BY LineNum".format(line), (int(docEntry),))
+            lineColumns = [c[0] for c in cursor.description]
+            lines = [dict(zip(lineColumns, values)) for values in cursor.fetchall()]
+        document = {
+            'header': dict((name, row[column]) for name, column in self.HEADER_COLUMNS.items() if column in row),
+            'lines': [dict((name, values[column]) for name, column in self.LINE_COLUMNS.items() if column in values)
+                      for values in lines],
+            'userFields': dict((k, v) for k, v in row.items() if k.startswith('U_'))
+        }
+        document['header']['Cancelled'] = constants.tYES if row.get('CANCELED') == 'Y' else constants.tNO
+        return document
+
+    def addBusinessPartner(self, cardCode, cardName='', cardType='C'):
+        with self._lock:
+            self._insert('OCRD', {'CardCode': cardCode, 'CardName': cardName, 'CardType': cardType})
+            self._conn.commit()
+
+    def loadBusinessPartner(self, cardCode):
+        with self._lock:
+            row = self._execute("SELECT CardCode, CardName, CardType FROM OCRD WHERE CardCode = ?", (cardCode,)).fetchone()
+            if row is None:
+                return None
+            columns = sorted(self.CONTACT_COLUMNS.items())
+            contacts = self._execute("SELECT {0} FROM OCPR WHERE CardCode = ? ORDER BY CntctCode".format(
+                ", ".join([column for name, column in columns])), (cardCode,)).fetchall()
+        return {
+            'header': {'CardCode': row[0], 'CardName': row[1], 'CardType': row[2]},
+            'contacts': [dict((name, value) for (name, column), value in zip(columns, contact)) for contact in contacts]
+        }
+
+    def saveBusinessPartner(self, businessPartner):
+        cardCode = businessPartner['header']['CardCode']
+        with self._lock:
+            for contact in businessPartner['contacts']:
+                row = dict((column, contact[name]) for name, column in self.CONTACT_COLUMNS.items() if name in contact)
+                row['CardCode'] = cardCode
+                row['Active'] = 'Y'
+                row['UpdateDate'] = datetime.datetime.now().replace(microsecond=0)
+                self._insert('OCPR', row)
+            self._conn.commit()
+
+    def query(self, sql):
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute(sql)
+            return [c[0] for c in cursor.description or []], cursor.fetchall()
+
+
+_stores = {}
+_storesLock = threading.Lock()
+
+
+def sqliteStore(path):
+    """Shared SQLiteStore of a company database file.
+    """
+    path = os.path.abspath(path)
+    with _storesLock:
+        if path not in _stores:
+            _stores[path] = SQLiteStore(path)
+        return _stores[path]
+
+
+class _Object(object):
+    """Property bag charging the property latency on every get and put.
+    """
+    _defaults = {}
+
+    def __init__(self, values=None):
+        object.__setattr__(self, '_values', dict(values or {}))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        _delay('property')
+        if name in self._values:
+            return self._values[name]
+        if name in self._defaults:
+            return self._defaults[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        _delay('property')
+        self._values[name] = value
+
+
+class Field(_Object):
+    _defaults = {'Value': None}
+
+
+class Fields(object):
+    def __init__(self):
+        self._items = {}
+
+    def Item(self, index):
+        _delay('call')
+        if index not in self._items:
+            self._items[index] = Field({'Name': index})
+        return self._items[index]
+
+    @property
+    def Count(self):
+        _delay('property')
+        return len(self._items)
+
+    def values(self):
+        return dict((name, field._values.get('Value')) for name, field in self._items.items())
+
+
+class UserFields(object):
+    def __init__(self):
+        self.Fields = Fields()
+
+
+class _Lines(object):
+    """Collection positioned on a current line, like Document_Lines and ContactEmployees.
+
+    Starts with one empty line; Add() appends a line and makes it current.
+    """
+    _defaults = {}
+
+    def __init__(self, lines=None):
+        object.__setattr__(self, '_lines', [dict(line) for line in lines] if lines else [{}])
+        object.__setattr__(self, '_current', 0)
+
+    @property
+    def Count(self):
+        _delay('property')
+        return len(self._lines)
+
+    def Add(self):
+        _delay('call')
+        self._lines.append({})
+        object.__setattr__(self, '_current', len(self._lines) - 1)
+
+    def SetCurrentLine(self, index):
+        _delay('call')
+        if index < 0 or index >= len(self._lines):
+            raise IndexError("Line {0} is out of range.".format(index))
+        object.__setattr__(self, '_current', index)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        _delay('property')
+        line = self._lines[self._current]
+        if name in line:
+            return line[name]
+        if name in self._defaults:
+            return self._defaults[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        _delay('property')
+        self._lines[self._current][name] = value
+
+    def rows(self, key):
+        """Lines having a value for key, i.e. without the trailing empty line.
+        """
+        return [dict(line) for line in self._lines if line.get(key)]
+
+
+class Document_Lines(_Lines):
+    _defaults = {'ItemCode': '', 'Quantity': 0.0, 'Price': 0.0, 'TaxCode': '', 'LineTotal': 0.0,
+                 'BaseType': -1, 'BaseEntry': 0, 'BaseLine': 0}
+
+
+class Document_SpecialLines(_Lines):
+    _defaults = {'ExpenseCode': 0, 'LineTotal': 0.0, 'TaxCode': ''}
+
+
+class ContactEmployees(_Lines):
+    _defaults = {'InternalCode': 0, 'Name': '', 'FirstName': '', 'LastName': '', 'Phone1': '',
+                 'E_Mail': '', 'Address': ''}
+
+
+class AddressExtension(_Object):
+    pass
+
+
+class Documents(_Object):
+    _defaults = {'DocEntry': 0, 'DocNum': 0, 'CardCode': '', 'CardName': '', 'NumAtCard': '',
+                 'DocCurrency': '', 'DocDueDate': None, 'ContactPersonCode': 0, 'DiscountPercent': 0.0,
+                 'TransportationCode': 0, 'PaymentMethod': '', 'Cancelled': constants.tNO}
+
+    def __init__(self, company, objType):
+        super(Documents, self).__init__()
+        object.__setattr__(self, '_company', company)
+        object.__setattr__(self, '_objType', objType)
+        self._reset()
+
+    def _reset(self, document=None):
+        document = document or {}
+        object.__setattr__(self, '_values', dict(document.get('header', {})))
+        self._values['Lines'] = Document_Lines(document.get('lines'))
+        self._values['Expenses'] = Document_SpecialLines(document.get('expenses'))
+        self._values['AddressExtension'] = AddressExtension(document.get('address'))
+        self._values['UserFields'] = UserFields()
+        for name, value in document.get('userFields', {}).items():
+            self._values['UserFields'].Fields.Item(name)._values['Value'] = value
+
+    def _document(self):
+        header = dict((k, v) for k, v in self._values.items()
+                      if k not in ('Lines', 'Expenses', 'AddressExtension', 'UserFields'))
+        lines = self._values['Lines'].rows('ItemCode')
+        for lineNum, line in enumerate(lines):
+            line['LineNum'] = lineNum
+        return {
+            'header': header,
+            'lines': lines,
+            'expenses': self._values['Expenses'].rows('ExpenseCode'),
+            'address': dict(self._values['AddressExtension']._values),
+            'userFields': self._values['UserFields'].Fields.values()
+        }
+
+    def Add(self):
+        _delay('call')
+        document = self._document()
+        if not document['header'].get('CardCode'):
+            return self._company._fail(-5002, "Enter a business partner code")
+        if not document['lines']:
+            return self._company._fail(-5002, "Document must contain at least one line")
+        docEntry = self._company._store.nextDocEntry(self._objType)
+        document['header']['DocEntry'] = docEntry
+        document['header']['DocNum'] = docEntry
+        document['header']['ObjType'] = str(self._objType)
+        document['header'].setdefault('Cancelled', constants.tNO)
+        self._company._store.saveDocument(self._objType, document)
+        self._company._added(docEntry)
+        return 0
+
+    def GetByKey(self, docEntry):
+        _delay('call')
+        document = self._company._store.loadDocument(self._objType, docEntry)
+        if document is None:
+            self._company._fail(-2028, "No matching records found")
+            return False
+        self._reset(document)
+        return True
+
+    def Update(self):
+        _delay('call')
+        if not self._values.get('DocEntry'):
+            return self._company._fail(-5002, "Document is not loaded")
+        document = self._document()
+        self._company._store.saveDocument(self._objType, document)
+        return 0
+
+    def Cancel(self):
+        _delay('call')
+        if not self._values.get('DocEntry'):
+            return self._company._fail(-5002, "Document is not loaded")
+        if self._values.get('Cancelled') == constants.tYES:
+            return self._company._fail(-5002, "Document is already cancelled")
+        self._values['Cancelled'] = constants.tYES
+        self._company._store.saveDocument(self._objType, self._document())
+        return 0
+
+    def Close(self):
+        _delay('call')
+        self._values['DocumentStatus'] = 'C'
+        self._company._store.saveDocument(self._objType, self._document())
+        return 0
+
+
+class BusinessPartners(_Object):
+    _defaults = {'CardCode': '', 'CardName': '', 'CardType': 'C'}
+
+    def __init__(self, company):
+        super(BusinessPartners, self).__init__()
+        object.__setattr__(self, '_company', company)
+        self._values['ContactEmployees'] = ContactEmployees()
+
+    def GetByKey(self, cardCode):
+        _delay('call')
+        businessPartner = self._company._store.loadBusinessPartner(cardCode)
+        if businessPartner is None:
+            self._company._fail(-2028, "No matching records found")
+            return False
+        object.__setattr__(self, '_values', dict(businessPartner['header']))
+        self._values['ContactEmployees'] = ContactEmployees(businessPartner['contacts'])
+        return True
+
+    def Update(self):
+        _delay('call')
+        if not self._values.get('CardCode'):
+            return self._company._fail(-5002, "Business partner is not loaded")
+        contacts = self._values['ContactEmployees'].rows('Name')
+        for contact in contacts:
+            if not contact.get('InternalCode'):
+                contact['InternalCode'] = self._company._store.nextCntctCode()
+        header = dict((k, v) for k, v in self._values.items() if k != 'ContactEmployees')
+        self._company._store.saveBusinessPartner({'header': header, 'contacts': contacts})
+        return 0
+
+
+class Recordset(object):
+    def __init__(self, company):
+        self._company = company
+        self._rows = []
+        self._columns = []
+        self._position = 0
+        self.Fields = _RecordsetFields(self)
+
+    def DoQuery(self, sql):
+        _delay('call')
+        self._columns, self._rows = self._company._store.query(sql)
+        self._position = 0
+
+    @property
+    def RecordCount(self):
+        _delay('property')
+        return len(self._rows)
+
+    @property
+    def EoF(self):
+        _delay('property')
+        return self._position >= len(self._rows)
+
+    def MoveFirst(self):
+        _delay('call')
+        self._position = 0
+
+    def MoveNext(self):
+        _delay('call')
+        self._position = self._position + 1
+
+
+class _RecordsetFields(object):
+    def __init__(self, recordset):
+        self._recordset = recordset
+
+    @property
+    def Count(self):
+        _delay('property')
+        return len(self._recordset._columns)
+
+    def Item(self, index):
+        _delay('call')
+        recordset = self._recordset
+        if not isinstance(index, int):
+            index = recordset._columns.index(index)
+        value = None
+        if recordset._position < len(recordset._rows):
+            value = recordset._rows[recordset._position][index]
+        return Field({'Name': recordset._columns[index], 'Value': value})
+
+
+class Company(_Object):
+    _defaults = {'Server': '', 'UseTrusted': False, 'language': constants.ln_English,
+                 'DbServerType': constants.dst_MSSQL2008, 'CompanyDB': '', 'UserName': '',
+                 'Password': '', 'CompanyName': '', 'Connected': False}
+
+    def __init__(self, store=None):
+        super(Company, self).__init__()
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_lastError', (0, ''))
+        object.__setattr__(self, '_newObjectKey', '')
+
+    def _fail(self, code, message):
+        object.__setattr__(self, '_lastError', (code, message))
+        return code
+
+    def _added(self, key):
+        object.__setattr__(self, '_lastError', (0, ''))
+        object.__setattr__(self, '_newObjectKey', str(key))
+
+    def Connect(self):
+        _delay('call')
+        _delay('connect')
+        if self._store is None:
+            companyDB = self._values.get('CompanyDB')
+            if companyDB and os.path.isfile(companyDB):
+                object.__setattr__(self, '_store', sqliteStore(companyDB))
+            else:
+                object.__setattr__(self, '_store', STORE)
+        self._values['Connected'] = True
+        self._values['CompanyName'] = self._values.get('CompanyDB') or 'Fake Company'
+        return 0
+
+    def Disconnect(self):
+        _delay('call')
+        self._values['Connected'] = False
+
+    def GetBusinessObject(self, objType):
+        _delay('call')
+        if objType == constants.BoRecordset:
+            if not hasattr(self._store, 'query'):
+                raise RuntimeError("Recordset needs a SQLite company database: "
+                                   "set CompanyDB to the path of a flask_sapb1.mssqlfake file.")
+            return Recordset(self)
+        if objType == constants.oBusinessPartners:
+            return BusinessPartners(self)
+        return Documents(self, objType)
+
+    def GetLastError(self):
+        _delay('call')
+        return self._lastError
+
+    def GetLastErrorCode(self):
+        _delay('call')
+        return self._lastError[0]
+
+    def GetLastErrorDescription(self):
+        _delay('call')
+        return self._lastError[1]
+
+    def GetNewObjectKey(self):
+        _delay('call')
+        return self._newObjectKey
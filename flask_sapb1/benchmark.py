@@ -0,0 +1,281 @@
+"""Benchmarks of the hot paths of the extension against the local stand-ins.
+
+Runs the readers, insertOrder and the connects with DIAPI = 'SAPbobsCOMFake'
+and DBDRIVER = 'flask_sapb1.mssqlfake' on a synthetic company database and
+saves the results as JSON:
+
+    python -m flask_sapb1.benchmark --output results.json
+    python -m flask_sapb1.benchmark --compare results.json --threshold 0.1
+
+With --compare the exit status is 1 when a metric is worse than in the
+baseline by more than the threshold.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+from time import time
+
+from flask import Flask
+
+from . import SAPbobsCOMFake
+from . import mssqlfake
+from .flask_sapb1 import SAPB1Adaptor
+from .snapshots import InvalidOrderError
+
+HIGHER = 'higher'
+LOWER = 'lower'
+
+LINE_COUNTS = (1, 10, 200)
+
+
+def makeApp(path, **config):
+    """Flask app with the extension running on the stand-ins over the SQLite file at path.
+    """
+    app = Flask('sapb1-benchmark')
+    app.config.update(DIAPI='SAPbobsCOMFake', DBDRIVER='flask_sapb1.mssqlfake', SERVER='localhost',
+                      LANGUAGE='ln_English', DBSERVERTYPE='dst_MSSQL2008', COMPANYDB=path,
+                      B1USERNAME='manager', B1PASSWORD='manager', DBUSERNAME='sa', DBPASSWORD='sa')
+    app.config.update(config)
+    return app, SAPB1Adaptor(app)
+
+
+def customers(path, count):
+    """Contacts of the first count customers, to build orders that find their contact person.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT CardCode, FirstName, LastName, E_MailL FROM OCPR "
+                            "ORDER BY CntctCode LIMIT ?", (count,)).fetchall()
+    finally:
+        conn.close()
+
+
+def orderPayload(feOrderId, customer, lines):
+    cardCode, firstName, lastName, email = customer
+    return {
+        'fe_order_id': feOrderId,
+        'card_code': cardCode,
+        'doc_due_date': datetime.date.today().strftime("%Y-%m-%d"),
+        'billto_firstname': firstName,
+        'billto_lastname': lastName,
+        'billto_email': email,
+        'billto_telephone': '5550000000',
+        'billto_address': '1 Main St',
+        'billto_city': 'Austin',
+        'billto_state': 'TX',
+        'billto_zipcode': '78701',
+        'billto_country': 'US',
+        'shipto_address': '1 Main St',
+        'shipto_city': 'Austin',
+        'shipto_state': 'TX',
+        'shipto_county': 'Travis',
+        'shipto_zipcode': '78701',
+        'shipto_country': 'US',
+        'items': [{
+            'itemcode': 'A{0:05d}'.format(i + 1),
+            'quantity': 1,
+            'price': '9.99',
+            'taxcode': 'TX',
+            'linetotal': 9.99
+        } for i in range(lines)]
+    }
+
+
+def countRows(result):
+    if isinstance(result, list):
+        return sum(1 + len(row.get('items', [])) if isinstance(row, dict) else 1 for row in result)
+    return 1
+
+
+def sizeOf(value):
+    """Bytes held by value and the dicts, lists and tuples in it, by sys.getsizeof.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size = size + sum(sizeOf(k) + sizeOf(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size = size + sum(sizeOf(item) for item in value)
+    return size
+
+
+def readers(path):
+    """Reader calls as (name, callable(ext)) pairs.
+    """
+    cardCode = customers(path, 1)[0][0]
+    return [
+        ('getOrders', lambda ext, num: ext.getOrders(num=num)),
+        ('getShipments', lambda ext, num: ext.getShipments(num=num, columns=[])),
+        ('getDocuments.oInvoices', lambda ext, num: ext.getDocuments('oInvoices', num=num)),
+        ('getContacts', lambda ext, num: ext.getContacts(num=num, cardCode=cardCode)),
+        ('getMainCurrency', lambda ext, num: ext.getMainCurrency()),
+        ('getExpnsNames', lambda ext, num: ext.getExpnsNames()),
+        ('getTrnspNames', lambda ext, num: ext.getTrnspNames()),
+        ('getPayMethCods', lambda ext, num: ext.getPayMethCods()),
+        ('getTaxCodes', lambda ext, num: ext.getTaxCodes())
+    ]
+
+
+class Benchmark(object):
+    """Collects metrics as {name: {'value', 'unit', 'better'}}.
+    """
+    def __init__(self, path, repeat=5, rows=1000, orders=50):
+        self.path = path
+        self.repeat = repeat
+        self.rows = rows
+        self.orders = orders
+        self.metrics = {}
+
+    def record(self, name, value, unit, better):
+        self.metrics[name] = {'value': value, 'unit': unit, 'better': better}
+
+    def benchReaders(self):
+        app, ext = makeApp(self.path)
+        for name, call in readers(self.path):
+            rows, elapsed = 0, 0.0
+            for i in range(self.repeat):
+                with app.app_context():
+                    ext.cursorAdaptor
+                    start = time()
+                    rows = rows + countRows(call(ext, self.rows))
+                    elapsed = elapsed + time() - start
+            self.record('reader.{0}.rows_per_second'.format(name), rows / elapsed, 'rows/s', HIGHER)
+
+    def benchInsertOrder(self):
+        app, ext = makeApp(self.path)
+        contacts = customers(self.path, self.orders)
+        run = int(time() * 1000)
+        for lines in LINE_COUNTS:
+            orders = [orderPayload('BENCH-{0}-{1}-{2}'.format(run, lines, i), contacts[i % len(contacts)], lines)
+                      for i in range(self.orders)]
+            start = time()
+            for o in orders:
+                with app.app_context():
+                    ext.insertOrder(o)
+            elapsed = time() - start
+            self.record('insertOrder.{0}_lines.orders_per_second'.format(lines), len(orders) / elapsed,
+                        'orders/s', HIGHER)
+
+    def benchMemory(self):
+        app, ext = makeApp(self.path)
+        for name, num in (('getOrders', 10000), ('getShipments', 2000)):
+            with app.app_context():
+                result = getattr(ext, name)(num=num)
+            rows = countRows(result)
+            if rows:
+                self.record('memory.{0}.bytes_per_10k_rows'.format(name), sizeOf(result) * 10000.0 / rows, 'bytes',
+                            LOWER)
+
+    def benchConnect(self):
+        app, ext = makeApp(self.path)
+        for type in ('COM', 'CURSOR'):
+            elapsed = 0.0
+            for i in range(self.repeat):
+                with app.app_context():
+                    start = time()
+                    adaptor = ext.connect(type)
+                    elapsed = elapsed + time() - start
+                    adaptor.disconnect()
+            self.record('connect.{0}.seconds'.format(type), elapsed / self.repeat, 's', LOWER)
+
+    def benchCaches(self):
+        index = os.path.join(tempfile.mkdtemp(), 'orderindex.db')
+        app, ext = makeApp(self.path, ORDERINDEX=index, BPCACHE=60, ITEMCACHE=60)
+        contacts = customers(self.path, self.orders)
+        with app.app_context():
+            orders = ext.getOrders(num=self.orders, columns=['NumAtCard'])
+        for i in range(2):
+            with app.app_context():
+                for order in orders:
+                    ext.getOrderId({'fe_order_id': order['NumAtCard']})
+                for contact in contacts:
+                    ext.getCardCodeByEmail(contact[3])
+                try:
+                    ext.validateOrderLines(orderPayload('', contacts[0], 10)['items'], contacts[0][0])
+                except InvalidOrderError:
+                    pass
+        self.recordCacheHits(ext)
+
+    def recordCacheHits(self, ext):
+        counts = {}
+        for name, labels, value in ext.metrics.counter('sapb1_cache_requests_total').samples():
+            labels = dict(labels)
+            cache = counts.setdefault(labels['cache'], {'hit': 0, 'miss': 0})
+            cache[labels['result']] = cache.get(labels['result'], 0) + value
+        for cache, results in counts.items():
+            total = results['hit'] + results['miss']
+            if total:
+                self.record('cache.{0}.hit_rate'.format(cache), float(results['hit']) / total, 'ratio', HIGHER)
+
+    def run(self):
+        self.benchConnect()
+        self.benchReaders()
+        self.benchMemory()
+        self.benchInsertOrder()
+        self.benchCaches()
+        return {
+            'created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'python': platform.python_version(),
+            'database': self.path,
+            'repeat': self.repeat,
+            'latency': dict(SAPbobsCOMFake.LATENCY),
+            'metrics': self.metrics
+        }
+
+
+def compare(results, baseline, threshold):
+    """Metrics worse than in baseline by more than threshold (a fraction),
+    as (name, baseline value, value, relative change).
+    """
+    regressions = []
+    for name, metric in sorted(results['metrics'].items()):
+        base = baseline['metrics'].get(name)
+        if base is None or not base['value']:
+            continue
+        change = (metric['value'] - base['value']) / float(base['value'])
+        if (metric['better'] == HIGHER and change < -threshold) or (metric['better'] == LOWER and change > threshold):
+            regressions.append((name, base['value'], metric['value'], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Flask-SAPB1 against the local stand-ins.")
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'sapb1-benchmark.db'),
+                        help="SQLite company database, generated if missing")
+    parser.add_argument('--generate', type=int, default=100000, help="orders to generate in a new database")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=1000, help="rows requested per reader call")
+    parser.add_argument('--orders', type=int, default=50, help="orders inserted per line count")
+    parser.add_argument('--com-latency', type=float, default=0.0, help="seconds injected per fake COM call")
+    parser.add_argument('--output', help="write the results as JSON")
+    parser.add_argument('--compare', help="baseline results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="tolerated relative regression")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        mssqlfake.generate(args.database, orders=args.generate)
+    SAPbobsCOMFake.setLatency(call=args.com_latency, property=args.com_latency)
+    results = Benchmark(args.database, repeat=args.repeat, rows=args.rows, orders=args.orders).run()
+
+    for name, metric in sorted(results['metrics'].items()):
+        print("{0:55} {1:>14.4f} {2}".format(name, metric['value'], metric['unit']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, base, value, change in regressions:
+            print("REGRESSION {0}: {1:.4f} -> {2:.4f} ({3:+.1%})".format(name, base, value, change))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import threading
+from contextlib import contextmanager
+from time import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of connecting while a circuit breaker is open.
+    """
+    pass
+
+
+class CircuitBreaker(object):
+    """Circuit breaker around a connection attempt.
+
+    After threshold consecutive failures the breaker opens and every call
+    fails fast with CircuitOpenError for cooldown seconds. The first call
+    after the cool-down is let through as a half-open probe; its success
+    closes the breaker and its failure opens it again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, threshold=5, cooldown=30.0):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._openedAt = None
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time() - self._openedAt >= self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def _before(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.OPEN and time() - self._openedAt >= self.cooldown:
+                self._state = self.HALF_OPEN
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected = self.rejected + 1
+            raise CircuitOpenError("Circuit {0} is open after {1} consecutive failures.".format(self.name, self._failures))
+
+    def _success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def _failure(self):
+        with self._lock:
+            self._failures = self._failures + 1
+            if self._state == self.HALF_OPEN or self._failures >= self.threshold:
+                if self._state != self.OPEN:
+                    self.trips = self.trips + 1
+                self._state = self.OPEN
+                self._openedAt = time()
+            self._probing = False
+
+    @contextmanager
+    def guard(self):
+        """Run the block unless the breaker is open and record its outcome.
+        """
+        self._before()
+        try:
+            yield
+        except Exception:
+            self._failure()
+            raise
+        self._success()
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self._failures,
+            'trips': self.trips,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,106 @@
+import datetime
+import decimal
+import threading
+import types
+from time import time
+
+try:
+    PRIMITIVES = (int, long, float, bool, basestring, decimal.Decimal, datetime.date, type(None))
+except NameError:
+    PRIMITIVES = (int, float, bool, str, bytes, decimal.Decimal, datetime.date, type(None))
+
+METHODS = (types.MethodType, types.BuiltinMethodType, types.FunctionType)
+
+
+class COMProfile(object):
+    """Call count and wall time per (interface, member) of DI API objects.
+
+    Members are recorded as 'Name' for property gets, 'Name=' for property
+    puts and 'Name()' for method calls.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def record(self, interface, member, elapsed):
+        key = (interface, member)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [1, elapsed]
+            else:
+                entry[0] = entry[0] + 1
+                entry[1] = entry[1] + elapsed
+
+    def merge(self, other):
+        """Add the entries of another profile to this one.
+        """
+        for (interface, member), (count, total) in other._snapshot():
+            key = (interface, member)
+            with self._lock:
+                entry = self._entries.setdefault(key, [0, 0.0])
+                entry[0] = entry[0] + count
+                entry[1] = entry[1] + total
+
+    def _snapshot(self):
+        with self._lock:
+            return [(key, list(entry)) for key, entry in self._entries.items()]
+
+    def stats(self):
+        """Entries sorted by total wall time, slowest first.
+        """
+        entries = [{
+            'interface': interface,
+            'member': member,
+            'count': count,
+            'total': total
+        } for (interface, member), (count, total) in self._snapshot()]
+        return sorted(entries, key=lambda entry: entry['total'], reverse=True)
+
+    def total(self):
+        return sum(total for key, (count, total) in self._snapshot())
+
+
+class ProfiledObject(object):
+    """Transparent proxy recording every property get/put and method call
+    of a DI API object into a COMProfile.
+
+    Non-primitive values returned by the object (e.g. order.Lines) are
+    wrapped as well, with the interface name extended by the member name.
+    """
+    def __init__(self, obj, interface, profile):
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_interface', interface)
+        object.__setattr__(self, '_profile', profile)
+
+    def _wrap(self, value, member):
+        if isinstance(value, PRIMITIVES) or isinstance(value, ProfiledObject):
+            return value
+        return ProfiledObject(value, self._interface + '.' + member, self._profile)
+
+    def __getattr__(self, name):
+        start = time()
+        value = getattr(self._obj, name)
+        elapsed = time() - start
+        if isinstance(value, METHODS):
+            return self._method(name, value, elapsed)
+        self._profile.record(self._interface, name, elapsed)
+        return self._wrap(value, name)
+
+    def __setattr__(self, name, value):
+        start = time()
+        setattr(self._obj, name, value)
+        self._profile.record(self._interface, name + '=', time() - start)
+
+    def _method(self, name, method, lookup):
+        def call(*args, **kwargs):
+            start = time()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                self._profile.record(self._interface, name + '()', lookup + time() - start)
+            return self._wrap(result, name + '()')
+        return call
+
+    def __repr__(self):
+        return '<ProfiledObject {0} {1!r}>'.format(self._interface, self._obj)
@@ -0,0 +1,107 @@
+import threading
+import traceback
+import weakref
+from time import time
+
+
+class ConnectionTracker(object):
+    """Registry of every open Company/SQL connection with its creation
+    stack, age, thread and owning context, used to find and reap leaks.
+
+    Connections are only ever disconnected by the thread that opened them:
+    DI API Company objects are apartment-threaded COM objects and a SQL
+    connection may be reading rows in its thread.  reap() therefore only
+    queues orphaned connections; their thread disconnects them with
+    disconnectQueued().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def register(self, adaptor, type, owner=None):
+        """Track an open connection adaptor created by the given context.
+        """
+        entry = {
+            'id': id(adaptor),
+            'type': type,
+            'created': time(),
+            'thread': threading.current_thread().name,
+            'threadId': threading.current_thread().ident,
+            'owner': None if owner is None else "{0}@{1:x}".format(owner.__class__.__name__, id(owner)),
+            'stack': ''.join(traceback.format_stack()[0:-2]),
+            'adaptor': weakref.ref(adaptor),
+            'context': None if owner is None else weakref.ref(owner),
+            'queued': False
+        }
+        with self._lock:
+            self._entries[id(adaptor)] = entry
+
+    def unregister(self, adaptor):
+        with self._lock:
+            self._entries.pop(id(adaptor), None)
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    def counts(self):
+        """Number of open connections by type.
+        """
+        counts = {}
+        for entry in self._snapshot():
+            counts[entry['type']] = counts.get(entry['type'], 0) + 1
+        return counts
+
+    def _describe(self, entry, now):
+        return {
+            'id': entry['id'],
+            'type': entry['type'],
+            'age': now - entry['created'],
+            'thread': entry['thread'],
+            'owner': entry['owner'],
+            'orphaned': entry['context'] is None or entry['context']() is None,
+            'queued': entry['queued'],
+            'stack': entry['stack']
+        }
+
+    def report(self):
+        """Open connections, oldest first, with age and whether their owning context is still alive.
+        """
+        now = time()
+        report = [self._describe(entry, now) for entry in self._snapshot()]
+        return sorted(report, key=lambda entry: entry['age'], reverse=True)
+
+    def reap(self, maxAge):
+        """Queue orphaned connections older than maxAge seconds for disconnection
+        by their own thread and return the report entries of the newly queued ones.
+        """
+        now = time()
+        queued = []
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['queued']:
+                    continue
+                description = self._describe(entry, now)
+                if description['orphaned'] and description['age'] >= maxAge:
+                    entry['queued'] = True
+                    queued.append(description)
+        return queued
+
+    def disconnectQueued(self):
+        """Disconnect the queued connections opened by the calling thread and
+        return their report entries.
+        """
+        now = time()
+        ident = threading.current_thread().ident
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry['queued'] and entry['threadId'] == ident]
+            for entry in entries:
+                self._entries.pop(entry['id'], None)
+        disconnected = []
+        for entry in entries:
+            adaptor = entry['adaptor']()
+            if adaptor is None:
+                continue
+            adaptor.disconnect()
+            disconnected.append(self._describe(entry, now))
+        return disconnected
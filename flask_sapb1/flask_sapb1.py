@@ -1,8 +1,30 @@
-from flask import current_app, g
-import pymssql
+from flask import current_app, g, has_app_context, Response
+import copy
 import datetime
 from time import time
 import decimal
+import functools
+import importlib
+import json
+import os
+import random
+import threading
+from contextlib import contextmanager
+from .breaker import CircuitBreaker
+from .comprofile import COMProfile, ProfiledObject
+from .connections import ConnectionTracker
+from .metrics import MetricsRegistry
+from .orderindex import OrderIndex
+from .pricing import PriceSnapshot
+from .recorder import Recorder
+from .replica import DEFAULT_TABLES, Error as ReplicaError, Replica
+from .sampler import StackSampler
+from .snapshots import BusinessPartnerSnapshot, InvalidOrderError, ItemSnapshot
+from .slowlog import DEFAULT_REDACT, dumps, redact
+from .sqlstats import InstrumentedCursor, sql_executed
+from .throttle import Limiter, PriorityScheduler
+from .tracing import Trace, exportOTLP
+from .ttlcache import TTLCache
 
 try:
     from flask import _app_ctx_stack as stack
@@ -10,15 +32,115 @@ except ImportError:
     from flask import _request_ctx_stack as stack
 
 
+def importDIAPI(name):
+    """Import a DI API module shipped with the package (SAPbobsCOM67, SAPbobsCOMFake, ...)
+    or else a top-level one on sys.path, like the makepy modules SAPbobsCOM88/89/90.
+    """
+    try:
+        return importlib.import_module('.' + name, __name__.rpartition('.')[0])
+    except ImportError as e:
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            raise e
+
+
+def operation(func):
+    """Record latency and errors of an SAPB1Adaptor method in the metrics registry.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time()
+        result = None
+        error = False
+        sampler = self._startSampler(func.__name__)
+        depth = getattr(self._local, 'depth', 0)
+        recorded = None
+        if depth == 0 and func.__name__ not in self.UNRECORDED and self.recorder is not None:
+            # Copied before the call, which may change its arguments (insertOrder trims addresses).
+            recorded = copy.deepcopy((args, kwargs))
+        self._local.depth = depth + 1
+        try:
+            with self.span(func.__name__):
+                result = func(self, *args, **kwargs)
+            return result
+        except Exception:
+            error = True
+            self.metrics.counter('sapb1_operation_errors_total').inc(method=func.__name__)
+            raise
+        finally:
+            self._local.depth = depth
+            if sampler is not None:
+                self._stopSampler(sampler, func.__name__)
+            elapsed = time() - start
+            self.metrics.histogram('sapb1_operation_seconds').observe(elapsed, method=func.__name__)
+            self._logSlowOperation(func.__name__, elapsed, args, kwargs, result)
+            if recorded is not None:
+                self._recordOperation(func.__name__, recorded[0], recorded[1], start, elapsed, error)
+    return wrapper
+
+
+def replicable(func):
+    """Serve an SAPB1Adaptor read method from the REPLICA when replica reads are on,
+    falling back to SQL Server when the replica cannot answer.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._local, 'replicaReads', False) or not self.useReplica():
+            return func(self, *args, **kwargs)
+        self._local.replicaReads = True
+        try:
+            result = func(self, *args, **kwargs)
+        except ReplicaError as e:
+            self.metrics.counter('sapb1_replica_reads_total').inc(method=func.__name__, result='fallback')
+            log = "Replica read {0} failed, reading SQL Server: {1}".format(func.__name__, e)
+            current_app.logger.warning(log)
+        else:
+            self.metrics.counter('sapb1_replica_reads_total').inc(method=func.__name__, result='replica')
+            return result
+        finally:
+            self._local.replicaReads = False
+        return func(self, *args, **kwargs)
+    return wrapper
+
+
+def primary(func):
+    """Run an SAPB1Adaptor method, and every read it makes, on SQL Server whatever
+    REPLICAREADS says: writes and duplicate checks must not see a stale replica.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        reads = getattr(self._local, 'replicaReads', False)
+        self._local.replicaReads = False
+        try:
+            with self.fromReplica(False):
+                return func(self, *args, **kwargs)
+        finally:
+            self._local.replicaReads = reads
+    return wrapper
+
+
+def scheduled(func):
+    """Run an SAPB1Adaptor method within a DI session slot granted by the scheduler.
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.scheduler.slot(self.priority):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class SAPB1COMAdaptor(object):
     """Adaptor contains SAP B1 COM object.
     """
-    def __init__(self, company=None):
+    def __init__(self, company=None, tracker=None):
         self._company = company
+        self._tracker = tracker
+        self._closed = False
 
     def __del__(self):
-        if self._company:
-            self._company.Disconnect()
+        if self._company and not getattr(self, '_closed', True):
+            self._close()
 
     @property
     def company(self):
@@ -26,8 +148,16 @@ class SAPB1COMAdaptor(object):
         """
         return self._company
 
-    def disconnect(self):
+    def _close(self):
+        self._closed = True
+        if self._tracker is not None:
+            self._tracker.unregister(self)
         self._company.Disconnect()
+
+    def disconnect(self):
+        if self._closed:
+            return
+        self._close()
         log = "Close SAPB1 connection for " + self._company.CompanyName
         current_app.logger.info(log)
 
@@ -36,21 +166,91 @@ class SAPB1COMAdaptor(object):
 class MSSQLCursorAdaptor(object):
     """MS SQL cursor object.
     """
-    def __init__(self, sqlSrvConn=None):
+
+    # SET TRANSACTION ISOLATION LEVEL argument by isolation setting.  NOLOCK is
+    # READ UNCOMMITTED for every table read; READ COMMITTED SNAPSHOT is READ
+    # COMMITTED, read from row versions when the database has
+    # READ_COMMITTED_SNAPSHOT ON; SNAPSHOT needs ALLOW_SNAPSHOT_ISOLATION ON.
+    ISOLATIONLEVELS = {
+        'READ UNCOMMITTED': 'READ UNCOMMITTED',
+        'NOLOCK': 'READ UNCOMMITTED',
+        'READ COMMITTED': 'READ COMMITTED',
+        'READ COMMITTED SNAPSHOT': 'READ COMMITTED',
+        'SNAPSHOT': 'SNAPSHOT',
+        'REPEATABLE READ': 'REPEATABLE READ',
+        'SERIALIZABLE': 'SERIALIZABLE'
+    }
+
+    def __init__(self, sqlSrvConn=None, limiter=None, emit=None, begin=None, tracker=None):
         self._sqlSrvConn = sqlSrvConn
-        self._sqlSrvCursor = self._sqlSrvConn.cursor(as_dict=True)
+        self._sqlSrvCursor = InstrumentedCursor(self._sqlSrvConn.cursor(as_dict=True), emit=emit, begin=begin)
+        self._limiter = limiter
+        self._tracker = tracker
+        self._closed = False
+        self._isolation = None
 
     def __del__(self):
-        self._sqlSrvConn.close()
+        if not getattr(self, '_closed', True):
+            self._close()
 
     @property
     def sqlSrvCursor(self):
-        """MS SQL Server cursor object.
+        """MS SQL Server cursor object, instrumented per statement.
         """
         return self._sqlSrvCursor
 
-    def disconnect(self):
+    def execute(self, sql, params=None):
+        """Execute a statement on the cursor within the 'sql' budget of the limiter,
+        holding its slot until the rows of the statement have been read.
+        """
+        # Complete the previous statement first, so that its slot is free again.
+        self._sqlSrvCursor.finish()
+        release = None if self._limiter is None else self._limiter.hold('sql')
+        return self._sqlSrvCursor.execute(sql, params, release=release)
+
+    @property
+    def isolationLevel(self):
+        """Isolation setting of the connection, None for the server default (READ COMMITTED).
+        """
+        return self._isolation
+
+    def setIsolation(self, level):
+        """Set the isolation level of the connection by a name of ISOLATIONLEVELS, None
+        for READ COMMITTED, ending the open read transaction first. Return the previous setting.
+        """
+        previous = self._isolation
+        statement = self.ISOLATIONLEVELS.get((level or 'READ COMMITTED').upper())
+        if statement is None:
+            raise ValueError("Unknown isolation level: {0}".format(level))
+        if statement != self.ISOLATIONLEVELS[(previous or 'READ COMMITTED').upper()]:
+            self._sqlSrvCursor.finish()
+            self._sqlSrvConn.commit()
+            self.execute("SET TRANSACTION ISOLATION LEVEL " + statement)
+        self._isolation = level
+        return previous
+
+    @contextmanager
+    def isolation(self, level):
+        """Run the statements of the block at the isolation level, then restore the previous one.
+        """
+        previous = self.setIsolation(level)
+        try:
+            yield self
+        finally:
+            self.setIsolation(previous)
+
+    def _close(self):
+        self._closed = True
+        if self._tracker is not None:
+            self._tracker.unregister(self)
+        self._sqlSrvCursor.release()
         self._sqlSrvConn.close()
+
+    def disconnect(self):
+        if self._closed:
+            return
+        self._sqlSrvCursor.finish()
+        self._close()
         log = "Close SAPB1 DB connection"
         current_app.logger.info(log)
 
@@ -60,8 +260,98 @@ class SAPB1Adaptor(object):
     """SAP B1 Adaptor with functions.
     """
 
+    # Business object type written by each COM operation, for the slow-operation log.
+    COMOPERATIONS = {
+        'insertOrder': 'oOrders',
+        'cancelOrder': 'oOrders',
+        'insertContact': 'oBusinessPartners'
+    }
+
+    # Adaptor methods left out of the RECORD log: maintenance calls, not application traffic.
+    UNRECORDED = ('pullReplica',)
+
+    # Header and line tables of the marketing documents by business object type.
+    DOCUMENTTYPES = {
+        'oQuotations': ('OQUT', 'QUT1'),
+        'oOrders': ('ORDR', 'RDR1'),
+        'oDeliveryNotes': ('ODLN', 'DLN1'),
+        'oReturns': ('ORDN', 'RDN1'),
+        'oInvoices': ('OINV', 'INV1'),
+        'oCreditNotes': ('ORIN', 'RIN1'),
+        'oDownPayments': ('ODPI', 'DPI1'),
+        'oPurchaseOrders': ('OPOR', 'POR1'),
+        'oPurchaseDeliveryNotes': ('OPDN', 'PDN1'),
+        'oPurchaseReturns': ('ORPD', 'RPD1'),
+        'oPurchaseInvoices': ('OPCH', 'PCH1'),
+        'oPurchaseCreditNotes': ('ORPC', 'RPC1'),
+        'oPurchaseDownPayments': ('ODPO', 'DPO1')
+    }
+
+    # BoObjectTypes values of the marketing documents, as stored in ObjType and BaseType.
+    OBJECTTYPES = {
+        'oQuotations': 23,
+        'oOrders': 17,
+        'oDeliveryNotes': 15,
+        'oReturns': 16,
+        'oInvoices': 13,
+        'oCreditNotes': 14,
+        'oDownPayments': 203,
+        'oPurchaseOrders': 22,
+        'oPurchaseDeliveryNotes': 20,
+        'oPurchaseReturns': 21,
+        'oPurchaseInvoices': 18,
+        'oPurchaseCreditNotes': 19,
+        'oPurchaseDownPayments': 204
+    }
+
+    # OCRD and OCPR columns kept by the business partner snapshot.
+    BPCOLUMNS = ['CardCode', 'CardName', 'CardFName', 'CardType', 'E_Mail', 'Phone1', 'CntctPrsn', 'ListNum',
+                 'validFor', 'frozenFor', 'UpdateDate']
+    BPCONTACTCOLUMNS = ['CntctCode', 'CardCode', 'Name', 'E_MailL', 'UpdateDate']
+
+    # OITM and ITM1 columns kept by the item snapshot.
+    ITEMCOLUMNS = ['ItemCode', 'ItemName', 'SellItem', 'InvntItem', 'validFor', 'frozenFor', 'SalUnitMsr',
+                   'UpdateDate']
+    ITEMPRICECOLUMNS = ['ItemCode', 'PriceList', 'Price', 'Currency']
+
+    # Tables and columns loaded by the price snapshot.
+    PRICECOLUMNS = [
+        ('OCRD', ['CardCode', 'ListNum', 'GroupCode', 'DiscRel'], "CardType = 'C'"),
+        ('OITM', ['ItemCode', 'ItmsGrpCod', 'FirmCode'], None),
+        ('ITM1', ['ItemCode', 'PriceList', 'Price', 'Currency'], None),
+        ('OSPP', ['CardCode', 'ItemCode', 'Price', 'Currency', 'Discount', 'ListNum', 'AutoUpdt', 'Valid',
+                  'ValidFrom', 'ValidTo'], None),
+        ('SPP1', ['CardCode', 'ItemCode', 'LINENUM', 'Price', 'Currency', 'Discount', 'FromDate', 'ToDate'], None),
+        ('SPP2', ['CardCode', 'ItemCode', 'SPP1LNum', 'Amount', 'Price', 'Currency', 'Discount'], None),
+        ('OEDG', ['AbsEntry', 'Type', 'ObjCode', 'ValidFrom', 'ValidTo'], "ValidFor = 'Y'"),
+        ('EDG1', ['AbsEntry', 'ObjType', 'ObjKey', 'Discount'], "DiscType = 'D'")
+    ]
+
+    # DocEntry values per IN list, below the 2100 parameters SQL Server accepts.
+    INCHUNKSIZE = 1000
+
     def __init__(self, app=None):
         self.app = app
+        self._orderIndex = None
+        self._bpSnapshot = None
+        self._itemSnapshot = None
+        self._inventoryCache = None
+        self._priceSnapshot = None
+        self._replica = None
+        self._limiter = None
+        self._scheduler = None
+        self._breakers = {}
+        self._recorder = None
+        self.comProfileTotal = COMProfile()
+        self.connections = ConnectionTracker()
+        self.sqlSinks = []
+        self.metrics = MetricsRegistry()
+        self._registerMetrics()
+        self.addSQLSink(self._measureStatement)
+        self.addSQLSink(self._logSlowStatement)
+        self.addSQLSink(self._traceStatement)
+        self._local = threading.local()
+        self._lock = threading.Lock()
         if app is not None:
             self.init_app(app)
 
@@ -69,16 +359,265 @@ class SAPB1Adaptor(object):
         """Use the newstyle teardown_appcontext if it's available,
         otherwise fall back to the request context
         """
+        app.config.setdefault('DBDRIVER', 'pymssql')
+        app.config.setdefault('ORDERINDEX', None)
+        app.config.setdefault('DILIMITS', {})
+        app.config.setdefault('DISESSIONS', None)
+        app.config.setdefault('BREAKERTHRESHOLD', 5)
+        app.config.setdefault('BREAKERCOOLDOWN', 30)
+        app.config.setdefault('COMPROFILE', False)
+        app.config.setdefault('METRICSROUTE', None)
+        app.config.setdefault('SLOWOPTHRESHOLD', None)
+        app.config.setdefault('SLOWOPREDACT', DEFAULT_REDACT)
+        app.config.setdefault('TRACE', None)
+        app.config.setdefault('TRACEENDPOINT', 'http://localhost:4318/v1/traces')
+        app.config.setdefault('PROFILEDIR', None)
+        app.config.setdefault('PROFILESAMPLERATE', 0.0)
+        app.config.setdefault('PROFILEINTERVAL', 0.005)
+        app.config.setdefault('PROFILEOPERATIONS', ['insertOrder'])
+        app.config.setdefault('CONNECTIONMAXAGE', None)
+        app.config.setdefault('CONNECTIONREAPINTERVAL', 60)
+        app.config.setdefault('RECORD', None)
+        app.config.setdefault('RECORDREDACT', DEFAULT_REDACT)
+        app.config.setdefault('BPCACHE', None)
+        app.config.setdefault('ITEMCACHE', None)
+        app.config.setdefault('INVENTORYTTL', 5)
+        app.config.setdefault('PRICECACHE', 300)
+        app.config.setdefault('REPLICA', None)
+        app.config.setdefault('REPLICATABLES', DEFAULT_TABLES)
+        app.config.setdefault('REPLICAINTERVAL', 60)
+        app.config.setdefault('REPLICARECONCILE', 3600)
+        app.config.setdefault('REPLICAREADS', False)
+        app.config.setdefault('ISOLATIONLEVEL', None)
         if hasattr(app, 'teardown_appcontext'):
             app.teardown_appcontext(self.teardown)
         else:
             app.teardown_request(self.teardown)
+        if app.config['METRICSROUTE']:
+            app.add_url_rule(app.config['METRICSROUTE'], 'sapb1_metrics', self.metricsView)
+        if app.config['CONNECTIONMAXAGE']:
+            self._startReaper(app)
+        if app.config['REPLICA'] and app.config['REPLICAINTERVAL']:
+            self._startReplicator(app)
+
+    def _startReaper(self, app):
+        """Queue orphaned connections for disconnection every CONNECTIONREAPINTERVAL seconds in a daemon thread.
+        """
+        interval = app.config['CONNECTIONREAPINTERVAL']
+        wakeup = threading.Event()
+
+        def reap():
+            while not wakeup.wait(interval):
+                with app.app_context():
+                    try:
+                        self.reapConnections()
+                    except Exception as e:
+                        log = "Reaping SAPB1 connections failed: " + str(e)
+                        app.logger.exception(log)
+        thread = threading.Thread(target=reap, name='sapb1-connection-reaper')
+        thread.daemon = True
+        thread.start()
+
+    def _startReplicator(self, app):
+        """Pull the REPLICA tables now and every REPLICAINTERVAL seconds in a daemon thread.
+        """
+        interval = app.config['REPLICAINTERVAL']
+        wakeup = threading.Event()
+
+        def replicate():
+            while True:
+                with app.app_context():
+                    try:
+                        self.pullReplica()
+                    except Exception as e:
+                        log = "Pulling the SAPB1 replica failed: " + str(e)
+                        app.logger.exception(log)
+                if wakeup.wait(interval):
+                    return
+        thread = threading.Thread(target=replicate, name='sapb1-replicator')
+        thread.daemon = True
+        thread.start()
+
+    def _registerMetrics(self):
+        """Declare the metrics of the extension with their help texts.
+        """
+        self.metrics.counter('sapb1_operation_errors_total', 'Failed adaptor method calls by method.')
+        self.metrics.histogram('sapb1_operation_seconds', 'Adaptor method latency by method.')
+        self.metrics.histogram('sapb1_connect_seconds', 'Connect duration by connection type.')
+        self.metrics.counter('sapb1_connect_errors_total', 'Failed connects by connection type.')
+        self.metrics.gauge('sapb1_connections_open', 'Open connections by connection type.',
+                           callback=lambda: [({'type': type}, count)
+                                             for type, count in self.connections.counts().items()])
+        self.metrics.counter('sapb1_cache_requests_total', 'Cache lookups by cache and result (hit or miss).')
+        self.metrics.counter('sapb1_order_lines_rejected_total', 'Order lines rejected before any COM call by reason.')
+        self.metrics.counter('sapb1_replica_reads_total', 'Reads served by the replica or fallen back by method.')
+        self.metrics.gauge('sapb1_replica_lag_seconds', 'Seconds since the last replica pull by table.',
+                           callback=lambda: [({'table': table}, lag) for table, lag in self._replica.lag().items()
+                                             if lag is not None] if self._replica else [])
+        self.metrics.histogram('sapb1_sql_seconds', 'SQL statement latency including fetch.')
+        self.metrics.counter('sapb1_sql_rows_total', 'Rows fetched by SQL statements.')
+        self.metrics.counter('sapb1_sql_bytes_total', 'Approximate bytes fetched by SQL statements.')
+        self.metrics.gauge('sapb1_sessions_busy', 'DI session slots in use.',
+                           callback=lambda: self._scheduler.stats()['busy'] if self._scheduler else 0)
+        self.metrics.gauge('sapb1_sessions_queued', 'Requests waiting for a DI session slot by priority.',
+                           callback=lambda: self._schedulerSamples('queued'))
+        self.metrics.gauge('sapb1_sessions_wait_seconds_total', 'Total wait for a DI session slot by priority.',
+                           callback=lambda: self._schedulerSamples('wait_total'))
+        self.metrics.gauge('sapb1_limiter_queued', 'Calls waiting for admission by operation type.',
+                           callback=lambda: self._limiterSamples('queued'))
+        self.metrics.gauge('sapb1_limiter_wait_seconds_total', 'Total admission wait by operation type.',
+                           callback=lambda: self._limiterSamples('wait_total'))
+        self.metrics.gauge('sapb1_breaker_open', 'Whether the circuit breaker is open by connection type.',
+                           callback=lambda: [({'type': type}, int(breaker.state == breaker.OPEN))
+                                             for type, breaker in self._breakers.items()])
+
+    def _schedulerSamples(self, key):
+        if self._scheduler is None:
+            return []
+        stats = self._scheduler.stats()
+        return [({'priority': priority}, stats[priority][key]) for priority in PriorityScheduler.PRIORITIES]
+
+    def _limiterSamples(self, key):
+        if self._limiter is None:
+            return []
+        return [({'op': opType}, stats[key]) for opType, stats in self._limiter.stats().items()]
+
+    def _measureStatement(self, record):
+        self.metrics.histogram('sapb1_sql_seconds').observe(record['elapsed'])
+        self.metrics.counter('sapb1_sql_rows_total').inc(record['rows'])
+        self.metrics.counter('sapb1_sql_bytes_total').inc(record['bytes'])
+
+    def _logSlowStatement(self, record):
+        """Log the statement text and redacted parameters of a statement slower than SLOWOPTHRESHOLD.
+        """
+        if not has_app_context():
+            return
+        threshold = current_app.config.get('SLOWOPTHRESHOLD')
+        if threshold is None or record['elapsed'] < threshold:
+            return
+        params = redact(record['params'], current_app.config.get('SLOWOPREDACT', DEFAULT_REDACT))
+        log = "Slow statement {0} took {1:.3f}s, {2} rows, {3} bytes: {4} params: {5}".format(
+            record['fingerprint'], record['elapsed'], record['rows'], record['bytes'], record['sql'], dumps(params))
+        current_app.logger.warning(log)
+
+    def _currentSpan(self):
+        trace = self.trace
+        return trace.current if trace is not None else None
+
+    def _traceStatement(self, record):
+        """Add a completed SQL statement to the trace under the span active at execute time.
+        """
+        if not has_app_context():
+            return
+        trace = self.trace
+        if trace is None:
+            return
+        trace.add('sql', record['started'], record['elapsed'], parent=record['context'],
+                  fingerprint=record['fingerprint'], statement=record['statement'], rows=record['rows'])
+
+    def _exportTrace(self, trace):
+        """Export the trace of a context as JSON to the log or to an OTLP/HTTP collector.
+        """
+        if current_app.config.get('TRACE') == 'otlp':
+            endpoint = current_app.config['TRACEENDPOINT']
+            logger = current_app.logger
+
+            def post():
+                try:
+                    exportOTLP(trace, endpoint)
+                except Exception as e:
+                    logger.warning("Trace export to " + endpoint + " failed: " + str(e))
+            thread = threading.Thread(target=post)
+            thread.daemon = True
+            thread.start()
+        else:
+            log = "SAPB1 trace: " + json.dumps(trace.toDict(), default=str)
+            current_app.logger.info(log)
+
+    def _startSampler(self, name):
+        """Start a stack sampler for a PROFILESAMPLERATE fraction of the PROFILEOPERATIONS calls.
+        """
+        config = current_app.config
+        if not config.get('PROFILEDIR') or name not in config.get('PROFILEOPERATIONS', []):
+            return None
+        if getattr(self._local, 'sampler', None) is not None:
+            return None
+        if random.random() >= config.get('PROFILESAMPLERATE', 0.0):
+            return None
+        sampler = StackSampler(threading.current_thread().ident, interval=config.get('PROFILEINTERVAL', 0.005))
+        sampler.start()
+        self._local.sampler = sampler
+        return sampler
+
+    def _stopSampler(self, sampler, name):
+        """Stop a stack sampler and write its collapsed stacks to PROFILEDIR.
+        """
+        sampler.stop()
+        self._local.sampler = None
+        path = os.path.join(current_app.config['PROFILEDIR'], "{0}-{1}-{2}.collapsed".format(
+            name, datetime.datetime.now().strftime("%Y%m%d%H%M%S%f"), os.getpid()))
+        try:
+            sampler.write(path)
+        except (IOError, OSError) as e:
+            log = "Writing profile " + path + " failed: " + str(e)
+            current_app.logger.warning(log)
+            return
+        log = "Wrote profile {0} with {1} samples".format(path, sampler.samples)
+        current_app.logger.info(log)
+
+    def _logSlowOperation(self, name, elapsed, args, kwargs, result):
+        """Log the redacted arguments of an operation slower than SLOWOPTHRESHOLD,
+        with the business object type and line count for COM operations.
+        """
+        threshold = current_app.config.get('SLOWOPTHRESHOLD')
+        if threshold is None or elapsed < threshold:
+            return
+        patterns = current_app.config.get('SLOWOPREDACT', DEFAULT_REDACT)
+        detail = {'args': redact(list(args), patterns), 'kwargs': redact(kwargs, patterns)}
+        if isinstance(result, list):
+            detail['rows'] = len(result)
+        if name in self.COMOPERATIONS:
+            detail['objType'] = self.COMOPERATIONS[name]
+            if args and isinstance(args[0], dict) and 'items' in args[0]:
+                detail['lines'] = len(args[0]['items'])
+        log = "Slow operation {0} took {1:.3f}s: {2}".format(name, elapsed, dumps(detail))
+        current_app.logger.warning(log)
+
+    def _recordOperation(self, name, args, kwargs, started, elapsed, error):
+        """Append an outermost adaptor method call to the RECORD log.
+        """
+        recorder = self.recorder
+        if recorder is None:
+            return
+        try:
+            recorder.record(name, args, kwargs, started, elapsed, error)
+        except (IOError, OSError, TypeError, ValueError) as e:
+            log = "Recording " + name + " failed: " + str(e)
+            current_app.logger.warning(log)
+
+    def metricsView(self):
+        """Render the metrics registry in the Prometheus text format.
+        """
+        return Response(self.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
     def connect(self, type=None):
         """Initiate the connect with SAP B1 and MS SQL server.
         """
+        self._disconnectQueued()
+        start = time()
+        try:
+            adaptor = self._connect(type)
+        except Exception:
+            self.metrics.counter('sapb1_connect_errors_total').inc(type=type)
+            raise
+        if adaptor is not None:
+            self.metrics.histogram('sapb1_connect_seconds').observe(time() - start, type=type)
+            self.connections.register(adaptor, type, owner=stack.top)
+        return adaptor
+
+    def _connect(self, type):
         if type == "COM":
-            SAPbobsCOM = __import__(current_app.config['DIAPI'], globals(), locals(), [], -1)
+            SAPbobsCOM = importDIAPI(current_app.config['DIAPI'])
             self.constants = getattr(SAPbobsCOM, "constants")
             Company = getattr(SAPbobsCOM, "Company")
             company = Company()
@@ -89,27 +628,109 @@ class SAPB1Adaptor(object):
             company.CompanyDB = current_app.config['COMPANYDB']
             company.UserName = current_app.config['B1USERNAME']
             company.Password = current_app.config['B1PASSWORD']
-            company.Connect()
+            with self.breaker(type).guard():
+                lRetCode = company.Connect()
+                if lRetCode != 0:
+                    error = company.GetLastErrorDescription()
+                    current_app.logger.error(error)
+                    raise Exception(error)
             log = "Open SAPB1 connection for " + company.CompanyName
             current_app.logger.info(log)
-            return SAPB1COMAdaptor(company=company)
+            return SAPB1COMAdaptor(company=company, tracker=self.connections)
         elif type == "CURSOR":
-            sqlSrvConn = pymssql.connect(current_app.config['SERVER'],
-                                        current_app.config['DBUSERNAME'],
-                                        current_app.config['DBPASSWORD'],
-                                        current_app.config['COMPANYDB'])
+            driver = importlib.import_module(current_app.config.get('DBDRIVER', 'pymssql'))
+            with self.breaker(type).guard():
+                sqlSrvConn = driver.connect(current_app.config['SERVER'],
+                                            current_app.config['DBUSERNAME'],
+                                            current_app.config['DBPASSWORD'],
+                                            current_app.config['COMPANYDB'])
             log = "Open SAPB1 DB connection"
             current_app.logger.info(log)
-            return MSSQLCursorAdaptor(sqlSrvConn=sqlSrvConn)
+            adaptor = MSSQLCursorAdaptor(sqlSrvConn=sqlSrvConn, limiter=self.limiter,
+                                         emit=self._emitStatement, begin=self._currentSpan,
+                                         tracker=self.connections)
+            if current_app.config.get('ISOLATIONLEVEL'):
+                adaptor.setIsolation(current_app.config['ISOLATIONLEVEL'])
+            return adaptor
+        elif type == "REPLICA":
+            sqlSrvConn = self.replica.connect()
+            return MSSQLCursorAdaptor(sqlSrvConn=sqlSrvConn, emit=self._emitStatement, begin=self._currentSpan,
+                                      tracker=self.connections)
         else:
             return None
 
+    def _emitStatement(self, record):
+        """Publish a SQL statement record through the sql_executed signal and the sinks.
+        """
+        sql_executed.send(self, record=record)
+        for sink in self.sqlSinks:
+            try:
+                sink(record)
+            except Exception as e:
+                log = "SQL sink failed: " + str(e)
+                current_app.logger.exception(log)
+
+    def addSQLSink(self, sink):
+        """Register a callable receiving a record for every SQL statement executed:
+        sql, params, statement, fingerprint, started, elapsed, rows and bytes.
+        """
+        self.sqlSinks.append(sink)
+
+    def breaker(self, type):
+        """Circuit breaker guarding the connect of the given type ("COM" or "CURSOR").
+        """
+        threshold = current_app.config.get('BREAKERTHRESHOLD', 5)
+        cooldown = current_app.config.get('BREAKERCOOLDOWN', 30)
+        with self._lock:
+            breaker = self._breakers.get(type)
+            if breaker is None or breaker.threshold != threshold or breaker.cooldown != cooldown:
+                breaker = CircuitBreaker(type, threshold=threshold, cooldown=cooldown)
+                self._breakers[type] = breaker
+            return breaker
+
     def teardown(self, exception):
         ctx = stack.top
+        if hasattr(ctx, 'sapb1COMProfile'):
+            self.comProfileTotal.merge(ctx.sapb1COMProfile)
+            log = "SAPB1 COM profile: " + ", ".join(
+                ["{0}.{1} x{2} {3:.4f}s".format(entry['interface'], entry['member'], entry['count'], entry['total'])
+                 for entry in ctx.sapb1COMProfile.stats()[0:10]])
+            current_app.logger.info(log)
         if hasattr(ctx, 'sapb1COMAdaptor'):
             ctx.sapb1COMAdaptor.disconnect()
         if hasattr(ctx, 'msSQLCursorAdaptor'):
             ctx.msSQLCursorAdaptor.disconnect()
+        if hasattr(ctx, 'sapb1ReplicaAdaptor'):
+            ctx.sapb1ReplicaAdaptor.disconnect()
+        if hasattr(ctx, 'sapb1Trace') and ctx.sapb1Trace.roots:
+            self._exportTrace(ctx.sapb1Trace)
+        self._disconnectQueued()
+
+    def connectionReport(self):
+        """Open Company and SQL connections with creation stack, age, thread and owning context.
+        """
+        return self.connections.report()
+
+    def reapConnections(self, maxAge=None):
+        """Queue connections older than maxAge (CONNECTIONMAXAGE by default) whose owning
+        context has ended for disconnection by the thread that opened them, which
+        disconnects them on its next connect or context teardown.
+        """
+        if maxAge is None:
+            maxAge = current_app.config['CONNECTIONMAXAGE']
+        queued = self.connections.reap(maxAge)
+        for entry in queued:
+            log = "Orphaned {0} connection aged {1:.0f}s queued for thread {2}, created at:\n{3}".format(
+                entry['type'], entry['age'], entry['thread'], entry['stack'])
+            current_app.logger.warning(log)
+        return queued
+
+    def _disconnectQueued(self):
+        """Disconnect the reaped connections of the calling thread.
+        """
+        for entry in self.connections.disconnectQueued():
+            log = "Reaped {0} connection aged {1:.0f}s".format(entry['type'], entry['age'])
+            current_app.logger.warning(log)
 
     def info(self):
         """Show the information for the SAP B1 connection.
@@ -132,12 +753,300 @@ class SAPB1Adaptor(object):
 
     @property
     def cursorAdaptor(self):
+        if getattr(self._local, 'replicaReads', False):
+            return self.replicaAdaptor
+        return self.sqlServerAdaptor
+
+    @property
+    def sqlServerAdaptor(self):
+        """SQL Server cursor adaptor of the current context, even within replica reads.
+        """
         ctx = stack.top
         if ctx is not None:
             if not hasattr(ctx, 'msSQLCursorAdaptor'):
                 ctx.msSQLCursorAdaptor = self.connect(type="CURSOR")
             return ctx.msSQLCursorAdaptor
 
+    @property
+    def replicaAdaptor(self):
+        """Cursor adaptor over the REPLICA file of the current context.
+        """
+        ctx = stack.top
+        if ctx is not None:
+            if not hasattr(ctx, 'sapb1ReplicaAdaptor'):
+                ctx.sapb1ReplicaAdaptor = self.connect(type="REPLICA")
+            return ctx.sapb1ReplicaAdaptor
+
+    @property
+    def replica(self):
+        """Local SQLite replica of the REPLICATABLES, None if REPLICA is not set.
+        """
+        path = current_app.config.get('REPLICA')
+        if path is None:
+            return None
+        tables = current_app.config.get('REPLICATABLES') or DEFAULT_TABLES
+        with self._lock:
+            if self._replica is None or self._replica.path != path or self._replica.tables != list(tables):
+                self._replica = Replica(path, tables, chunkSize=self.INCHUNKSIZE)
+            self._replica.reconcileInterval = current_app.config.get('REPLICARECONCILE', 3600)
+            return self._replica
+
+    @operation
+    def pullReplica(self):
+        """Pull the rows changed in SQL Server since the last pull into the REPLICA.
+        Return the number of rows pulled by table.
+        """
+        return self.replica.pull(self.cursorAdaptor)
+
+    def useReplica(self):
+        """Whether replicable reads go to the REPLICA: REPLICAREADS unless overridden
+        by fromReplica, and only once every replicated table has been pulled.
+        """
+        enabled = getattr(self._local, 'replica', None)
+        if enabled is None:
+            enabled = current_app.config.get('REPLICAREADS', False)
+        if not enabled:
+            return False
+        replica = self.replica
+        return replica is not None and replica.loaded()
+
+    @contextmanager
+    def isolation(self, level):
+        """Run the SQL Server reads of the block at the isolation level (see
+        MSSQLCursorAdaptor.ISOLATIONLEVELS), then restore ISOLATIONLEVEL.
+        Raise RuntimeError outside an application context.
+        """
+        if stack.top is None:
+            raise RuntimeError("isolation needs an application context.")
+        with self.sqlServerAdaptor.isolation(level):
+            yield
+
+    @contextmanager
+    def fromReplica(self, enabled=True):
+        """Serve the replicable reads of the block from the REPLICA, or from SQL Server
+        with enabled False, whatever REPLICAREADS says.
+        """
+        previous = getattr(self._local, 'replica', None)
+        self._local.replica = enabled
+        try:
+            yield
+        finally:
+            self._local.replica = previous
+
+    @property
+    def orderIndex(self):
+        """Local index of front-end order ids to DocEntry, None if ORDERINDEX is not set.
+        """
+        path = current_app.config.get('ORDERINDEX')
+        if path is None:
+            return None
+        companyDb = current_app.config['COMPANYDB']
+        with self._lock:
+            if self._orderIndex is None or self._orderIndex.path != path or self._orderIndex.companyDb != companyDb:
+                if self._orderIndex is not None:
+                    self._orderIndex.close()
+                self._orderIndex = OrderIndex(path, companyDb)
+            return self._orderIndex
+
+    @property
+    def recorder(self):
+        """Recorder of the adaptor method calls, None if RECORD is not set.
+        """
+        path = current_app.config.get('RECORD')
+        if path is None:
+            return None
+        with self._lock:
+            if self._recorder is None or self._recorder.path != path:
+                if self._recorder is not None:
+                    self._recorder.close()
+                self._recorder = Recorder(path, current_app.config.get('RECORDREDACT', DEFAULT_REDACT))
+            return self._recorder
+
+    @property
+    def bpSnapshot(self):
+        """Snapshot of the customer business partners refreshed every BPCACHE seconds, None if BPCACHE is not set.
+        """
+        interval = current_app.config.get('BPCACHE')
+        if interval is None:
+            return None
+        with self._lock:
+            if self._bpSnapshot is None or self._bpSnapshot.interval != interval:
+                self._bpSnapshot = BusinessPartnerSnapshot(interval)
+            snapshot = self._bpSnapshot
+        snapshot.refresh(self._fetchBusinessPartners)
+        return snapshot
+
+    def _fetchBusinessPartners(self, watermark):
+        """Customer OCRD rows and their OCPR rows updated on or after watermark, all of them if None.
+        """
+        rows = []
+        params = {}
+        sqls = [
+            """SELECT {0} FROM dbo.OCRD WHERE CardType = 'C'""".format(", ".join(self.BPCOLUMNS)),
+            """SELECT {0} FROM dbo.OCPR t0 INNER JOIN dbo.OCRD t1 ON t1.CardCode = t0.CardCode
+               WHERE t1.CardType = 'C'""".format(", ".join(["t0." + c for c in self.BPCONTACTCOLUMNS]))
+        ]
+        if watermark is not None:
+            params['watermark'] = watermark
+            sqls[0] = sqls[0] + " AND UpdateDate >= %(watermark)s"
+            sqls[1] = sqls[1] + " AND t0.UpdateDate >= %(watermark)s"
+        for sql in sqls:
+            self.cursorAdaptor.execute(sql, params)
+            rows.extend(dict(row) for row in self.cursorAdaptor.sqlSrvCursor)
+        return rows
+
+    @property
+    def itemSnapshot(self):
+        """Snapshot of the item master and prices refreshed every ITEMCACHE seconds, None if ITEMCACHE is not set.
+        """
+        interval = current_app.config.get('ITEMCACHE')
+        if interval is None:
+            return None
+        with self._lock:
+            if self._itemSnapshot is None or self._itemSnapshot.interval != interval:
+                self._itemSnapshot = ItemSnapshot(interval)
+            snapshot = self._itemSnapshot
+        snapshot.refresh(self._fetchItems)
+        return snapshot
+
+    def _fetchItems(self, watermark):
+        """OITM rows and their ITM1 rows of the items updated on or after watermark, all of them if None.
+        """
+        rows = []
+        params = {}
+        sqls = [
+            """SELECT {0} FROM dbo.OITM""".format(", ".join(self.ITEMCOLUMNS)),
+            """SELECT {0} FROM dbo.ITM1 t0 INNER JOIN dbo.OITM t1 ON t1.ItemCode = t0.ItemCode""".format(
+                ", ".join(["t0." + c for c in self.ITEMPRICECOLUMNS]))
+        ]
+        if watermark is not None:
+            params['watermark'] = watermark
+            sqls[0] = sqls[0] + " WHERE UpdateDate >= %(watermark)s"
+            sqls[1] = sqls[1] + " WHERE t1.UpdateDate >= %(watermark)s"
+        for sql in sqls:
+            self.cursorAdaptor.execute(sql, params)
+            rows.extend(dict(row) for row in self.cursorAdaptor.sqlSrvCursor)
+        return rows
+
+    @property
+    def priceSnapshot(self):
+        """Snapshot of the price lists, special prices and discount groups reloaded every PRICECACHE seconds,
+        loaded once if PRICECACHE is 0 or None.
+        """
+        interval = current_app.config.get('PRICECACHE')
+        with self._lock:
+            if self._priceSnapshot is None or self._priceSnapshot.interval != interval:
+                self._priceSnapshot = PriceSnapshot(interval)
+            snapshot = self._priceSnapshot
+        snapshot.refresh(self._fetchPrices)
+        return snapshot
+
+    def _fetchPrices(self, watermark):
+        """Rows of the PRICECOLUMNS tables with the table name as Source.
+        """
+        rows = []
+        for table, columns, where in self.PRICECOLUMNS:
+            sql = """SELECT '{0}' AS Source, {1} FROM dbo.{0}""".format(table, ", ".join(columns))
+            if where is not None:
+                sql = sql + " WHERE " + where
+            self.cursorAdaptor.execute(sql)
+            rows.extend(dict(row) for row in self.cursorAdaptor.sqlSrvCursor)
+        return rows
+
+    @property
+    def inventoryCache(self):
+        """Cache of the OITW quantities by (ItemCode, WhsCode or None) kept INVENTORYTTL seconds.
+        """
+        ttl = current_app.config.get('INVENTORYTTL') or 0
+        with self._lock:
+            if self._inventoryCache is None or self._inventoryCache.ttl != ttl:
+                self._inventoryCache = TTLCache(ttl, listener=self._countInventoryLookups)
+            return self._inventoryCache
+
+    def _countInventoryLookups(self, hits, misses, shared):
+        counter = self.metrics.counter('sapb1_cache_requests_total')
+        for result, count in (('hit', hits), ('miss', misses), ('shared', shared)):
+            if count:
+                counter.inc(count, cache='inventory', result=result)
+
+    @property
+    def limiter(self):
+        """Admission control for DI API writes and SQL reads configured by DILIMITS.
+        """
+        limits = current_app.config.get('DILIMITS') or {}
+        with self._lock:
+            if self._limiter is None or self._limiter.limits != limits:
+                self._limiter = Limiter(limits)
+            return self._limiter
+
+    @property
+    def scheduler(self):
+        """Priority scheduler for the DI session slots configured by DISESSIONS.
+        """
+        slots = current_app.config.get('DISESSIONS')
+        with self._lock:
+            if self._scheduler is None or self._scheduler.slots != slots:
+                self._scheduler = PriorityScheduler(slots)
+            return self._scheduler
+
+    @property
+    def priority(self):
+        """Priority class of the DI work issued by the current context.
+        """
+        ctx = stack.top
+        return getattr(ctx, 'sapb1Priority', 'interactive')
+
+    def setPriority(self, priority):
+        """Set the priority class ('interactive' or 'batch') for the current context.
+        Raise RuntimeError outside an application context.
+        """
+        if priority not in PriorityScheduler.PRIORITIES:
+            raise ValueError("Unknown priority {0}.".format(priority))
+        ctx = stack.top
+        if ctx is None:
+            raise RuntimeError("setPriority needs an application context.")
+        ctx.sapb1Priority = priority
+
+    @property
+    def comProfile(self):
+        """COM call profile of the current context.
+        """
+        ctx = stack.top
+        if ctx is not None:
+            if not hasattr(ctx, 'sapb1COMProfile'):
+                ctx.sapb1COMProfile = COMProfile()
+            return ctx.sapb1COMProfile
+
+    @property
+    def trace(self):
+        """Span tree of the current context, None if TRACE is not set.
+        """
+        ctx = stack.top
+        if ctx is not None and current_app.config.get('TRACE'):
+            if not hasattr(ctx, 'sapb1Trace'):
+                ctx.sapb1Trace = Trace()
+            return ctx.sapb1Trace
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the block as a span of the current context's trace.
+        """
+        trace = self.trace
+        if trace is None:
+            yield None
+            return
+        with trace.span(name, **attributes) as span:
+            yield span
+
+    def getBusinessObject(self, objType):
+        """Retrieve a business object by its BoObjectTypes name, e.g. 'oOrders'.
+        The object is wrapped in a profiling proxy if COMPROFILE is enabled.
+        """
+        obj = self.comAdaptor.company.GetBusinessObject(getattr(self.constants, objType))
+        if not current_app.config.get('COMPROFILE'):
+            return obj
+        return ProfiledObject(obj, objType, self.comProfile)
+
     def trimValue(self, value, maxLength):
         """Trim the value.
         """
@@ -145,30 +1054,107 @@ class SAPB1Adaptor(object):
             return value[0:maxLength-1]
         return value
 
-    def getOrders(self, num=1, columns=[], params={}):
-        """Retrieve orders from SAP B1.
+    def _rowToDict(self, row):
+        """Convert a row to a dict of strings, datetimes as 'YYYY-MM-DD HH:MM:SS' and NULL as ''.
+        """
+        data = {}
+        for k, v in row.items():
+            value = ''
+            if type(v) is datetime.datetime:
+                value = v.strftime("%Y-%m-%d %H:%M:%S")
+            elif v is not None:
+                value = str(v)
+            data[k] = value
+        return data
+
+    def _columns(self, columns, *required):
+        """The columns followed by the required ones they lack.
+        """
+        columns = list(columns)
+        for column in required:
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def _projection(self, columns, *required):
+        """Select list of the columns plus the required ones, '*' for all columns.
+        """
+        if len(columns) == 0:
+            return '*'
+        return " ,".join(self._columns(columns, *required))
+
+    def _where(self, params):
+        """Conditions and values of params given as {column: {'value': ..., 'op': ...}}, op defaulting to '='.
         """
-        cols = '*'
-        if len(columns) > 0:
-            cols = " ,".join(columns)
         ops = {key: '=' if 'op' not in params[key].keys() else params[key]['op'] for key in params.keys()}
+        where = ["{0} {1} %({2})s".format(k, ops[k], k) for k in params.keys()]
+        return where, {key: params[key]['value'] for key in params.keys()}
+
+    @operation
+    @replicable
+    def getOrders(self, num=1, columns=[], params={}, items=False, itemColumns=[], addresses=False,
+                  addressColumns=[], after=None):
+        """Retrieve orders from SAP B1.
+        With items or addresses, the RDR1 lines and RDR12 address rows of the orders
+        are read with a fixed number of queries per page, see getDocuments.
+        """
+        if items or addresses or after is not None:
+            return self.getDocuments('oOrders', num=num, columns=columns, params=params, itemColumns=itemColumns,
+                                     after=after, items=items, addresses=addresses, addressColumns=addressColumns)
+        cols = self._projection(columns)
+        where, values = self._where(params)
         sql = """SELECT top {0} {1} FROM dbo.ORDR""".format(num, cols)
-        if len(params) > 0:
-            sql = sql + ' WHERE ' + " AND ".join(["{0} {1} %({2})s".format(k, ops[k], k) for k in params.keys()])
-        self.cursorAdaptor.sqlSrvCursor.execute(sql, {key: params[key]['value'] for key in params.keys()})
-        orders = []
-        for row in self.cursorAdaptor.sqlSrvCursor:
-            order = {}
-            for k, v in row.items():
-                value = ''
-                if type(v) is datetime.datetime:
-                    value = v.strftime("%Y-%m-%d %H:%M:%S")
-                elif v is not None:
-                    value = str(v)
-                order[k] = value
-            orders.append(order)
-        return orders
+        if len(where) > 0:
+            sql = sql + ' WHERE ' + " AND ".join(where)
+        self.cursorAdaptor.execute(sql, values)
+        return [self._rowToDict(row) for row in self.cursorAdaptor.sqlSrvCursor]
 
+    def _feOrderIdField(self, o):
+        """Column holding the front-end order id, the UDF if configured or NumAtCard.
+        """
+        if 'fe_order_id_udf' in o.keys():
+            return o['fe_order_id_udf']
+        return 'NumAtCard'
+
+    @operation
+    @primary
+    def getOrderId(self, o):
+        """Retrieve the DocEntry of an order by the front-end order id.
+        The local order index is consulted first and SQL is used on a miss.
+        """
+        field = self._feOrderIdField(o)
+        feOrderId = str(o['fe_order_id'])
+        index = self.orderIndex
+        if index is not None:
+            boOrderId = index.get(field, feOrderId)
+            result = 'miss' if boOrderId is None else 'hit'
+            self.metrics.counter('sapb1_cache_requests_total').inc(cache='orderindex', result=result)
+            if boOrderId is not None:
+                return boOrderId
+        orders = self.getOrders(num=1, columns=['DocEntry'], params={field: {'value': feOrderId}})
+        if not orders:
+            return None
+        boOrderId = orders[0]['DocEntry']
+        if index is not None:
+            index.put(field, feOrderId, boOrderId)
+        return boOrderId
+
+    @operation
+    @primary
+    def getOrderIds(self, feOrderIds, udf=None, columns=['DocEntry', 'DocStatus', 'CANCELED']):
+        """Resolve many front-end order ids at once, by NumAtCard or by the udf
+        column, with one query per INCHUNKSIZE ids.
+        Return a dict of front-end order id to the order columns, without the
+        ids not found; the found ids are recorded in the order index.
+        """
+        field = udf or 'NumAtCard'
+        feOrderIds = sorted(set(str(feOrderId) for feOrderId in feOrderIds))
+        rows = self._childRows('ORDR', feOrderIds, columns, 'DocEntry', key=field, required=['DocEntry'])
+        orders = dict((str(feOrderId), matches[0]) for feOrderId, matches in rows.items())
+        index = self.orderIndex
+        if index is not None and orders:
+            index.putMany(field, dict((feOrderId, order['DocEntry']) for feOrderId, order in orders.items()))
+        return orders
 
     #
     # # Retrieve the DocNum of the Invoice.
@@ -263,14 +1249,17 @@ class SAPB1Adaptor(object):
     #     return docNum
 
 
+    @operation
     def getMainCurrency(self):
         """Retrieve the main currency of the company from SAP B1.
         """
         sql = """SELECT MainCurncy FROM dbo.OADM"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql)
+        self.cursorAdaptor.execute(sql)
         mainCurrency = self.cursorAdaptor.sqlSrvCursor.fetchone()['MainCurncy']
         return mainCurrency
 
+    @operation
+    @replicable
     def getContacts(self, num=1, columns=[], cardCode=None, contact={}):
         """Retrieve contacts under a business partner by CardCode from SAP B1.
         """
@@ -283,25 +1272,18 @@ class SAPB1Adaptor(object):
         params['cardcode'] = cardCode
         sql = sql + ' WHERE ' + " AND ".join(["{0} = %({1})s".format(k, k) for k in params.keys()])
 
-        self.cursorAdaptor.sqlSrvCursor.execute(sql, params)
-        contacts = []
-        for row in self.cursorAdaptor.sqlSrvCursor:
-            contact = {}
-            for k, v in row.items():
-                value = ''
-                if type(v) is datetime.datetime:
-                    value = v.strftime("%Y-%m-%d %H:%M:%S")
-                elif v is not None:
-                    value = str(v)
-                contact[k] = value
-            contacts.append(contact)
-        return contacts
+        self.cursorAdaptor.execute(sql, params)
+        return [self._rowToDict(row) for row in self.cursorAdaptor.sqlSrvCursor]
 
+    @operation
+    @primary
+    @scheduled
     def insertContact(self, cardCode, contact):
         """Insert a new contact into a business partner by CardCode.
         """
-        busPartner = self.comAdaptor.company.GetBusinessObject(self.constants.oBusinessPartners)
-        busPartner.GetByKey(cardCode)
+        busPartner = self.getBusinessObject('oBusinessPartners')
+        with self.span('oBusinessPartners.GetByKey'):
+            busPartner.GetByKey(cardCode)
         current = busPartner.ContactEmployees.Count
         if busPartner.ContactEmployees.InternalCode == 0:
             nextLine = 0
@@ -318,9 +1300,10 @@ class SAPB1Adaptor(object):
         busPartner.ContactEmployees.E_Mail = contact["E_MailL"]
         address = contact['Address']
         busPartner.ContactEmployees.Address = self.trimValue(address,100)
-        lRetCode = busPartner.Update()
+        with self.span('oBusinessPartners.Update'), self.limiter.acquire('insertContact'):
+            lRetCode = busPartner.Update()
         if lRetCode != 0:
-            log = self.company.GetLastErrorDescription()  # self.company.GetLastError()
+            log = self.comAdaptor.company.GetLastErrorDescription()  # self.comAdaptor.company.GetLastError()
             current_app.logger.error(log)
             raise Exception(log)
 
@@ -334,6 +1317,8 @@ class SAPB1Adaptor(object):
         contactCode = contacts[0]['cntctcode']
         return contactCode
 
+    @operation
+    @primary
     def getContactPersonCode(self, order):
         """Retrieve ContactPersonCode by an order.
         """
@@ -357,56 +1342,105 @@ class SAPB1Adaptor(object):
             contactCode = self.insertContact(order['card_code'], contact)
         return contactCode
 
+    @operation
+    def getCardCodeByEmail(self, email):
+        """Retrieve the CardCode of the customer with the email, by its E_Mail or
+        the E_MailL of its main contact; from the BPCACHE snapshot if enabled.
+        """
+        snapshot = self.bpSnapshot
+        if snapshot is not None:
+            cardCodes = snapshot.byEmail(email)
+            result = 'hit' if cardCodes else 'miss'
+            self.metrics.counter('sapb1_cache_requests_total').inc(cache='bp', result=result)
+            if cardCodes:
+                return cardCodes[0]
+        # Two seeks instead of ISNULL(OCRD.E_Mail, OCPR.E_MailL), which cannot use an index.
+        sql = """SELECT CardCode FROM dbo.OCRD WHERE CardType = 'C' AND E_Mail = %(email)s
+                 UNION
+                 SELECT t0.CardCode FROM dbo.OCRD t0 INNER JOIN dbo.OCPR t1
+                 ON t1.CardCode = t0.CardCode AND t1.Name = t0.CntctPrsn
+                 WHERE t0.CardType = 'C' AND (t0.E_Mail IS NULL OR t0.E_Mail = '') AND t1.E_MailL = %(email)s
+                 ORDER BY CardCode"""
+        self.cursorAdaptor.execute(sql, {'email': email.strip()})
+        row = self.cursorAdaptor.sqlSrvCursor.fetchone()
+        if row is None:
+            return None
+        self.cursorAdaptor.sqlSrvCursor.fetchall()
+        return row['CardCode']
+
+    @operation
+    @replicable
+    def getBusinessPartner(self, cardCode):
+        """Retrieve a customer business partner by CardCode; from the BPCACHE snapshot if enabled.
+        """
+        snapshot = self.bpSnapshot
+        if snapshot is not None:
+            partner = snapshot.get(cardCode)
+            result = 'miss' if partner is None else 'hit'
+            self.metrics.counter('sapb1_cache_requests_total').inc(cache='bp', result=result)
+            if partner is not None:
+                return self._rowToDict(partner)
+        sql = """SELECT {0} FROM dbo.OCRD WHERE CardCode = %(cardCode)s""".format(", ".join(self.BPCOLUMNS))
+        self.cursorAdaptor.execute(sql, {'cardCode': cardCode})
+        rows = [self._rowToDict(row) for row in self.cursorAdaptor.sqlSrvCursor]
+        return rows[0] if rows else None
+
+    @operation
     def getExpnsCode(self, expnsName):
         """Retrieve expnsCode by expnsName.
         """
         sql = """SELECT ExpnsCode FROM dbo.OEXD WHERE ExpnsName = %s"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql, (expnsName))
+        self.cursorAdaptor.execute(sql, (expnsName))
         expnsCode = self.cursorAdaptor.sqlSrvCursor.fetchone()['ExpnsCode']
         return expnsCode
 
+    @operation
     def getTrnspCode(self, trnspName):
         """Retrieve TrnspCode by trnspName.
         """
         sql = """SELECT TrnspCode FROM dbo.OSHP WHERE TrnspName = %s"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql, (trnspName))
+        self.cursorAdaptor.execute(sql, (trnspName))
         trnspCode = self.cursorAdaptor.sqlSrvCursor.fetchone()['TrnspCode']
         return trnspCode
 
+    @operation
     def getExpnsNames(self):
         """Retrieve expnsNames.
         """
         sql = """SELECT ExpnsName FROM dbo.OEXD"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql)
+        self.cursorAdaptor.execute(sql)
         expnsNames = []
         for row in self.cursorAdaptor.sqlSrvCursor:
             for k, v in row.items():
                 expnsNames.append(v)
         return expnsNames
 
+    @operation
     def getTrnspNames(self):
         """Retrieve TrnspNames.
         """
         sql = """SELECT TrnspName FROM dbo.OSHP"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql)
+        self.cursorAdaptor.execute(sql)
         trnspNames = []
         for row in self.cursorAdaptor.sqlSrvCursor:
             for k, v in row.items():
                 trnspNames.append(v)
         return trnspNames
 
+    @operation
     def getPayMethCods(self):
         sql = """SELECT PayMethCod from opym"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql)
+        self.cursorAdaptor.execute(sql)
         payMethCods = []
         for row in self.cursorAdaptor.sqlSrvCursor:
             for k, v in row.items():
                 payMethCods.append(v)
         return payMethCods
 
+    @operation
     def getTaxCodes(self):
         sql = """SELECT Code, Name, Rate from osta"""
-        self.cursorAdaptor.sqlSrvCursor.execute(sql)
+        self.cursorAdaptor.execute(sql)
         taxCodes = []
         for row in self.cursorAdaptor.sqlSrvCursor:
             taxCode = {}
@@ -415,13 +1449,70 @@ class SAPB1Adaptor(object):
             taxCodes.append(taxCode)
         return taxCodes
 
+    def getPrice(self, cardCode, itemCode, quantity=1, date=None):
+        """Compute the unit price of an item for a customer like B1 does, from the PRICECACHE snapshot:
+        special prices of the customer, else discount groups applied to the price list price,
+        else period and volume discounts of its price list, else the price list price.
+        Return Price, Currency, Discount, ListPrice, PriceList and Source as strings, None if it has no price.
+        """
+        price = self.priceSnapshot.price(cardCode, itemCode, quantity, date)
+        result = 'miss' if price is None else 'hit'
+        self.metrics.counter('sapb1_cache_requests_total').inc(cache='price', result=result)
+        return None if price is None else self._rowToDict(price)
+
+    def getPrices(self, cardCode, items, date=None):
+        """Compute the unit prices of order lines (dicts with itemcode and quantity) for a customer.
+        Return a list with the getPrice result of each line.
+        """
+        return [self.getPrice(cardCode, line['itemcode'], line.get('quantity', 1), date) for line in items]
+
+    def validateOrderLines(self, items, cardCode=None, date=None):
+        """Check order lines against the ITEMCACHE snapshot before any COM call.
+        Return copies of the lines, those without a price priced for the customer cardCode like B1
+        does (see getPrice), with special prices and discount groups; items is left unchanged.
+        Raise InvalidOrderError with every rejected line; only copy the lines if ITEMCACHE is not set.
+        """
+        lines = [dict(line) for line in items]
+        snapshot = self.itemSnapshot
+        if snapshot is None:
+            return lines
+        errors = []
+        for index, line in enumerate(lines):
+            item = snapshot.get(line['itemcode'])
+            result = 'miss' if item is None else 'hit'
+            self.metrics.counter('sapb1_cache_requests_total').inc(cache='item', result=result)
+            code = reason = snapshot.reject(item)
+            if reason is None and line.get('price') in (None, ''):
+                price = self.getPrice(cardCode, line['itemcode'], line.get('quantity', 1), date)
+                if price is None:
+                    code, reason = 'no price', 'no price for customer {0}'.format(cardCode)
+                else:
+                    line['price'] = price['Price']
+                    line['linetotal'] = float(decimal.Decimal(price['Price']) * decimal.Decimal(str(line['quantity'])))
+            if reason is not None:
+                self.metrics.counter('sapb1_order_lines_rejected_total').inc(reason=code)
+                errors.append((index, line['itemcode'], reason))
+        if errors:
+            raise InvalidOrderError(errors)
+        return lines
+
+    @operation
+    @primary
+    @scheduled
     def insertOrder(self, o):
         """Insert an order into SAP B1.
+        Return the existing DocEntry if the front-end order id is already in SAP B1.
         """
+        boOrderId = self.getOrderId(o)
+        if boOrderId is not None:
+            log = "Order {0} already exists as DocEntry {1}.".format(o['fe_order_id'], boOrderId)
+            current_app.logger.warning(log)
+            return boOrderId
+        items = self.validateOrderLines(o['items'], o['card_code'])
         o["billto_telephone"] = self.trimValue(o["billto_telephone"],20)
         o['billto_address'] = self.trimValue(o['billto_address'],100)
         o['shipto_address'] = self.trimValue(o['shipto_address'],100)
-        order = self.comAdaptor.company.GetBusinessObject(self.constants.oOrders)
+        order = self.getBusinessObject('oOrders')
         order.DocDueDate = o['doc_due_date']
         order.CardCode = o['card_code']
         name = o['billto_firstname'] + ' ' + o['billto_lastname']
@@ -474,7 +1565,7 @@ class SAPB1Adaptor(object):
         order.AddressExtension.ShipToZipCode = o['shipto_zipcode']
 
         i = 0
-        for item in o['items']:
+        for item in items:
             order.Lines.Add()
             order.Lines.SetCurrentLine(i)
             order.Lines.ItemCode = item['itemcode']
@@ -484,96 +1575,217 @@ class SAPB1Adaptor(object):
             order.Lines.LineTotal = item['linetotal']
             i = i + 1
 
-        lRetCode = order.Add()
+        with self.span('oOrders.Add', lines=len(items)), self.limiter.acquire('insertOrder'):
+            lRetCode = order.Add()
         if lRetCode != 0:
             error = str(self.comAdaptor.company.GetLastError())
             current_app.logger.error(error)
             raise Exception(error)
         else:
-            params = None
-            if 'fe_order_id_udf' in o.keys():
-                params = {o['fe_order_id_udf']: {'value': str(o['fe_order_id'])}}
-            else:
-                params = {'NumAtCard': {'value': str(o['fe_order_id'])}}
-            orders = self.getOrders(num=1, columns=['DocEntry'], params=params)
-            boOrderId = orders[0]['DocEntry']
+            boOrderId = self.getOrderId(o)
             return boOrderId
 
+    @operation
+    @primary
+    @scheduled
     def cancelOrder(self, o):
         """Cancel an order in SAP B1.
         """
-        order = self.comAdaptor.company.GetBusinessObject(self.constants.oOrders)
-        params = None
-        if 'fe_order_id_udf' in o.keys():
-            params = {o['fe_order_id_udf']: {'value': str(o['fe_order_id'])}}
-        else:
-            params = {'NumAtCard': {'value': str(o['fe_order_id'])}}
-        orders = self.getOrders(num=1, columns=['DocEntry'], params=params)
-        if orders:
-            boOrderId = orders[0]['DocEntry']
-            order.GetByKey(boOrderId)
-            lRetCode = order.Cancel()
+        order = self.getBusinessObject('oOrders')
+        boOrderId = self.getOrderId(o)
+        if boOrderId is not None:
+            with self.span('oOrders.GetByKey'):
+                order.GetByKey(boOrderId)
+            with self.span('oOrders.Cancel'), self.limiter.acquire('cancelOrder'):
+                lRetCode = order.Cancel()
             if lRetCode != 0:
-                error = str(self.company.GetLastError())
-                self.logger.error(error)
+                error = str(self.comAdaptor.company.GetLastError())
+                current_app.logger.error(error)
                 raise Exception(error)
             else :
                 return boOrderId
         else :
             raise Exception("Order {0} is not found.".format(o['fe_order_id']))
 
-    def _getShipmentItems(self, shipmentId, columns=[]):
-        """Retrieve line items for each shipment(delivery) from SAP B1.
+    def _inList(self, values, prefix='e'):
+        """Placeholders and parameters of an IN list of values.
         """
-        cols = "*"
-        if len(columns) > 0:
-            cols = " ,".join(columns)
-        sql = """SELECT {0} FROM dbo.DLN1""".format(cols)
-        params = {
-            'DocEntry' : shipmentId
-        }
-        if len(params) > 0:
-            sql = sql + ' WHERE ' + " AND ".join(["{0} = %({1})s".format(k, k) for k in params.keys()])
+        params = dict(('{0}{1}'.format(prefix, j), value) for j, value in enumerate(values))
+        return ", ".join(["%({0}{1})s".format(prefix, j) for j in range(len(values))]), params
 
-        self.cursorAdaptor.sqlSrvCursor.execute(sql, params)
-        items = []
-        for row in self.cursorAdaptor.sqlSrvCursor:
-            item = {}
-            for k, v in row.items():
-                value = ''
-                if type(v) is datetime.datetime:
-                    value = v.strftime("%Y-%m-%d %H:%M:%S")
-                elif v is not None:
-                    value = str(v)
-                item[k] = value
-            items.append(item)
-        return items
-
-    def getShipments(self, num=100, columns=[], params={}, itemColumns=[]):
-        """Retrieve shipments(deliveries) from SAP B1.
+    def _childRows(self, table, docEntries, columns=[], orderBy='DocEntry', key='DocEntry', required=()):
+        """Retrieve the rows of a line or address table for many documents with
+        chunked DocEntry (or key) IN lists, as a dict of DocEntry (or key) to its rows.
+        The key and the required columns are added to columns unless all columns are read.
         """
-        cols = '*'
-        if 'DocEntry' not in columns:
-            columns.append('DocEntry')
-        if len(columns) > 0:
-            cols = " ,".join(columns)
-        ops = {key: '=' if 'op' not in params[key].keys() else params[key]['op'] for key in params.keys()}
-        sql = """SELECT top {0} {1} FROM dbo.ODLN""".format(num, cols)
-        if len(params) > 0:
-            sql = sql + ' WHERE ' + " AND ".join(["{0} {1} %({2})s".format(k, ops[k], k) for k in params.keys()])
-        self.cursorAdaptor.sqlSrvCursor.execute(sql, {key: params[key]['value'] for key in params.keys()})
-        shipments = []
-        for row in self.cursorAdaptor.sqlSrvCursor:
-            shipment = {}
-            for k, v in row.items():
-                value = ''
-                if type(v) is datetime.datetime:
-                    value = v.strftime("%Y-%m-%d %H:%M:%S")
-                elif v is not None:
-                    value = str(v)
-                shipment[k] = value
-            shipments.append(shipment)
-        for shipment in shipments:
-            shipmentId = shipment['DocEntry']
-            shipment['items'] = self._getShipmentItems(shipmentId, itemColumns)
-        return shipments
+        cols = self._projection(columns, key, *required)
+        children = {}
+        for i in range(0, len(docEntries), self.INCHUNKSIZE):
+            inList, params = self._inList(docEntries[i:i + self.INCHUNKSIZE])
+            sql = """SELECT {0} FROM dbo.{1} WHERE {2} IN ({3}) ORDER BY {4}""".format(
+                cols, table, key, inList, orderBy)
+            self.cursorAdaptor.execute(sql, params)
+            for row in self.cursorAdaptor.sqlSrvCursor:
+                children.setdefault(row[key], []).append(self._rowToDict(row))
+        return children
+
+    def _lineItems(self, docType, docEntries, columns=[]):
+        """Retrieve the lines of many documents as a dict of DocEntry to its lines ordered by LineNum.
+        """
+        header, line = self.DOCUMENTTYPES[docType]
+        return self._childRows(line, docEntries, columns, 'DocEntry, LineNum')
+
+    def _addresses(self, docType, docEntries, columns=[]):
+        """Retrieve the address extension (e.g. RDR12) of many documents as a dict of DocEntry to its row.
+        """
+        header, line = self.DOCUMENTTYPES[docType]
+        rows = self._childRows(line[0:-1] + '12', docEntries, columns)
+        return dict((docEntry, addresses[0]) for docEntry, addresses in rows.items())
+
+    @operation
+    @replicable
+    def getDocuments(self, docType, num=100, columns=[], params={}, itemColumns=[], after=None, items=True,
+                     addresses=False, addressColumns=[]):
+        """Retrieve marketing documents of a DOCUMENTTYPES type with their lines from SAP B1.
+        Headers are read in DocEntry order, starting after the DocEntry given as after,
+        and the lines of the page are read in one query per INCHUNKSIZE documents.
+        With addresses, the address extension row is added as 'address' the same way.
+        """
+        header, line = self.DOCUMENTTYPES[docType]
+        cols = self._projection(columns, 'DocEntry')
+        where, values = self._where(params)
+        if after is not None:
+            where.append("DocEntry > %(after)s")
+            values['after'] = after
+        sql = """SELECT top {0} {1} FROM dbo.{2}""".format(num, cols, header)
+        if len(where) > 0:
+            sql = sql + ' WHERE ' + " AND ".join(where)
+        sql = sql + ' ORDER BY DocEntry'
+        self.cursorAdaptor.execute(sql, values)
+        rows = list(self.cursorAdaptor.sqlSrvCursor)
+        documents = [self._rowToDict(row) for row in rows]
+        docEntries = [row['DocEntry'] for row in rows]
+        if items:
+            lines = self._lineItems(docType, docEntries, itemColumns) if docEntries else {}
+            for docEntry, document in zip(docEntries, documents):
+                document['items'] = lines.get(docEntry, [])
+        if addresses:
+            rows = self._addresses(docType, docEntries, addressColumns) if docEntries else {}
+            for docEntry, document in zip(docEntries, documents):
+                document['address'] = rows.get(docEntry, {})
+        return documents
+
+    def _targets(self, docType, baseType, baseEntries, columns):
+        """Retrieve the documents of docType having lines based on documents of
+        the OBJECTTYPES value baseType, as a dict of base DocEntry to the target documents.
+        """
+        header, line = self.DOCUMENTTYPES[docType]
+        cols = ", ".join(["t0.{0}".format(column) for column in columns])
+        targets = {}
+        for i in range(0, len(baseEntries), self.INCHUNKSIZE):
+            inList, params = self._inList(baseEntries[i:i + self.INCHUNKSIZE])
+            params['baseType'] = baseType
+            # DISTINCT over the line keys only: SQL Server cannot compare the ntext header columns.
+            sql = """SELECT t1.BaseEntry AS BaseEntry, {0}
+                     FROM dbo.{1} t0 INNER JOIN (SELECT DISTINCT DocEntry, BaseEntry FROM dbo.{2}
+                     WHERE BaseType = %(baseType)s AND BaseEntry IN ({3})) t1 ON t1.DocEntry = t0.DocEntry""".format(
+                cols, header, line, inList)
+            self.cursorAdaptor.execute(sql, params)
+            for row in self.cursorAdaptor.sqlSrvCursor:
+                target = self._rowToDict(row)
+                baseEntry = target.pop('BaseEntry')
+                targets.setdefault(baseEntry, []).append(target)
+        for documents in targets.values():
+            documents.sort(key=lambda document: int(document['DocEntry']))
+        return targets
+
+    @operation
+    @replicable
+    def getDocumentChains(self, docEntries, columns=['DocEntry', 'DocNum', 'DocStatus', 'CANCELED', 'DocDate']):
+        """Resolve the deliveries, invoices and down payments of many orders by
+        following BaseType/BaseEntry on the line tables, with a fixed number
+        of queries per INCHUNKSIZE orders.
+        Return a dict of order DocEntry to {'deliveries': [...], 'invoices': [...],
+        'downPayments': [...]}; invoices include those based on the deliveries.
+        """
+        orders = sorted(set(int(docEntry) for docEntry in docEntries))
+        columns = self._columns(columns, 'DocEntry') if columns else ['*']
+        deliveries = self._targets('oDeliveryNotes', self.OBJECTTYPES['oOrders'], orders, columns)
+        invoices = self._targets('oInvoices', self.OBJECTTYPES['oOrders'], orders, columns)
+        downPayments = self._targets('oDownPayments', self.OBJECTTYPES['oOrders'], orders, columns)
+        deliveryEntries = sorted(set(int(delivery['DocEntry']) for documents in deliveries.values()
+                                     for delivery in documents))
+        deliveryInvoices = self._targets('oInvoices', self.OBJECTTYPES['oDeliveryNotes'], deliveryEntries, columns)
+        chains = {}
+        for order in orders:
+            key = str(order)
+            related = dict((invoice['DocEntry'], invoice) for invoice in invoices.get(key, []))
+            for delivery in deliveries.get(key, []):
+                for invoice in deliveryInvoices.get(delivery['DocEntry'], []):
+                    related[invoice['DocEntry']] = invoice
+            chains[key] = {
+                'deliveries': deliveries.get(key, []),
+                'invoices': sorted(related.values(), key=lambda invoice: int(invoice['DocEntry'])),
+                'downPayments': downPayments.get(key, [])
+            }
+        return chains
+
+    def _loadInventory(self, keys):
+        """OITW quantities of (ItemCode, WhsCode) keys, summed over the warehouses for WhsCode None.
+        """
+        inventory = {}
+        totals = sorted(set(itemCode for itemCode, whsCode in keys if whsCode is None))
+        details = sorted(set(itemCode for itemCode, whsCode in keys if whsCode is not None))
+        warehouses = sorted(set(whsCode for itemCode, whsCode in keys if whsCode is not None))
+        for i in range(0, len(totals), self.INCHUNKSIZE):
+            inList, params = self._inList(totals[i:i + self.INCHUNKSIZE])
+            sql = """SELECT ItemCode, SUM(OnHand) AS OnHand, SUM(IsCommited) AS IsCommited, SUM(OnOrder) AS OnOrder
+                     FROM dbo.OITW WHERE ItemCode IN ({0}) GROUP BY ItemCode""".format(inList)
+            self.cursorAdaptor.execute(sql, params)
+            for row in self.cursorAdaptor.sqlSrvCursor:
+                inventory[(row['ItemCode'], None)] = row
+        for i in range(0, len(details), self.INCHUNKSIZE):
+            inList, params = self._inList(details[i:i + self.INCHUNKSIZE])
+            whsList, whsParams = self._inList(warehouses, 'w')
+            params.update(whsParams)
+            sql = """SELECT ItemCode, WhsCode, OnHand, IsCommited, OnOrder
+                     FROM dbo.OITW WHERE ItemCode IN ({0}) AND WhsCode IN ({1})""".format(inList, whsList)
+            self.cursorAdaptor.execute(sql, params)
+            for row in self.cursorAdaptor.sqlSrvCursor:
+                inventory[(row['ItemCode'], row['WhsCode'])] = row
+        for key, row in inventory.items():
+            quantities = dict((k, decimal.Decimal(str(row[k] or 0))) for k in ('OnHand', 'IsCommited', 'OnOrder'))
+            quantities['Available'] = quantities['OnHand'] - quantities['IsCommited'] + quantities['OnOrder']
+            inventory[key] = dict((k, str(v)) for k, v in quantities.items())
+        return inventory
+
+    @operation
+    def getInventory(self, itemCodes, warehouses=None):
+        """Retrieve OnHand, IsCommited, OnOrder and Available (OnHand - IsCommited + OnOrder)
+        of many items from OITW with one query per INCHUNKSIZE items, cached INVENTORYTTL seconds.
+        Return a dict of ItemCode to the quantities summed over all warehouses, or with
+        warehouses, a dict of ItemCode to a dict of WhsCode to its quantities.
+        Items without stock records are left out.
+        """
+        if warehouses:
+            keys = [(itemCode, whsCode) for itemCode in itemCodes for whsCode in warehouses]
+        else:
+            keys = [(itemCode, None) for itemCode in itemCodes]
+        values = self.inventoryCache.getMany(keys, self._loadInventory)
+        inventory = {}
+        for (itemCode, whsCode), quantities in values.items():
+            if quantities is None:
+                continue
+            if warehouses:
+                inventory.setdefault(itemCode, {})[whsCode] = dict(quantities)
+            else:
+                inventory[itemCode] = dict(quantities)
+        return inventory
+
+    @operation
+    @replicable
+    def getShipments(self, num=100, columns=[], params={}, itemColumns=[], after=None):
+        """Retrieve shipments(deliveries) with their line items from SAP B1.
+        """
+        return self.getDocuments('oDeliveryNotes', num=num, columns=columns, params=params,
+                                 itemColumns=itemColumns, after=after)
@@ -0,0 +1,152 @@
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _formatLabels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(['{0}="{1}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                           for k, v in pairs]) + '}'
+
+
+def _formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Counter(object):
+    """Monotonic counter per label set.
+    """
+    type = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _labelKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_labelKey(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """Value per label set that can go up and down, or be read from a callback
+    returning a number or a list of (labels, value) pairs.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, help='', callback=None):
+        super(Gauge, self).__init__(name, help)
+        self._callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_labelKey(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._callback is None:
+            return super(Gauge, self).samples()
+        values = self._callback()
+        if not isinstance(values, list):
+            values = [({}, values)]
+        return [(self.name, _labelKey(labels), value) for labels, value in values]
+
+
+class Histogram(object):
+    """Cumulative bucket counts, sum and count per label set.
+    """
+    type = 'histogram'
+
+    def __init__(self, name, help='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _labelKey(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] = entry[0][i] + 1
+            entry[1] = entry[1] + value
+            entry[2] = entry[2] + 1
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(_labelKey(labels))
+            return entry[2] if entry else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucketCount in zip(self.buckets, counts):
+                    samples.append((self.name + '_bucket', key + (('le', _formatValue(bound)),), bucketCount))
+                samples.append((self.name + '_sum', key, total))
+                samples.append((self.name + '_count', key, count))
+        return samples
+
+
+class MetricsRegistry(object):
+    """Named metrics rendered in the Prometheus text exposition format.
+
+    counter(), gauge() and histogram() return the metric already registered
+    under the name, creating it on first use.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help='', callback=None):
+        return self._get(Gauge, name, help, callback=callback)
+
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self):
+        """Render every metric in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+            lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+            for name, key, value in metric.samples():
+                lines.append('{0}{1} {2}'.format(name, _formatLabels(key), _formatValue(value)))
+        return '\n'.join(lines) + '\n'
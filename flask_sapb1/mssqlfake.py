@@ -0,0 +1,376 @@
+"""Stand-in for pymssql backed by a SQLite file holding a synthetic SAP B1
+company database.
+
+connect() accepts the pymssql arguments and opens the SQLite file given as
+the database with the SQLite driver of flask_sapb1.replica, which
+translates the T-SQL used by the extension (TOP, dbo., ISNULL, pyformat
+parameters, ...).  Select it with
+DBDRIVER = 'flask_sapb1.mssqlfake' and COMPANYDB = <path of the file>.
+
+generate() creates the B1 tables and fills them with realistic rows:
+
+    python -m flask_sapb1.mssqlfake company.db --orders 1000000
+"""
+import argparse
+import datetime
+import random
+import sqlite3
+
+from .replica import Connection, Cursor, Error, OperationalError, sqlValue, translate
+
+# Marketing document header and line tables by object type.
+DOCUMENT_TABLES = {
+    23: ('OQUT', 'QUT1'),
+    17: ('ORDR', 'RDR1'),
+    15: ('ODLN', 'DLN1'),
+    16: ('ORDN', 'RDN1'),
+    13: ('OINV', 'INV1'),
+    14: ('ORIN', 'RIN1'),
+    203: ('ODPI', 'DPI1'),
+    22: ('OPOR', 'POR1'),
+    20: ('OPDN', 'PDN1'),
+    21: ('ORPD', 'RPD1'),
+    18: ('OPCH', 'PCH1'),
+    19: ('ORPC', 'RPC1'),
+    204: ('ODPO', 'DPO1')
+}
+
+DOCUMENT_HEADER = [
+    ('DocEntry', 'INTEGER PRIMARY KEY'),
+    ('DocNum', 'INTEGER'),
+    ('ObjType', 'TEXT'),
+    ('DocType', 'TEXT'),
+    ('CANCELED', 'TEXT'),
+    ('DocStatus', 'TEXT'),
+    ('DocDate', 'TIMESTAMP'),
+    ('DocDueDate', 'TIMESTAMP'),
+    ('CardCode', 'TEXT'),
+    ('CardName', 'TEXT'),
+    ('NumAtCard', 'TEXT'),
+    ('DocCur', 'TEXT'),
+    ('DocTotal', 'NUMERIC'),
+    ('DiscPrcnt', 'NUMERIC'),
+    ('CntctCode', 'INTEGER'),
+    ('TrnspCode', 'INTEGER'),
+    ('PeyMethod', 'TEXT'),
+    ('Address', 'TEXT'),
+    ('Address2', 'TEXT'),
+    ('Comments', 'TEXT'),
+    ('CreateDate', 'TIMESTAMP'),
+    ('UpdateDate', 'TIMESTAMP')
+]
+
+DOCUMENT_LINE = [
+    ('DocEntry', 'INTEGER NOT NULL'),
+    ('LineNum', 'INTEGER NOT NULL'),
+    ('ObjType', 'TEXT'),
+    ('LineStatus', 'TEXT'),
+    ('ItemCode', 'TEXT'),
+    ('Dscription', 'TEXT'),
+    ('Quantity', 'NUMERIC'),
+    ('OpenQty', 'NUMERIC'),
+    ('Price', 'NUMERIC'),
+    ('Currency', 'TEXT'),
+    ('LineTotal', 'NUMERIC'),
+    ('TaxCode', 'TEXT'),
+    ('WhsCode', 'TEXT'),
+    ('BaseType', 'INTEGER'),
+    ('BaseEntry', 'INTEGER'),
+    ('BaseLine', 'INTEGER'),
+    ('TargetType', 'INTEGER'),
+    ('TrgetEntry', 'INTEGER')
+]
+
+DOCUMENT_ADDRESS = [('DocEntry', 'INTEGER PRIMARY KEY'), ('ObjType', 'TEXT')] + [
+    (name + suffix, 'TEXT') for suffix in ('S', 'B')
+    for name in ('Street', 'StreetNo', 'Block', 'Building', 'City', 'ZipCode', 'County', 'State', 'Country')]
+
+TABLES = {
+    'OADM': [('CompnyName', 'TEXT'), ('MainCurncy', 'TEXT')],
+    'OCRD': [('CardCode', 'TEXT PRIMARY KEY'), ('CardName', 'TEXT'), ('CardFName', 'TEXT'),
+             ('CardType', 'TEXT'), ('E_Mail', 'TEXT'), ('Phone1', 'TEXT'), ('CntctPrsn', 'TEXT'),
+             ('ListNum', 'INTEGER'), ('GroupCode', 'INTEGER'), ('DiscRel', 'TEXT'), ('validFor', 'TEXT'),
+             ('frozenFor', 'TEXT'), ('CreateDate', 'TIMESTAMP'), ('UpdateDate', 'TIMESTAMP')],
+    'OCPR': [('CntctCode', 'INTEGER PRIMARY KEY'), ('CardCode', 'TEXT'), ('Name', 'TEXT'),
+             ('FirstName', 'TEXT'), ('LastName', 'TEXT'), ('E_MailL', 'TEXT'), ('Tel1', 'TEXT'),
+             ('Address', 'TEXT'), ('Active', 'TEXT'), ('UpdateDate', 'TIMESTAMP')],
+    'OEXD': [('ExpnsCode', 'INTEGER PRIMARY KEY'), ('ExpnsName', 'TEXT')],
+    'OSHP': [('TrnspCode', 'INTEGER PRIMARY KEY'), ('TrnspName', 'TEXT')],
+    'OPYM': [('PayMethCod', 'TEXT PRIMARY KEY'), ('Descript', 'TEXT'), ('Type', 'TEXT')],
+    'OSTA': [('Code', 'TEXT PRIMARY KEY'), ('Name', 'TEXT'), ('Rate', 'NUMERIC')],
+    'OITM': [('ItemCode', 'TEXT PRIMARY KEY'), ('ItemName', 'TEXT'), ('ItmsGrpCod', 'INTEGER'),
+             ('FirmCode', 'INTEGER'), ('SellItem', 'TEXT'), ('InvntItem', 'TEXT'), ('validFor', 'TEXT'), ('frozenFor', 'TEXT'),
+             ('SalUnitMsr', 'TEXT'), ('OnHand', 'NUMERIC'), ('IsCommited', 'NUMERIC'), ('OnOrder', 'NUMERIC'),
+             ('CreateDate', 'TIMESTAMP'), ('UpdateDate', 'TIMESTAMP')],
+    'ITM1': [('ItemCode', 'TEXT NOT NULL'), ('PriceList', 'INTEGER NOT NULL'), ('Price', 'NUMERIC'),
+             ('Currency', 'TEXT')],
+    'OWHS': [('WhsCode', 'TEXT PRIMARY KEY'), ('WhsName', 'TEXT')],
+    'OITW': [('ItemCode', 'TEXT NOT NULL'), ('WhsCode', 'TEXT NOT NULL'), ('OnHand', 'NUMERIC'),
+             ('IsCommited', 'NUMERIC'), ('OnOrder', 'NUMERIC'), ('MinStock', 'NUMERIC')],
+    'OPLN': [('ListNum', 'INTEGER PRIMARY KEY'), ('ListName', 'TEXT'), ('BASE_NUM', 'INTEGER'),
+             ('Factor', 'NUMERIC')],
+    'OSPP': [('ItemCode', 'TEXT NOT NULL'), ('CardCode', 'TEXT NOT NULL'), ('Price', 'NUMERIC'), ('Currency', 'TEXT'),
+             ('Discount', 'NUMERIC'), ('ListNum', 'INTEGER'), ('AutoUpdt', 'TEXT'), ('Valid', 'TEXT'),
+             ('ValidFrom', 'TIMESTAMP'), ('ValidTo', 'TIMESTAMP')],
+    'SPP1': [('ItemCode', 'TEXT NOT NULL'), ('CardCode', 'TEXT NOT NULL'), ('LINENUM', 'INTEGER NOT NULL'),
+             ('Price', 'NUMERIC'), ('Currency', 'TEXT'), ('Discount', 'NUMERIC'), ('ListNum', 'INTEGER'),
+             ('FromDate', 'TIMESTAMP'), ('ToDate', 'TIMESTAMP')],
+    'SPP2': [('ItemCode', 'TEXT NOT NULL'), ('CardCode', 'TEXT NOT NULL'), ('SPP1LNum', 'INTEGER NOT NULL'),
+             ('SPP2LNum', 'INTEGER NOT NULL'), ('Amount', 'NUMERIC'), ('Price', 'NUMERIC'), ('Currency', 'TEXT'),
+             ('Discount', 'NUMERIC')],
+    'OEDG': [('AbsEntry', 'INTEGER PRIMARY KEY'), ('Type', 'TEXT'), ('ObjType', 'TEXT'), ('ObjCode', 'TEXT'),
+             ('ValidFor', 'TEXT'), ('ValidFrom', 'TIMESTAMP'), ('ValidTo', 'TIMESTAMP')],
+    'EDG1': [('AbsEntry', 'INTEGER NOT NULL'), ('ObjType', 'TEXT NOT NULL'), ('ObjKey', 'TEXT NOT NULL'),
+             ('DiscType', 'TEXT'), ('Discount', 'NUMERIC')]
+}
+
+for _header, _line in DOCUMENT_TABLES.values():
+    TABLES[_header] = DOCUMENT_HEADER
+    TABLES[_line] = DOCUMENT_LINE
+    TABLES[_line[0:-1] + '12'] = DOCUMENT_ADDRESS
+
+PRIMARY_KEYS = dict((line, ('DocEntry', 'LineNum')) for header, line in DOCUMENT_TABLES.values())
+PRIMARY_KEYS['ITM1'] = ('ItemCode', 'PriceList')
+PRIMARY_KEYS['OITW'] = ('ItemCode', 'WhsCode')
+PRIMARY_KEYS['OSPP'] = ('ItemCode', 'CardCode')
+PRIMARY_KEYS['SPP1'] = ('ItemCode', 'CardCode', 'LINENUM')
+PRIMARY_KEYS['SPP2'] = ('ItemCode', 'CardCode', 'SPP1LNum', 'SPP2LNum')
+PRIMARY_KEYS['EDG1'] = ('AbsEntry', 'ObjType', 'ObjKey')
+
+INDEXES = [
+    ('OCPR', ('CardCode',)),
+    ('ORDR', ('NumAtCard',)),
+    ('ORDR', ('CardCode',)),
+    ('DLN1', ('BaseType', 'BaseEntry')),
+    ('INV1', ('BaseType', 'BaseEntry')),
+    ('DPI1', ('BaseType', 'BaseEntry'))
+]
+
+
+def connect(server=None, user=None, password=None, database=None, *args, **kwargs):
+    """Open the SQLite file given as database; the server and credentials are ignored.
+    """
+    return Connection(database or kwargs.get('database') or ':memory:')
+
+
+def createSchema(conn):
+    """Create the B1 tables and indexes on a sqlite3 connection.
+    """
+    for table, columns in sorted(TABLES.items()):
+        definition = ", ".join(["{0} {1}".format(name, type) for name, type in columns])
+        if table in PRIMARY_KEYS:
+            definition = definition + ", PRIMARY KEY ({0})".format(", ".join(PRIMARY_KEYS[table]))
+        conn.execute("CREATE TABLE IF NOT EXISTS {0} ({1})".format(table, definition))
+    for table, columns in INDEXES:
+        conn.execute("CREATE INDEX IF NOT EXISTS IX_{0}_{1} ON {0} ({2})".format(
+            table, "_".join(columns), ", ".join(columns)))
+    conn.commit()
+
+
+def _insert(conn, table, rows, batch=10000):
+    columns = [name for name, type in TABLES[table]]
+    sql = "INSERT INTO {0} ({1}) VALUES ({2})".format(table, ", ".join(columns), ", ".join(['?'] * len(columns)))
+    chunk = []
+    for row in rows:
+        chunk.append([row.get(column) for column in columns])
+        if len(chunk) >= batch:
+            conn.executemany(sql, chunk)
+            chunk = []
+    if chunk:
+        conn.executemany(sql, chunk)
+
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda',
+               'William', 'Elizabeth', 'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas']
+STREETS = ['Main St', 'Oak Ave', 'Pine Rd', 'Maple Dr', 'Cedar Ln', 'Elm St', 'Park Blvd', 'Lake Rd']
+CITIES = [('Austin', 'TX', '78701'), ('Denver', 'CO', '80202'), ('Seattle', 'WA', '98101'),
+          ('Boston', 'MA', '02108'), ('Miami', 'FL', '33101'), ('Chicago', 'IL', '60601')]
+TAX_CODES = [('EX', 'Exempt', 0.0), ('TX', 'Texas', 8.25), ('CO', 'Colorado', 2.9),
+             ('WA', 'Washington', 6.5), ('MA', 'Massachusetts', 6.25), ('FL', 'Florida', 6.0),
+             ('IL', 'Illinois', 6.25)]
+
+
+def generate(path, orders=10000, customers=None, items=5000, maxLines=8, deliveredRatio=0.7,
+             invoicedRatio=0.8, downPaymentRatio=0.05, seed=1, start=datetime.datetime(2015, 1, 1)):
+    """Create a synthetic B1 company database in the SQLite file at path.
+
+    orders: number of sales orders (ORDR/RDR1); about deliveredRatio of
+    them get a delivery (ODLN/DLN1) whose lines are based on the order lines,
+    about invoicedRatio of the deliveries an invoice (OINV/INV1) based on the
+    delivery and about downPaymentRatio of the orders a down payment (ODPI/DPI1).
+    """
+    rnd = random.Random(seed)
+    customers = customers or max(1, orders // 10)
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    createSchema(conn)
+    now = start
+
+    _insert(conn, 'OADM', [{'CompnyName': 'Synthetic Company', 'MainCurncy': 'USD'}])
+    _insert(conn, 'OEXD', [{'ExpnsCode': 1, 'ExpnsName': 'Freight'},
+                           {'ExpnsCode': 2, 'ExpnsName': 'Insurance'},
+                           {'ExpnsCode': 3, 'ExpnsName': 'Handling'}])
+    _insert(conn, 'OSHP', [{'TrnspCode': i + 1, 'TrnspName': name} for i, name in
+                           enumerate(['UPS Ground', 'UPS 2nd Day Air', 'FedEx Ground', 'USPS Priority', 'Pickup'])])
+    _insert(conn, 'OPYM', [{'PayMethCod': code, 'Descript': code, 'Type': 'I'} for code in
+                           ['CREDITCARD', 'PAYPAL', 'CHECK', 'WIRE']])
+    _insert(conn, 'OSTA', [{'Code': code, 'Name': name, 'Rate': rate} for code, name, rate in TAX_CODES])
+
+    def customer(i):
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        updated = start + datetime.timedelta(days=rnd.randint(0, 3000))
+        return {
+            'CardCode': 'C{0:07d}'.format(i), 'CardName': first + ' ' + last, 'CardFName': str(i),
+            'CardType': 'C', 'E_Mail': '{0}.{1}{2}@example.com'.format(first, last, i).lower(),
+            'Phone1': '555{0:07d}'.format(i), 'CntctPrsn': first + ' ' + last,
+            'ListNum': 2 if i % 10 == 0 else 1, 'GroupCode': 100 + i % 3, 'DiscRel': 'L',
+            'validFor': 'Y', 'frozenFor': 'N', 'CreateDate': start, 'UpdateDate': updated
+        }
+    bps = [customer(i) for i in range(1, customers + 1)]
+    _insert(conn, 'OCRD', bps)
+    _insert(conn, 'OCPR', ({
+        'CntctCode': i + 1, 'CardCode': bp['CardCode'], 'Name': bp['CntctPrsn'],
+        'FirstName': bp['CntctPrsn'].split(' ')[0], 'LastName': bp['CntctPrsn'].split(' ')[1],
+        'E_MailL': bp['E_Mail'], 'Tel1': bp['Phone1'], 'Address': rnd.choice(STREETS),
+        'Active': 'Y', 'UpdateDate': bp['UpdateDate']
+    } for i, bp in enumerate(bps)))
+
+    itemCodes = ['A{0:05d}'.format(i) for i in range(1, items + 1)]
+    prices = dict((code, round(rnd.uniform(1, 500), 2)) for code in itemCodes)
+    _insert(conn, 'OPLN', [{'ListNum': 1, 'ListName': 'Retail', 'BASE_NUM': 1, 'Factor': 1},
+                           {'ListNum': 2, 'ListName': 'Wholesale', 'BASE_NUM': 1, 'Factor': 0.8}])
+    _insert(conn, 'OITM', ({
+        'ItemCode': code, 'ItemName': 'Item ' + code, 'ItmsGrpCod': 100 + rnd.randint(1, 10),
+        'FirmCode': rnd.randint(1, 5), 'SellItem': 'Y',
+        'InvntItem': 'Y', 'validFor': 'N' if rnd.random() < 0.02 else 'Y',
+        'frozenFor': 'Y' if rnd.random() < 0.01 else 'N', 'SalUnitMsr': 'EA', 'OnHand': 0, 'IsCommited': 0,
+        'OnOrder': 0, 'CreateDate': start, 'UpdateDate': start + datetime.timedelta(days=rnd.randint(0, 3000))
+    } for code in itemCodes))
+    warehouses = ['01', '02', '03']
+    _insert(conn, 'OWHS', [{'WhsCode': code, 'WhsName': 'Warehouse ' + code} for code in warehouses])
+    _insert(conn, 'OITW', ({'ItemCode': code, 'WhsCode': whsCode, 'OnHand': rnd.randint(0, 500),
+                            'IsCommited': rnd.randint(0, 50), 'OnOrder': rnd.choice([0, 0, 0, 100]), 'MinStock': 10}
+                           for code in itemCodes for whsCode in warehouses))
+    _insert(conn, 'ITM1', ({'ItemCode': code, 'PriceList': priceList, 'Price': round(prices[code] * factor, 2),
+                            'Currency': 'USD'}
+                           for code in itemCodes for priceList, factor in ((1, 1), (2, 0.8))))
+
+    # Special prices of a few customers and of the retail price list ('*1'), the
+    # latter with a yearly period and volume breaks; discount groups for all
+    # business partners, for customer group 101 and for the first customer.
+    specials = [(bp['CardCode'], code) for bp in bps[::50] for code in rnd.sample(itemCodes, min(5, len(itemCodes)))]
+    specials.extend(('*1', code) for code in itemCodes[::20])
+    year = datetime.date.today().year
+    _insert(conn, 'OSPP', ({'ItemCode': code, 'CardCode': cardCode, 'Price': round(prices[code] * 0.9, 2),
+                            'Currency': 'USD', 'Discount': 10, 'ListNum': 1, 'AutoUpdt': 'N', 'Valid': 'Y'}
+                           for cardCode, code in specials))
+    _insert(conn, 'SPP1', ({'ItemCode': code, 'CardCode': '*1', 'LINENUM': 0, 'Price': round(prices[code] * 0.95, 2),
+                            'Currency': 'USD', 'Discount': 5, 'ListNum': 1,
+                            'FromDate': datetime.datetime(year, 1, 1), 'ToDate': datetime.datetime(year, 12, 31)}
+                           for code in itemCodes[::20]))
+    _insert(conn, 'SPP2', ({'ItemCode': code, 'CardCode': '*1', 'SPP1LNum': 0, 'SPP2LNum': n, 'Amount': amount,
+                            'Price': round(prices[code] * (1 - discount / 100.0), 2), 'Currency': 'USD',
+                            'Discount': discount}
+                           for code in itemCodes[::20] for n, (amount, discount) in enumerate(((10, 10), (100, 20)))))
+    _insert(conn, 'OEDG', [{'AbsEntry': 1, 'Type': 'A', 'ObjType': '2', 'ObjCode': '0', 'ValidFor': 'Y'},
+                           {'AbsEntry': 2, 'Type': 'C', 'ObjType': '10', 'ObjCode': '101', 'ValidFor': 'Y'},
+                           {'AbsEntry': 3, 'Type': 'S', 'ObjType': '2', 'ObjCode': bps[0]['CardCode'],
+                            'ValidFor': 'Y'}])
+    _insert(conn, 'EDG1', [{'AbsEntry': 1, 'ObjType': '52', 'ObjKey': '101', 'DiscType': 'D', 'Discount': 5},
+                           {'AbsEntry': 2, 'ObjType': '52', 'ObjKey': '102', 'DiscType': 'D', 'Discount': 8},
+                           {'AbsEntry': 2, 'ObjType': '43', 'ObjKey': '1', 'DiscType': 'D', 'Discount': 3},
+                           {'AbsEntry': 3, 'ObjType': '4', 'ObjKey': itemCodes[1], 'DiscType': 'D',
+                            'Discount': 15}])
+
+    rows = dict((table, []) for table in ('ORDR', 'RDR1', 'RDR12', 'ODLN', 'DLN1', 'DLN12', 'OINV', 'INV1',
+                                          'INV12', 'ODPI', 'DPI1', 'DPI12'))
+    ordersHeader, ordersLines, deliveriesHeader, deliveriesLines = rows['ORDR'], rows['RDR1'], rows['ODLN'], rows['DLN1']
+    entries = {'ODLN': 0, 'OINV': 0, 'ODPI': 0}
+
+    def flush():
+        for table in sorted(rows):
+            _insert(conn, table, rows[table])
+            del rows[table][:]
+        conn.commit()
+
+    def target(header, lines, table, lineTable, objType, baseType, date, **values):
+        # Copy a document as a target document whose lines are based on its lines.
+        entries[table] = entries[table] + 1
+        docEntry = entries[table]
+        rows[table].append(dict(header, DocEntry=docEntry, DocNum=docEntry, ObjType=str(objType), DocDate=date,
+                                DocDueDate=date, CreateDate=date, UpdateDate=date, **values))
+        rows[lineTable[0:-1] + '12'].append(dict(rows['RDR12'][-1], DocEntry=docEntry, ObjType=str(objType)))
+        for line in lines:
+            rows[lineTable].append(dict(line, DocEntry=docEntry, ObjType=str(objType), BaseType=baseType,
+                                        BaseEntry=header['DocEntry'], BaseLine=line['LineNum'], TargetType=-1,
+                                        TrgetEntry=None, OpenQty=0))
+        return docEntry
+
+    for docEntry in range(1, orders + 1):
+        bp = bps[rnd.randrange(customers)]
+        docDate = start + datetime.timedelta(minutes=docEntry * 3 + rnd.randint(0, 2))
+        city, state, zipcode = rnd.choice(CITIES)
+        street, streetNo = rnd.choice(STREETS), str(rnd.randint(1, 9999))
+        delivered = rnd.random() < deliveredRatio
+        lines = []
+        for lineNum in range(rnd.randint(1, maxLines)):
+            itemCode = rnd.choice(itemCodes)
+            quantity = rnd.randint(1, 10)
+            lines.append({
+                'DocEntry': docEntry, 'LineNum': lineNum, 'ObjType': '17',
+                'LineStatus': 'C' if delivered else 'O', 'ItemCode': itemCode,
+                'Dscription': 'Item ' + itemCode, 'Quantity': quantity,
+                'OpenQty': 0 if delivered else quantity, 'Price': prices[itemCode], 'Currency': 'USD',
+                'LineTotal': round(prices[itemCode] * quantity, 2), 'TaxCode': state, 'WhsCode': '01',
+                'BaseType': -1, 'TargetType': 15 if delivered else -1
+            })
+        header = {
+            'DocEntry': docEntry, 'DocNum': docEntry, 'ObjType': '17', 'DocType': 'I', 'CANCELED': 'N',
+            'DocStatus': 'C' if delivered else 'O', 'DocDate': docDate,
+            'DocDueDate': docDate + datetime.timedelta(days=3), 'CardCode': bp['CardCode'],
+            'CardName': bp['CardName'], 'NumAtCard': str(100000000 + docEntry), 'DocCur': 'USD',
+            'DocTotal': round(sum(line['LineTotal'] for line in lines), 2), 'DiscPrcnt': 0,
+            'CntctCode': None, 'TrnspCode': rnd.randint(1, 5), 'PeyMethod': 'CREDITCARD',
+            'Address': '{0} {1}\n{2}, {3} {4}'.format(streetNo, street, city, state, zipcode),
+            'Address2': '{0} {1}\n{2}, {3} {4}'.format(streetNo, street, city, state, zipcode),
+            'Comments': 'Web order', 'CreateDate': docDate, 'UpdateDate': docDate
+        }
+        ordersHeader.append(header)
+        ordersLines.extend(lines)
+        address = {'DocEntry': docEntry, 'ObjType': '17'}
+        for suffix in ('S', 'B'):
+            address.update({'Street' + suffix: street, 'StreetNo' + suffix: streetNo, 'City' + suffix: city,
+                            'ZipCode' + suffix: zipcode, 'State' + suffix: state, 'Country' + suffix: 'US'})
+        rows['RDR12'].append(address)
+        if rnd.random() < downPaymentRatio:
+            target(header, lines, 'ODPI', 'DPI1', 203, 17, docDate, DocStatus='C')
+        if delivered:
+            shipped = docDate + datetime.timedelta(days=rnd.randint(1, 5))
+            header['UpdateDate'] = shipped
+            deliveryEntry = target(dict(header, DocStatus='O'), lines, 'ODLN', 'DLN1', 15, 17, shipped)
+            for line in lines:
+                line['TrgetEntry'] = deliveryEntry
+            if rnd.random() < invoicedRatio:
+                delivery, deliveryLines = deliveriesHeader[-1], deliveriesLines[-len(lines):]
+                delivery['DocStatus'] = 'C'
+                invoiced = shipped + datetime.timedelta(days=rnd.randint(0, 2))
+                target(delivery, deliveryLines, 'OINV', 'INV1', 13, 15, invoiced)
+                for line in deliveryLines:
+                    line['TargetType'], line['TrgetEntry'] = 13, entries['OINV']
+        if len(ordersHeader) >= 10000:
+            flush()
+    flush()
+    conn.close()
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate a synthetic SAP B1 company database in SQLite.")
+    parser.add_argument('path')
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=None)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    generate(args.path, orders=args.orders, customers=args.customers, items=args.items, seed=args.seed)
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+
+
+class OrderIndex(object):
+    """Local index of front-end order ids to SAP B1 DocEntry.
+
+    The index is persisted in a SQLite file so it survives restarts and is
+    shared by every worker process pointing at the same path.  Entries are
+    keyed by the company database as well, so companies sharing a file do not
+    resolve each other's orders.
+    """
+    def __init__(self, path=':memory:', companyDb=''):
+        self._path = path
+        self._companyDb = companyDb
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(orderindex)")]
+        if columns and 'company_db' not in columns:
+            # Entries of files written before the company was recorded cannot be
+            # attributed to one: drop them, misses are resolved again by SQL.
+            self._conn.execute("DROP TABLE orderindex")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS orderindex (
+                                company_db TEXT NOT NULL,
+                                field TEXT NOT NULL,
+                                fe_order_id TEXT NOT NULL,
+                                doc_entry TEXT NOT NULL,
+                                PRIMARY KEY (company_db, field, fe_order_id))""")
+        self._conn.commit()
+
+    @property
+    def path(self):
+        """Path of the SQLite file.
+        """
+        return self._path
+
+    @property
+    def companyDb(self):
+        """Company database the entries belong to.
+        """
+        return self._companyDb
+
+    def get(self, field, feOrderId):
+        """Retrieve the DocEntry for a front-end order id, None on miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_entry FROM orderindex WHERE company_db = ? AND field = ? AND fe_order_id = ?",
+                (self._companyDb, field, str(feOrderId))).fetchone()
+        if row is None:
+            return None
+        return str(row[0])
+
+    def put(self, field, feOrderId, docEntry):
+        """Record the DocEntry for a front-end order id.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO orderindex (company_db, field, fe_order_id, doc_entry) VALUES (?, ?, ?, ?)",
+                (self._companyDb, field, str(feOrderId), str(docEntry)))
+            self._conn.commit()
+
+    def putMany(self, field, docEntries):
+        """Record a dict of front-end order ids to DocEntry in one transaction.
+        """
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO orderindex (company_db, field, fe_order_id, doc_entry) VALUES (?, ?, ?, ?)",
+                [(self._companyDb, field, str(feOrderId), str(docEntry))
+                 for feOrderId, docEntry in docEntries.items()])
+            self._conn.commit()
+
+    def remove(self, field, feOrderId):
+        """Drop a front-end order id from the index.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM orderindex WHERE company_db = ? AND field = ? AND fe_order_id = ?",
+                (self._companyDb, field, str(feOrderId)))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,181 @@
+import datetime
+import decimal
+
+from .snapshots import Snapshot
+
+PRECISION = decimal.Decimal('0.000001')
+HUNDRED = decimal.Decimal(100)
+
+
+def _decimal(value):
+    if value is None:
+        return None
+    return decimal.Decimal(str(value))
+
+
+def _day(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _valid(date, validFrom, validTo):
+    return (validFrom is None or validFrom <= date) and (validTo is None or date <= validTo)
+
+
+def _combine(discounts, relation):
+    """Discount of several applicable discount group lines by the DiscRel of the business partner:
+    L(owest), H(ighest), A(verage), S(um) or M(ultiplied).
+    """
+    if relation == 'H':
+        return max(discounts)
+    if relation == 'A':
+        return sum(discounts) / len(discounts)
+    if relation == 'S':
+        return min(HUNDRED, sum(discounts))
+    if relation == 'M':
+        remaining = decimal.Decimal(1)
+        for discount in discounts:
+            remaining = remaining * (1 - discount / HUNDRED)
+        return (1 - remaining) * HUNDRED
+    return min(discounts)
+
+
+class PriceSnapshot(Snapshot):
+    """Price lists (ITM1), special prices (OSPP) with their periods (SPP1) and
+    volume breaks (SPP2), and discount groups (OEDG, EDG1), reloaded in full
+    every interval seconds (loaded once if interval is 0 or None), to price
+    items like B1 does without a query.
+
+    Fetched rows carry the table they come from in Source.  price() follows
+    B1's order: special prices of the customer, discount groups of the
+    customer, of its customer group and of all business partners, period and
+    volume discounts of its price list (CardCode '*ListNum'), then the price
+    list price.
+    """
+    def __init__(self, interval=300):
+        super(PriceSnapshot, self).__init__(interval)
+        self._clear()
+
+    def _clear(self):
+        self._partners = {}
+        self._items = {}
+        self._prices = {}
+        self._specials = {}
+        self._periods = {}
+        self._breaks = {}
+        self._groups = {}
+        self._groupLines = {}
+
+    def stale(self):
+        if not self.interval:
+            return self._refreshed is None
+        return super(PriceSnapshot, self).stale()
+
+    def _apply(self, row):
+        source = row['Source']
+        if source == 'OCRD':
+            self._partners[row['CardCode']] = (row['ListNum'], row['GroupCode'], row['DiscRel'])
+        elif source == 'OITM':
+            self._items[row['ItemCode']] = (row['ItmsGrpCod'], row['FirmCode'])
+        elif source == 'ITM1':
+            self._prices.setdefault(row['ItemCode'], {})[row['PriceList']] = (_decimal(row['Price']), row['Currency'])
+        elif source == 'OSPP':
+            if row['Valid'] != 'N':
+                self._specials[(row['CardCode'], row['ItemCode'])] = (
+                    _decimal(row['Price']), row['Currency'], _decimal(row['Discount']), row['ListNum'],
+                    row['AutoUpdt'] == 'Y', _day(row['ValidFrom']), _day(row['ValidTo']))
+        elif source == 'SPP1':
+            periods = self._periods.setdefault((row['CardCode'], row['ItemCode']), [])
+            periods.append((row['LINENUM'], _decimal(row['Price']), row['Currency'], _decimal(row['Discount']),
+                            _day(row['FromDate']), _day(row['ToDate'])))
+            periods.sort()
+        elif source == 'SPP2':
+            breaks = self._breaks.setdefault((row['CardCode'], row['ItemCode'], row['SPP1LNum']), [])
+            breaks.append((_decimal(row['Amount']), _decimal(row['Price']), row['Currency'], _decimal(row['Discount'])))
+            breaks.sort()
+        elif source == 'OEDG':
+            self._groups[row['AbsEntry']] = (row['Type'], str(row['ObjCode']), _day(row['ValidFrom']),
+                                             _day(row['ValidTo']))
+        elif source == 'EDG1':
+            lines = self._groupLines.setdefault(row['AbsEntry'], {})
+            lines[(str(row['ObjType']), str(row['ObjKey']))] = _decimal(row['Discount'])
+
+    def _special(self, owner, itemCode, quantity, date):
+        special = self._specials.get((owner, itemCode))
+        if special is None:
+            return None
+        price, currency, discount, listNum, autoUpdate, validFrom, validTo = special
+        if not _valid(date, validFrom, validTo):
+            return None
+        source = 'special price'
+        for lineNum, periodPrice, periodCurrency, periodDiscount, fromDate, toDate in \
+                self._periods.get((owner, itemCode), ()):
+            if _valid(date, fromDate, toDate):
+                price, currency, discount, source = periodPrice, periodCurrency, periodDiscount, 'period discount'
+                for amount, breakPrice, breakCurrency, breakDiscount in \
+                        self._breaks.get((owner, itemCode, lineNum), ()):
+                    if amount > quantity:
+                        break
+                    price, currency, discount, source = breakPrice, breakCurrency, breakDiscount, 'volume discount'
+                break
+        if autoUpdate and discount is not None:
+            base = self._prices.get(itemCode, {}).get(listNum)
+            if base is not None and base[0] is not None:
+                price, currency = base[0] * (1 - discount / HUNDRED), base[1]
+        return price, currency, discount, source
+
+    def _groupDiscount(self, cardCode, partner, itemCode, date):
+        itemGroup, manufacturer = self._items.get(itemCode, (None, None))
+        keys = [('4', itemCode), ('52', str(itemGroup)), ('43', str(manufacturer))]
+        levels = {}
+        for absEntry, (type, objCode, validFrom, validTo) in self._groups.items():
+            if not _valid(date, validFrom, validTo):
+                continue
+            if (type == 'S' and objCode == cardCode) or (type == 'C' and objCode == str(partner[1])) or type == 'A':
+                lines = self._groupLines.get(absEntry, {})
+                levels.setdefault(type, []).extend(lines[key] for key in keys if lines.get(key) is not None)
+        for type in ('S', 'C', 'A'):
+            if levels.get(type):
+                return _combine(levels[type], partner[2])
+        return None
+
+    def price(self, cardCode, itemCode, quantity=1, date=None):
+        """Unit price of an item for a customer, quantity and date (today by default) as a dict
+        with Price, Currency, Discount (percent off the list price), ListPrice, PriceList and
+        Source; None if the customer is unknown or the item has no price.
+        """
+        quantity = _decimal(quantity)
+        date = _day(date or datetime.date.today())
+        with self._lock:
+            partner = self._partners.get(cardCode)
+            if partner is None:
+                return None
+            listNum = partner[0]
+            listPrice, listCurrency = self._prices.get(itemCode, {}).get(listNum, (None, None))
+            result = self._special(cardCode, itemCode, quantity, date)
+            if result is None and listPrice is not None:
+                discount = self._groupDiscount(cardCode, partner, itemCode, date)
+                if discount is not None:
+                    result = listPrice * (1 - discount / HUNDRED), listCurrency, discount, 'discount group'
+            if result is None:
+                result = self._special('*{0}'.format(listNum), itemCode, quantity, date)
+            if result is None and listPrice is not None:
+                result = listPrice, listCurrency, decimal.Decimal(0), 'price list'
+        if result is None or result[0] is None:
+            return None
+        price, currency, discount, source = result
+        if listPrice:
+            discount = (1 - price / listPrice) * HUNDRED
+        return {
+            'Price': price.quantize(PRECISION),
+            'Currency': currency,
+            'Discount': None if discount is None else discount.quantize(PRECISION),
+            'ListPrice': listPrice,
+            'PriceList': listNum,
+            'Source': source
+        }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._prices)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import threading
+
+from .slowlog import DEFAULT_REDACT, isEmail, sensitive
+
+
+def pseudonym(value):
+    """Stable stand-in for a personal value keeping its shape, so that
+    replayed payloads still match each other (same email, same contact).
+    """
+    digest = hashlib.md5(str(value).encode('utf-8')).hexdigest()[0:10]
+    if '@' in str(value):
+        return "{0}@example.invalid".format(digest)
+    return "x{0}".format(digest)
+
+
+def sanitize(value, patterns=DEFAULT_REDACT):
+    """Copy of value with the string values of dict keys matching any of
+    the patterns (see slowlog.sensitive) and e-mail addresses, such as a
+    positional email argument, replaced by pseudonyms, recursing into dicts
+    and lists.
+    """
+    if isinstance(value, dict):
+        data = {}
+        for k, v in value.items():
+            if v and not isinstance(v, (dict, list, tuple)) and sensitive(k, patterns):
+                data[k] = pseudonym(v)
+            else:
+                data[k] = sanitize(v, patterns)
+        return data
+    if isinstance(value, (list, tuple)):
+        return [sanitize(v, patterns) for v in value]
+    if isEmail(value):
+        return pseudonym(value)
+    return value
+
+
+class Recorder(object):
+    """Append-only JSON lines log of adaptor method calls for replay.
+
+    Each line holds the start time, method, sanitized args and kwargs,
+    elapsed seconds and whether the call raised.
+    """
+    def __init__(self, path, patterns=DEFAULT_REDACT):
+        self.path = path
+        self.patterns = patterns
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def record(self, method, args, kwargs, started, elapsed, error=False):
+        line = json.dumps({
+            'time': started,
+            'method': method,
+            'args': sanitize(list(args), self.patterns),
+            'kwargs': sanitize(kwargs, self.patterns),
+            'elapsed': elapsed,
+            'error': error
+        }, default=str, sort_keys=True)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load(path):
+    """Recorded calls of a recorder log, oldest first.
+    """
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return sorted(records, key=lambda record: record['time'])
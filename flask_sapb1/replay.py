@@ -0,0 +1,201 @@
+"""Replay calls recorded with RECORD concurrently against the local stand-ins.
+
+    python -m flask_sapb1.replay calls.jsonl --workers 8 --speed 2
+    python -m flask_sapb1.replay calls.jsonl --rate 50 --output replay.json
+
+Calls are issued at their recorded pace scaled by --speed, or at a fixed
+--rate per second, each in its own app context, and latency percentiles and
+throughput are reported per method.  Latency is measured from the time a
+call was due, so time spent waiting for a free worker is included.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import SAPbobsCOMFake
+from . import mssqlfake
+from .benchmark import makeApp
+from .recorder import load
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _rewrite(value, key, rewrite):
+    if isinstance(value, dict):
+        return dict((k, rewrite(v) if k == key else _rewrite(v, key, rewrite)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_rewrite(v, key, rewrite) for v in value]
+    return value
+
+
+def prepare(records, path, run=None):
+    """Adapt recorded calls to the synthetic company database at path: card
+    codes unknown to it are mapped onto its customers, and front-end order
+    ids are suffixed with run so that inserts are not answered as duplicates.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        cardCodes = [row[0] for row in conn.execute("SELECT CardCode FROM OCRD ORDER BY CardCode")]
+    finally:
+        conn.close()
+    known = set(cardCodes)
+
+    def cardCode(value):
+        if value in known or not cardCodes:
+            return value
+        digest = int(hashlib.md5(str(value).encode('utf-8')).hexdigest(), 16)
+        return cardCodes[digest % len(cardCodes)]
+
+    prepared = []
+    for record in records:
+        call = {'args': record['args'], 'kwargs': record['kwargs']}
+        call = _rewrite(call, 'card_code', cardCode)
+        call = _rewrite(call, 'cardCode', cardCode)
+        if run is not None:
+            call = _rewrite(call, 'fe_order_id', lambda value: "{0}-{1}".format(value, run))
+        prepared.append(dict(record, args=call['args'], kwargs=call['kwargs']))
+    return prepared
+
+
+def schedule(records, speed=1.0, rate=None):
+    """Offsets in seconds from the start at which each record is due.
+    """
+    if rate:
+        return [i / float(rate) for i in range(len(records))]
+    if not records:
+        return []
+    first = records[0]['time']
+    return [(record['time'] - first) / speed for record in records]
+
+
+class Replay(object):
+    """Issues recorded calls on a pool of worker threads and collects
+    (method, latency, error) results.
+    """
+    def __init__(self, app, ext, workers=4):
+        self.app = app
+        self.ext = ext
+        self.workers = workers
+        self.results = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            due, record = item
+            error = None
+            with self.app.app_context():
+                try:
+                    getattr(self.ext, record['method'])(*record['args'], **record['kwargs'])
+                except Exception as e:
+                    error = str(e)
+            latency = time.time() - due
+            with self._lock:
+                self.results.append((record['method'], latency, error))
+
+    def run(self, records, offsets):
+        threads = [threading.Thread(target=self._work) for i in range(self.workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        start = time.time()
+        for record, offset in zip(records, offsets):
+            due = start + offset
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._queue.put((due, record))
+        for thread in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+
+def report(results, elapsed):
+    """Latency percentiles, throughput and errors per method.
+    """
+    methods = {}
+    for method, latency, error in results:
+        stats = methods.setdefault(method, {'latencies': [], 'errors': 0, 'error': None})
+        stats['latencies'].append(latency)
+        if error is not None:
+            stats['errors'] = stats['errors'] + 1
+            stats['error'] = error
+    summary = {}
+    for method, stats in methods.items():
+        latencies = stats['latencies']
+        summary[method] = {
+            'calls': len(latencies),
+            'errors': stats['errors'],
+            'lastError': stats['error'],
+            'throughput': len(latencies) / elapsed if elapsed else None,
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies)
+        }
+    return {'elapsed': elapsed, 'calls': len(results), 'methods': summary}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded Flask-SAPB1 calls against the local stand-ins.")
+    parser.add_argument('record', help="JSON lines written by the RECORD setting")
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'sapb1-benchmark.db'),
+                        help="SQLite company database, generated if missing")
+    parser.add_argument('--generate', type=int, default=100000, help="orders to generate in a new database")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed relative to the recording")
+    parser.add_argument('--rate', type=float, default=None, help="fixed calls per second instead of the recorded pace")
+    parser.add_argument('--methods', default=None, help="comma separated methods to replay")
+    parser.add_argument('--com-latency', type=float, default=0.0, help="seconds injected per fake COM call")
+    parser.add_argument('--sessions', type=int, default=None, help="DISESSIONS of the replayed app")
+    parser.add_argument('--output', help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        mssqlfake.generate(args.database, orders=args.generate)
+    SAPbobsCOMFake.setLatency(call=args.com_latency, property=args.com_latency)
+    records = load(args.record)
+    if args.methods:
+        methods = args.methods.split(',')
+        records = [record for record in records if record['method'] in methods]
+    records = prepare(records, args.database, run=int(time.time()))
+    app, ext = makeApp(args.database, DISESSIONS=args.sessions)
+    replay = Replay(app, ext, workers=args.workers)
+    elapsed = replay.run(records, schedule(records, speed=args.speed, rate=args.rate))
+    summary = report(replay.results, elapsed)
+
+    print("{0:24} {1:>7} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}".format(
+        'method', 'calls', 'errors', 'calls/s', 'p50', 'p90', 'p99', 'max'))
+    for method, stats in sorted(summary['methods'].items()):
+        print("{0:24} {1:>7} {2:>7} {3:>9.2f} {4:>9.4f} {5:>9.4f} {6:>9.4f} {7:>9.4f}".format(
+            method, stats['calls'], stats['errors'], stats['throughput'],
+            stats['p50'], stats['p90'], stats['p99'], stats['max']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
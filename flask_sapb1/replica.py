@@ -0,0 +1,449 @@
+import datetime
+import decimal
+import numbers
+import re
+import sqlite3
+import threading
+from time import time
+
+# Tables replicated by default: documents and master data read by the storefront.
+DEFAULT_TABLES = ['ORDR', 'RDR1', 'RDR12', 'ODLN', 'DLN1', 'DLN12', 'OINV', 'INV1', 'INV12',
+                  'OCRD', 'OCPR', 'OITM', 'ITM1']
+
+# Key columns of the replicated tables; document tables are recognized by name.
+KEYS = {
+    'OCRD': ('CardCode',),
+    'OCPR': ('CntctCode',),
+    'OITM': ('ItemCode',),
+    'ITM1': ('ItemCode', 'PriceList'),
+    'OITW': ('ItemCode', 'WhsCode'),
+    'OWHS': ('WhsCode',)
+}
+
+# Decimal columns are declared DECTEXT: stored as text (TEXT affinity) and read back
+# as Decimal, so replica reads return the same values as pymssql.
+sqlite3.register_converter('DECTEXT', lambda value: decimal.Decimal(value.decode('ascii')))
+
+# Tables without UpdateDate, pulled with the rows of their parent: (parent table, join column).
+CHILDREN = {
+    'ITM1': ('OITM', 'ItemCode'),
+    'OITW': ('OITM', 'ItemCode')
+}
+
+# Master data tables whose rows can be deleted in B1 (documents are only closed or
+# cancelled): their keys are reconciled with SQL Server every reconcileInterval seconds.
+DELETABLE = ('OCRD', 'OCPR', 'OITM', 'ITM1', 'OITW', 'OWHS')
+
+
+def keys(table):
+    if table in KEYS:
+        return KEYS[table]
+    if table.endswith('12'):
+        return ('DocEntry',)
+    if table[-1:] == '1' and len(table) == 4:
+        return ('DocEntry', 'LineNum')
+    return ('DocEntry',)
+
+
+def parent(table):
+    """(parent table, join column) of a table pulled with its parent, None if it has UpdateDate.
+    """
+    if table in CHILDREN:
+        return CHILDREN[table]
+    if table.endswith('12') and len(table) == 5:
+        return 'O' + table[0:3], 'DocEntry'
+    if table[-1:] == '1' and len(table) == 4 and table not in KEYS:
+        return 'O' + table[0:3], 'DocEntry'
+    return None
+
+
+def _declaredType(value):
+    if isinstance(value, datetime.datetime):
+        return 'TIMESTAMP'
+    if isinstance(value, numbers.Integral):
+        return 'INTEGER'
+    if isinstance(value, decimal.Decimal):
+        return 'DECTEXT'
+    if isinstance(value, float):
+        return 'NUMERIC'
+    return 'TEXT'
+
+
+class Error(Exception):
+    pass
+
+
+class OperationalError(Error):
+    pass
+
+
+_top = re.compile(r"^\s*SELECT\s+(DISTINCT\s+)?TOP\s*\(?\s*(\d+)\s*\)?\s+", re.I)
+_dbo = re.compile(r"\bdbo\.", re.I)
+_nolock = re.compile(r"\bWITH\s*\(\s*NOLOCK\s*\)", re.I)
+_named = re.compile(r"%\((\w+)\)s")
+_isolation = re.compile(r"^\s*SET\s+(TRANSACTION\s+ISOLATION\s+LEVEL|LOCK_TIMEOUT|NOCOUNT)\b", re.I)
+_selectList = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)(.*?)(\s+FROM\s)", re.I | re.S)
+_identifier = re.compile(r"^[A-Za-z_][\w.]*$")
+
+
+def _alias(match):
+    # SQL Server names a result column as written in the select list, SQLite
+    # uses the declared column name: alias bare columns to keep their case.
+    if '(' in match.group(2):
+        return match.group(0)
+    columns = []
+    for column in match.group(2).split(','):
+        column = column.strip()
+        if _identifier.match(column):
+            column = "{0} AS {1}".format(column, column.split('.')[-1])
+        columns.append(column)
+    return match.group(1) + ", ".join(columns) + match.group(3)
+
+
+def translate(sql):
+    """Translate a T-SQL statement of the extension into SQLite, None for
+    session statements (SET ...) that have no SQLite equivalent.
+    """
+    if _isolation.match(sql):
+        return None
+    limit = None
+    match = _top.match(sql)
+    if match:
+        limit = match.group(2)
+        sql = "SELECT " + (match.group(1) or '') + sql[match.end():]
+    sql = _dbo.sub('', sql)
+    sql = _selectList.sub(_alias, sql, 1)
+    sql = _nolock.sub('', sql)
+    sql = re.sub(r"\bISNULL\s*\(", "IFNULL(", sql, flags=re.I)
+    sql = re.sub(r"\bGETDATE\s*\(\s*\)", "CURRENT_TIMESTAMP", sql, flags=re.I)
+    sql = _named.sub(r":\1", sql)
+    sql = sql.replace('%s', '?')
+    if limit is not None:
+        sql = sql.rstrip().rstrip(';') + " LIMIT " + limit
+    return sql
+
+
+def sqlValue(value):
+    """Parameter value as SQLite stores it: Decimal as its exact text, which
+    columns of numeric affinity convert to a number and DECTEXT ones keep.
+    """
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def _params(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return dict((k, sqlValue(v)) for k, v in params.items())
+    if isinstance(params, (tuple, list)):
+        return [sqlValue(v) for v in params]
+    return (sqlValue(params),)
+
+
+class Cursor(object):
+    """pymssql-like cursor returning dict rows when as_dict is set.
+    """
+    def __init__(self, connection, as_dict=False):
+        self._connection = connection
+        self._cursor = connection._conn.cursor()
+        self._asDict = as_dict
+        self._columns = []
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, operation, params=None):
+        sql = translate(operation)
+        if sql is None:
+            self._columns = []
+            return
+        try:
+            self._cursor.execute(sql, _params(params))
+        except sqlite3.Error as e:
+            raise OperationalError(str(e) + " in: " + sql)
+        self._columns = [column[0] for column in self._cursor.description or []]
+        self.rowcount = self._cursor.rowcount
+
+    def executemany(self, operation, params):
+        sql = translate(operation)
+        self._cursor.executemany(sql, [_params(p) for p in params])
+        self.rowcount = self._cursor.rowcount
+
+    def _row(self, row):
+        if row is None or not self._asDict:
+            return row
+        return dict(zip(self._columns, row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                break
+            yield row
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection(object):
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+
+    @property
+    def sqlite(self):
+        """The underlying sqlite3 connection, for SQLite statements that need no translation.
+        """
+        return self._conn
+
+    def cursor(self, as_dict=False):
+        return Cursor(self, as_dict=as_dict)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+class Replica(object):
+    """Local SQLite copy of B1 tables, read through connect().
+
+    pull() reads through a pymssql-like cursor the rows of each table updated
+    on or after its watermark (the highest UpdateDate pulled, a date in B1,
+    so the rows of that day are read again) and upserts them by key.  Line
+    and address tables (RDR1, RDR12) and ITM1 have no UpdateDate: their rows
+    are replaced for the parents pulled in the same round, or entirely when
+    their parent is not replicated.  Rows are read chunkSize at a time with
+    fetchmany.  Rows of the DELETABLE tables deleted in B1 are removed when
+    their keys are reconciled, every reconcileInterval seconds (never if None).
+    """
+    def __init__(self, path, tables=DEFAULT_TABLES, chunkSize=1000, reconcileInterval=3600):
+        self.path = path
+        self.tables = list(tables)
+        self.chunkSize = chunkSize
+        self.reconcileInterval = reconcileInterval
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS replica_state (
+            TableName TEXT PRIMARY KEY, Watermark TIMESTAMP, Pulled REAL, Rows INTEGER)""")
+        self._conn.commit()
+        self._state = self._readState()
+        self._pending = {}
+        self._reconciled = {}
+        self._untyped = {}
+
+    def _readState(self):
+        return dict((row[0], {'watermark': row[1], 'pulled': row[2], 'rows': row[3]})
+                    for row in self._conn.execute("SELECT TableName, Watermark, Pulled, Rows FROM replica_state"))
+
+    def _columns(self, table):
+        return [row[1] for row in self._conn.execute("PRAGMA table_info({0})".format(table))]
+
+    def _ensureTable(self, table, rows):
+        columns = self._columns(table)
+        # Declare new columns by the type of their first non-NULL value; columns
+        # only NULL so far wait for a later chunk, then _addUntyped() adds them as TEXT.
+        types = {}
+        for row in rows:
+            for column, value in row.items():
+                if column not in columns and value is not None and column not in types:
+                    types[column] = _declaredType(value)
+        untyped = self._untyped.setdefault(table, set())
+        untyped.update(column for column in rows[0] if column not in columns and column not in types)
+        untyped.difference_update(types)
+        if not types:
+            return
+        if not columns:
+            definition = ", ".join(["{0} {1}".format(column, type) for column, type in sorted(types.items())])
+            self._conn.execute("CREATE TABLE {0} ({1}, PRIMARY KEY ({2}))".format(
+                table, definition, ", ".join(keys(table))))
+        else:
+            for column, type in sorted(types.items()):
+                self._conn.execute("ALTER TABLE {0} ADD COLUMN {1} {2}".format(table, column, type))
+
+    def _upsert(self, table, rows):
+        if not rows:
+            return
+        self._ensureTable(table, rows)
+        declared = set(self._columns(table))
+        columns = [column for column in sorted(rows[0]) if column in declared]
+        sql = "INSERT OR REPLACE INTO {0} ({1}) VALUES ({2})".format(
+            table, ", ".join(columns), ", ".join(['?'] * len(columns)))
+        self._conn.executemany(sql, [[sqlValue(row.get(column)) for column in columns] for row in rows])
+
+    def _delete(self, table, column, values):
+        if not values or not self._columns(table):
+            return
+        self._conn.execute("DELETE FROM {0} WHERE {1} IN ({2})".format(
+            table, column, ", ".join(['?'] * len(values))), list(values))
+
+    def _addUntyped(self):
+        for table, untyped in self._untyped.items():
+            columns = self._columns(table)
+            for column in sorted(untyped):
+                if columns and column not in columns:
+                    self._conn.execute("ALTER TABLE {0} ADD COLUMN {1} TEXT".format(table, column))
+        self._untyped = {}
+
+    def _stream(self, adaptor, sql, params=None):
+        """Rows of a statement in lists of at most chunkSize; each statement must be
+        read to the end before the adaptor executes the next one.
+        """
+        adaptor.execute(sql, params)
+        cursor = adaptor.sqlSrvCursor
+        while True:
+            rows = cursor.fetchmany(self.chunkSize)
+            if not rows:
+                break
+            yield [dict(row) for row in rows]
+
+    def state(self):
+        """Watermark, time and rows of the last committed pull by table; does not wait for a running pull.
+        """
+        return dict(self._state)
+
+    def lag(self):
+        """Seconds since the last pull by table, None for tables never pulled.
+        """
+        state = self.state()
+        now = time()
+        return dict((table, None if table not in state else now - state[table]['pulled']) for table in self.tables)
+
+    def loaded(self, tables=None):
+        state = self.state()
+        return all(table in state for table in (tables or self.tables))
+
+    def pull(self, cursor):
+        """Pull the changes of every replicated table through cursor, the cursor
+        adaptor of the primary database.  Return the number of rows pulled by table.
+        """
+        pulled = {}
+        with self._lock:
+            state = dict((table, entry['watermark']) for table, entry in self._state.items())
+            self._pending = {}
+            for table in self.tables:
+                link = parent(table)
+                if link is None:
+                    pulled.update(self._pullTable(cursor, table, state))
+                elif link[0] not in self.tables:
+                    pulled[table] = self._replaceTable(cursor, table)
+            self._addUntyped()
+            for table in self.tables:
+                if table in DELETABLE and self._reconcileDue(table):
+                    self._reconcile(cursor, table)
+            self._conn.commit()
+            state = dict(self._state)
+            state.update(self._pending)
+            self._state = state
+        return pulled
+
+    def _reconcileDue(self, table):
+        if self.reconcileInterval is None:
+            return False
+        return time() - self._reconciled.get(table, 0) >= self.reconcileInterval
+
+    def _reconcile(self, cursor, table):
+        """Delete the rows of table whose keys are no longer in SQL Server; return their number.
+        """
+        columns = keys(table)
+        self._reconciled[table] = time()
+        if not self._columns(table):
+            return 0
+        primary = set()
+        for rows in self._stream(cursor, "SELECT {0} FROM dbo.{1}".format(", ".join(columns), table)):
+            primary.update(tuple(row[column] for column in columns) for row in rows)
+        deleted = [key for key in self._conn.execute("SELECT {0} FROM {1}".format(", ".join(columns), table))
+                   if tuple(key) not in primary]
+        self._conn.executemany("DELETE FROM {0} WHERE {1}".format(
+            table, " AND ".join("{0} = ?".format(column) for column in columns)), deleted)
+        return len(deleted)
+
+    def _replaceTable(self, cursor, table):
+        if self._columns(table):
+            self._conn.execute("DELETE FROM {0}".format(table))
+        count = 0
+        for rows in self._stream(cursor, "SELECT * FROM dbo.{0}".format(table)):
+            self._upsert(table, rows)
+            count += len(rows)
+        self._reconciled[table] = time()
+        self._setState(table, None, count)
+        return count
+
+    def _pullTable(self, cursor, table, state):
+        watermark = state.get(table)
+        sql = "SELECT * FROM dbo.{0}".format(table)
+        params = {}
+        if watermark is not None:
+            sql = sql + " WHERE UpdateDate >= %(watermark)s"
+            params['watermark'] = watermark
+        else:
+            self._reconciled[table] = time()
+        count = 0
+        newWatermark = watermark
+        # Only the join values of the pulled rows are kept to refresh the children.
+        joins = set(link[1] for link in [parent(child) for child in self.tables] if link and link[0] == table)
+        values = dict((column, set()) for column in joins)
+        for rows in self._stream(cursor, sql, params):
+            self._upsert(table, rows)
+            count += len(rows)
+            for row in rows:
+                if row.get('UpdateDate') is not None and (newWatermark is None or row['UpdateDate'] > newWatermark):
+                    newWatermark = row['UpdateDate']
+                for column in joins:
+                    values[column].add(row[column])
+        pulled = {table: count}
+        for child in self.tables:
+            if parent(child) is None or parent(child)[0] != table:
+                continue
+            column = parent(child)[1]
+            if child not in state:
+                pulled[child] = self._replaceTable(cursor, child)
+                continue
+            parents = sorted(values[column])
+            childCount = 0
+            for i in range(0, len(parents), self.chunkSize):
+                chunk = parents[i:i + self.chunkSize]
+                self._delete(child, column, chunk)
+                params = dict(('e{0}'.format(j), value) for j, value in enumerate(chunk))
+                for rows in self._stream(cursor, "SELECT * FROM dbo.{0} WHERE {1} IN ({2})".format(
+                        child, column, ", ".join(["%(e{0})s".format(j) for j in range(len(chunk))])), params):
+                    self._upsert(child, rows)
+                    childCount += len(rows)
+            self._setState(child, newWatermark, childCount)
+            pulled[child] = childCount
+        self._setState(table, newWatermark, count)
+        return pulled
+
+    def _setState(self, table, watermark, rows):
+        pulled = time()
+        self._conn.execute("INSERT OR REPLACE INTO replica_state (TableName, Watermark, Pulled, Rows) "
+                           "VALUES (?, ?, ?, ?)", (table, watermark, pulled, rows))
+        self._pending[table] = {'watermark': watermark, 'pulled': pulled, 'rows': rows}
+
+    def connect(self):
+        """pymssql-like connection reading the replica with the T-SQL of the extension.
+        """
+        return Connection(self.path)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,51 @@
+import os
+import sys
+import threading
+
+
+def frameLabel(frame):
+    code = frame.f_code
+    return "{0}:{1}:{2}".format(os.path.basename(code.co_filename), code.co_name, code.co_firstlineno)
+
+
+class StackSampler(threading.Thread):
+    """Statistical profiler sampling the stack of one thread at a fixed interval.
+
+    Samples are aggregated as collapsed stacks ('root;...;leaf count' per
+    line), the input format of flamegraph.pl and speedscope.
+    """
+    def __init__(self, threadId, interval=0.005):
+        super(StackSampler, self).__init__()
+        self.daemon = True
+        self.threadId = threadId
+        self.interval = interval
+        self.samples = 0
+        self._counts = {}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frameLabel(frame))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self.samples = self.samples + 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def collapsed(self):
+        return ["{0} {1}".format(stack, count) for stack, count in sorted(self._counts.items())]
+
+    def write(self, path):
+        """Write the collapsed stacks to path.
+        """
+        with open(path, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
@@ -0,0 +1,54 @@
+import json
+import re
+
+REDACTED = '***'
+
+DEFAULT_REDACT = ['password', 'email', 'e_maill', 'name', 'firstname', 'lastname', 'telephone', 'tel', 'phone',
+                  'address', 'street', 'city', 'zipcode']
+
+WORDS = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+')
+
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def isEmail(value):
+    """Whether value is a string holding an e-mail address, redacted wherever it
+    appears, including positional arguments such as getCardCodeByEmail(email).
+    """
+    return isinstance(value, (str, type(u''))) and EMAIL.match(value.strip()) is not None
+
+
+def sensitive(key, patterns):
+    """Whether the key ends with the words of any of the patterns, ignoring case,
+    digits and separators: 'billto_city' and 'ZipCode' match 'city' and 'zipcode',
+    'addresses' and 'addressColumns' do not match 'address'.
+    """
+    words = [word.lower() for word in WORDS.findall(str(key))]
+    tails = set(''.join(words[i:]) for i in range(len(words)))
+    return any(''.join(WORDS.findall(pattern)).lower() in tails for pattern in patterns)
+
+
+def redact(value, patterns):
+    """Copy of value with the values of dict keys matching any of the
+    patterns (see sensitive) and e-mail addresses replaced by '***',
+    recursing into dicts and lists.
+    """
+    if isinstance(value, dict):
+        data = {}
+        for k, v in value.items():
+            if sensitive(k, patterns):
+                data[k] = REDACTED
+            else:
+                data[k] = redact(v, patterns)
+        return data
+    if isinstance(value, (list, tuple)):
+        return [redact(v, patterns) for v in value]
+    if isEmail(value):
+        return REDACTED
+    return value
+
+
+def dumps(value):
+    """Serialize value for the log, falling back to str for unknown types.
+    """
+    return json.dumps(value, default=str, sort_keys=True)
@@ -0,0 +1,194 @@
+import threading
+from time import time
+
+
+class Snapshot(object):
+    """In-process copy of rows of a B1 table, bulk-loaded on first use and
+    then refreshed incrementally every interval seconds.
+
+    A refresh passes the watermark (the highest UpdateDate seen) to fetch,
+    which returns the rows updated at or after it; B1 keeps UpdateDate as a
+    date, so the rows of the watermark day are read again and upserted.
+    Without a watermark (rows lacking UpdateDate) every refresh is a full
+    reload replacing the copy.  Lookups are served from the current copy while another thread refreshes.
+    """
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._refreshLock = threading.Lock()
+        self._watermark = None
+        self._refreshed = None
+        self.refreshes = 0
+
+    @property
+    def loaded(self):
+        return self._refreshed is not None
+
+    def stale(self):
+        return self._refreshed is None or time() - self._refreshed >= self.interval
+
+    def refresh(self, fetch, force=False):
+        """Upsert the rows returned by fetch(watermark) if the copy is stale.
+        Only the first load blocks concurrent callers.
+        """
+        if not force and not self.stale():
+            return False
+        if not self._refreshLock.acquire(self._refreshed is None):
+            return False
+        try:
+            if not force and not self.stale():
+                return False
+            rows = fetch(self._watermark)
+            with self._lock:
+                if self._watermark is None:
+                    self._clear()
+                for row in rows:
+                    self._apply(row)
+                    updated = row.get('UpdateDate')
+                    if updated is not None and (self._watermark is None or updated > self._watermark):
+                        self._watermark = updated
+                self._refreshed = time()
+                self.refreshes = self.refreshes + 1
+            return True
+        finally:
+            self._refreshLock.release()
+
+    def _clear(self):
+        pass
+
+    def _apply(self, row):
+        raise NotImplementedError
+
+    def stats(self):
+        with self._lock:
+            return {
+                'refreshes': self.refreshes,
+                'watermark': self._watermark,
+                'age': None if self._refreshed is None else time() - self._refreshed
+            }
+
+
+def normalizeEmail(email):
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
+class BusinessPartnerSnapshot(Snapshot):
+    """Customer business partners indexed by CardCode and normalized email.
+
+    Fetched rows are OCRD rows (with CardCode, E_Mail, CntctPrsn, ...) or
+    OCPR rows (with CntctCode). A partner is found by its own E_Mail or,
+    when that is empty, by the E_MailL of its main contact (the OCPR row
+    whose Name is OCRD.CntctPrsn), like ISNULL(OCRD.E_Mail, OCPR.E_MailL).
+    """
+    def __init__(self, interval=60):
+        super(BusinessPartnerSnapshot, self).__init__(interval)
+        self._partners = {}
+        self._contacts = {}
+        self._emails = {}
+        self._byEmail = {}
+
+    def _apply(self, row):
+        cardCode = row['CardCode']
+        if 'CntctCode' in row:
+            self._contacts.setdefault(cardCode, {})[row['CntctCode']] = row
+        else:
+            self._partners[cardCode] = row
+        self._reindex(cardCode)
+
+    def _email(self, cardCode):
+        partner = self._partners.get(cardCode)
+        if partner is None:
+            return None
+        email = normalizeEmail(partner.get('E_Mail'))
+        if email is None:
+            for contact in self._contacts.get(cardCode, {}).values():
+                if contact.get('Name') == partner.get('CntctPrsn'):
+                    email = normalizeEmail(contact.get('E_MailL'))
+        return email
+
+    def _reindex(self, cardCode):
+        old, new = self._emails.get(cardCode), self._email(cardCode)
+        if old == new:
+            return
+        if old is not None:
+            self._byEmail.get(old, set()).discard(cardCode)
+            if not self._byEmail.get(old):
+                self._byEmail.pop(old, None)
+        if new is not None:
+            self._byEmail.setdefault(new, set()).add(cardCode)
+        self._emails[cardCode] = new
+
+    def get(self, cardCode):
+        """The OCRD row of a customer, None if unknown.
+        """
+        with self._lock:
+            partner = self._partners.get(cardCode)
+            return None if partner is None else dict(partner)
+
+    def byEmail(self, email):
+        """CardCodes of the customers with the email, sorted.
+        """
+        with self._lock:
+            return sorted(self._byEmail.get(normalizeEmail(email), ()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._partners)
+
+
+class InvalidOrderError(ValueError):
+    """Raised before any COM call when order lines are rejected locally.
+    errors holds one (line index, ItemCode, reason) tuple per rejected line.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        super(InvalidOrderError, self).__init__("Invalid order lines: " + "; ".join(
+            ["line {0} ({1}): {2}".format(index, itemCode, reason) for index, itemCode, reason in errors]))
+
+
+class ItemSnapshot(Snapshot):
+    """Item master (OITM rows) with the prices of every price list (ITM1 rows, with PriceList).
+    """
+    def __init__(self, interval=60):
+        super(ItemSnapshot, self).__init__(interval)
+        self._items = {}
+        self._prices = {}
+
+    def _apply(self, row):
+        if 'PriceList' in row:
+            self._prices.setdefault(row['ItemCode'], {})[row['PriceList']] = row
+        else:
+            self._items[row['ItemCode']] = row
+
+    def get(self, itemCode):
+        """The OITM row of an item, None if unknown.
+        """
+        with self._lock:
+            item = self._items.get(itemCode)
+            return None if item is None else dict(item)
+
+    def price(self, itemCode, priceList):
+        """The ITM1 row of an item in a price list, None if it has no price there.
+        """
+        with self._lock:
+            price = self._prices.get(itemCode, {}).get(priceList)
+            return None if price is None else dict(price)
+
+    def reject(self, item):
+        """Reason why an OITM row cannot be sold, None if it can.
+        """
+        if item is None:
+            return 'unknown item'
+        if item.get('validFor') == 'N':
+            return 'inactive item'
+        if item.get('frozenFor') == 'Y':
+            return 'frozen item'
+        if item.get('SellItem') == 'N':
+            return 'not a sales item'
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,134 @@
+import hashlib
+import re
+from time import time
+
+from flask.signals import Namespace
+
+_signals = Namespace()
+
+#: Sent with record=<statement record> after each statement has been fully read.
+sql_executed = _signals.signal('sapb1-sql-executed')
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_whitespace = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize a statement by collapsing whitespace and replacing literals
+    with '?', and return it with a short hash identifying the statement shape.
+    """
+    normalized = _whitespace.sub(' ', _literals.sub('?', sql)).strip()
+    return normalized, hashlib.md5(normalized.encode('utf-8')).hexdigest()[0:12]
+
+
+def rowSize(row):
+    """Approximate payload size of a row in bytes.
+    """
+    values = row.values() if isinstance(row, dict) else row
+    size = 0
+    for value in values:
+        if value is None:
+            continue
+        try:
+            size = size + len(value)
+        except TypeError:
+            size = size + 8
+    return size
+
+
+class InstrumentedCursor(object):
+    """Cursor proxy measuring latency, rows and approximate bytes per statement.
+
+    A statement is complete when its rows are exhausted, when the next
+    statement is executed or on finish(); the record is then passed to emit.
+    The value returned by begin at execute time is kept in record['context'].
+    The release callable given to execute is called once the statement is
+    complete or has failed.
+    """
+    def __init__(self, cursor, emit=None, begin=None):
+        self._cursor = cursor
+        self._emit = emit
+        self._begin = begin
+        self._current = None
+        self._release = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=None, release=None):
+        self.finish()
+        self._release = release
+        normalized, digest = fingerprint(sql)
+        self._current = {
+            'sql': sql,
+            'params': params,
+            'statement': normalized,
+            'fingerprint': digest,
+            'started': time(),
+            'elapsed': 0.0,
+            'rows': 0,
+            'bytes': 0,
+            'context': self._begin() if self._begin is not None else None
+        }
+        start = time()
+        try:
+            return self._cursor.execute(sql, params)
+        except Exception:
+            self.release()
+            raise
+        finally:
+            self._current['elapsed'] = time() - start
+
+    def _account(self, rows, elapsed):
+        if self._current is None:
+            return
+        self._current['elapsed'] = self._current['elapsed'] + elapsed
+        self._current['rows'] = self._current['rows'] + len(rows)
+        self._current['bytes'] = self._current['bytes'] + sum(rowSize(row) for row in rows)
+
+    def fetchone(self):
+        start = time()
+        row = self._cursor.fetchone()
+        if row is None:
+            self._account([], time() - start)
+            self.finish()
+        else:
+            self._account([row], time() - start)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._account(rows, time() - start)
+        if not rows:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        start = time()
+        rows = self._cursor.fetchall()
+        self._account(rows, time() - start)
+        self.finish()
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                break
+            yield row
+
+    def finish(self):
+        """Complete the pending statement and emit its record.
+        """
+        record, self._current = self._current, None
+        self.release()
+        if record is not None and self._emit is not None:
+            self._emit(record)
+
+    def release(self):
+        """Call the release callable of the pending statement, if not called yet.
+        """
+        release, self._release = self._release, None
+        if release is not None:
+            release()
@@ -0,0 +1,212 @@
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from time import time
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call waits longer than its budget allows.
+    """
+    pass
+
+
+class Budget(object):
+    """Token bucket combined with a concurrency cap for one operation type.
+
+    rate: tokens added per second, None for no rate limit.
+    burst: bucket capacity of at least one token, defaults to max(1, rate).
+    concurrency: maximum calls in flight, None for no cap.
+    timeout: maximum seconds to queue before RateLimitExceeded, None to wait forever.
+    """
+    def __init__(self, rate=None, burst=None, concurrency=None, timeout=None):
+        if burst is None:
+            burst = max(1, rate) if rate else 0
+        elif rate and burst < 1:
+            raise ValueError("A burst below 1 token never admits a call: {0}".format(burst))
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._tokens = float(self.burst)
+        self._stamp = time()
+        self._inflight = 0
+        self._cond = threading.Condition()
+        self.calls = 0
+        self.queued = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+        self.timeouts = 0
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def acquire(self):
+        start = time()
+        deadline = None if self.timeout is None else start + self.timeout
+        with self._cond:
+            self.queued = self.queued + 1
+            try:
+                while True:
+                    now = time()
+                    self._refill(now)
+                    hasSlot = self.concurrency is None or self._inflight < self.concurrency
+                    hasToken = not self.rate or self._tokens >= 1
+                    if hasSlot and hasToken:
+                        break
+                    wait = None
+                    if hasSlot:
+                        wait = (1 - self._tokens) / self.rate
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self.timeouts = self.timeouts + 1
+                            raise RateLimitExceeded("Rate limit exceeded after {0:.3f}s.".format(now - start))
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self.queued = self.queued - 1
+            if self.rate:
+                self._tokens = self._tokens - 1
+            self._inflight = self._inflight + 1
+            waited = time() - start
+            self.calls = self.calls + 1
+            self.waitTotal = self.waitTotal + waited
+            self.waitMax = max(self.waitMax, waited)
+        return waited
+
+    def release(self):
+        with self._cond:
+            self._inflight = self._inflight - 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'calls': self.calls,
+                'inflight': self._inflight,
+                'queued': self.queued,
+                'wait_total': self.waitTotal,
+                'wait_max': self.waitMax,
+                'timeouts': self.timeouts
+            }
+
+
+class Limiter(object):
+    """Admission control for DI API and SQL calls, one budget per operation type.
+
+    limits maps an operation type to Budget keyword arguments, e.g.
+    {'insertOrder': {'rate': 5, 'burst': 10, 'concurrency': 2}}.
+    Operation types without a budget are not limited.
+    """
+    def __init__(self, limits=None):
+        self._limits = limits or {}
+        self._budgets = dict((opType, Budget(**kwargs)) for opType, kwargs in self._limits.items())
+
+    @property
+    def limits(self):
+        return self._limits
+
+    def hold(self, opType):
+        """Take a slot of the opType budget and return the callable releasing it,
+        None if opType is not limited.
+        """
+        budget = self._budgets.get(opType)
+        if budget is None:
+            return None
+        budget.acquire()
+        return budget.release
+
+    @contextmanager
+    def acquire(self, opType):
+        """Hold a slot of the opType budget for the duration of the block.
+        """
+        budget = self._budgets.get(opType)
+        if budget is None:
+            yield 0.0
+            return
+        waited = budget.acquire()
+        try:
+            yield waited
+        finally:
+            budget.release()
+
+    def stats(self):
+        """Queue-time and usage statistics per operation type.
+        """
+        return dict((opType, budget.stats()) for opType, budget in self._budgets.items())
+
+
+class PriorityScheduler(object):
+    """Hands out a fixed number of DI session slots by priority class.
+
+    Queued interactive requests are always served before queued batch
+    requests; within a class requests are served in arrival order. A
+    thread already holding a slot re-enters without queueing, so nested
+    calls such as insertOrder -> insertContact cannot deadlock.
+
+    slots: number of slots, at least 1; None for no limit.
+    """
+    PRIORITIES = ('interactive', 'batch')
+
+    def __init__(self, slots=None):
+        if slots is not None and slots < 1:
+            raise ValueError("At least 1 DI session slot is needed, got {0}.".format(slots))
+        self.slots = slots
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._busy = 0
+        self._local = threading.local()
+        self._stats = dict((priority, {'queued': 0, 'calls': 0, 'wait_total': 0.0, 'wait_max': 0.0})
+                           for priority in self.PRIORITIES)
+
+    @contextmanager
+    def slot(self, priority='interactive'):
+        """Hold a session slot for the duration of the block.
+        """
+        if priority not in self.PRIORITIES:
+            raise ValueError("Unknown priority {0}.".format(priority))
+        depth = getattr(self._local, 'depth', 0)
+        if self.slots is None or depth > 0:
+            self._local.depth = depth + 1
+            try:
+                yield 0.0
+            finally:
+                self._local.depth = depth
+            return
+        start = time()
+        stats = self._stats[priority]
+        with self._cond:
+            ticket = (self.PRIORITIES.index(priority), next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            stats['queued'] = stats['queued'] + 1
+            while self._busy >= self.slots or self._queue[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(self._queue)
+            self._busy = self._busy + 1
+            waited = time() - start
+            stats['queued'] = stats['queued'] - 1
+            stats['calls'] = stats['calls'] + 1
+            stats['wait_total'] = stats['wait_total'] + waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            self._cond.notify_all()
+        self._local.depth = 1
+        try:
+            yield waited
+        finally:
+            self._local.depth = 0
+            with self._cond:
+                self._busy = self._busy - 1
+                self._cond.notify_all()
+
+    def stats(self):
+        """Queue depth and wait-time statistics per priority class.
+        """
+        with self._cond:
+            data = dict((priority, dict(stats)) for priority, stats in self._stats.items())
+            data['busy'] = self._busy
+            data['slots'] = self.slots
+            return data
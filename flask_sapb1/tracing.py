@@ -0,0 +1,130 @@
+import binascii
+import json
+import os
+from contextlib import contextmanager
+from time import time
+
+try:
+    from urllib2 import Request, urlopen
+except ImportError:
+    from urllib.request import Request, urlopen
+
+
+def _newId(size):
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+class Span(object):
+    """Timed, named node of a trace tree.
+    """
+    def __init__(self, name, parent=None, start=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.spanId = _newId(8)
+        self.start = time() if start is None else start
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+
+    def finish(self, end=None):
+        self.end = time() if end is None else end
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time()) - self.start
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for span in child.walk():
+                yield span
+
+    def toDict(self):
+        return {
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'children': [child.toDict() for child in self.children]
+        }
+
+
+class Trace(object):
+    """Nested timing tree of the SQL and COM calls made in one context.
+    """
+    def __init__(self):
+        self.traceId = _newId(16)
+        self.roots = []
+        self._stack = []
+
+    @property
+    def current(self):
+        return self._stack[-1] if self._stack else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Open a span as a child of the current span for the duration of the block.
+        """
+        span = Span(name, parent=self.current, attributes=attributes)
+        if span.parent is None:
+            self.roots.append(span)
+        self._stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.attributes['error'] = str(e)
+            raise
+        finally:
+            self._stack.pop()
+            span.finish()
+
+    def add(self, name, start, duration, parent=None, **attributes):
+        """Record an already completed span under parent, or as a root.
+        """
+        span = Span(name, parent=parent, start=start, attributes=attributes)
+        span.finish(start + duration)
+        if parent is None:
+            self.roots.append(span)
+        return span
+
+    def toDict(self):
+        return {
+            'traceId': self.traceId,
+            'spans': [root.toDict() for root in self.roots]
+        }
+
+    def toOTLP(self, serviceName='flask-sapb1'):
+        """Trace in the OTLP/HTTP JSON encoding.
+        """
+        spans = []
+        for root in self.roots:
+            for span in root.walk():
+                data = {
+                    'traceId': self.traceId,
+                    'spanId': span.spanId,
+                    'name': span.name,
+                    'kind': 1,
+                    'startTimeUnixNano': str(int(span.start * 1e9)),
+                    'endTimeUnixNano': str(int((span.start + span.duration) * 1e9)),
+                    'attributes': [{'key': k, 'value': {'stringValue': str(v)}}
+                                   for k, v in sorted(span.attributes.items())]
+                }
+                if span.parent is not None:
+                    data['parentSpanId'] = span.parent.spanId
+                spans.append(data)
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': serviceName}}]},
+                'scopeSpans': [{'scope': {'name': 'flask_sapb1'}, 'spans': spans}]
+            }]
+        }
+
+
+def exportOTLP(trace, endpoint, timeout=2):
+    """Post a trace to an OTLP/HTTP collector.
+    """
+    body = json.dumps(trace.toOTLP()).encode('utf-8')
+    request = Request(endpoint, data=body, headers={'Content-Type': 'application/json'})
+    urlopen(request, timeout=timeout).close()
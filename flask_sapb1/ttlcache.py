@@ -0,0 +1,91 @@
+import threading
+from time import time
+
+
+class TTLCache(object):
+    """Values by key expiring ttl seconds after they were loaded.
+
+    getMany() loads the missing keys of a batch with one call; keys being
+    loaded by another thread are waited for instead of loaded again
+    (single-flight), so a burst of identical requests costs one query.
+    Keys the loader does not return are cached as None.  listener, if
+    given, is called with the hits, misses and shared keys of each batch.
+    """
+    def __init__(self, ttl, maxSize=100000, listener=None):
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._values = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def _evict(self, now):
+        if len(self._values) < self.maxSize:
+            return
+        for key, (value, expires) in list(self._values.items()):
+            if expires <= now:
+                del self._values[key]
+        if len(self._values) >= self.maxSize:
+            self._values.clear()
+
+    def _store(self, keys, loaded):
+        with self._lock:
+            now = time()
+            self._evict(now)
+            for key in keys:
+                self._values[key] = (loaded.get(key), now + self.ttl)
+
+    def getMany(self, keys, load):
+        """Dict of key to value for keys, calling load(missing keys) -> dict for the keys not cached.
+        """
+        now = time()
+        result, lead, wait = {}, [], []
+        with self._lock:
+            for key in set(keys):
+                entry = self._values.get(key)
+                if entry is not None and entry[1] > now:
+                    result[key] = entry[0]
+                elif key in self._inflight:
+                    wait.append((key, self._inflight[key]))
+                else:
+                    self._inflight[key] = threading.Event()
+                    lead.append(key)
+            self.hits = self.hits + len(result)
+            self.misses = self.misses + len(lead)
+            self.shared = self.shared + len(wait)
+        if self.listener is not None:
+            self.listener(len(result), len(lead), len(wait))
+        if lead:
+            try:
+                loaded = load(lead)
+                self._store(lead, loaded)
+                result.update((key, loaded.get(key)) for key in lead)
+            finally:
+                with self._lock:
+                    for key in lead:
+                        self._inflight.pop(key).set()
+        missing = []
+        for key, event in wait:
+            event.wait()
+            with self._lock:
+                entry = self._values.get(key)
+            if entry is None:
+                missing.append(key)
+            else:
+                result[key] = entry[0]
+        if missing:
+            loaded = load(missing)
+            self._store(missing, loaded)
+            result.update((key, loaded.get(key)) for key in missing)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._values), 'hits': self.hits, 'misses': self.misses, 'shared': self.shared}
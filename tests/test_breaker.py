@@ -0,0 +1,52 @@
+import time
+import unittest
+
+from flask_sapb1.breaker import CircuitBreaker, CircuitOpenError
+
+
+class Failure(Exception):
+    pass
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def failOnce(self, breaker):
+        def attempt():
+            with breaker.guard():
+                raise Failure()
+        self.assertRaises(Failure, attempt)
+
+    def trip(self, cooldown=0.05):
+        breaker = CircuitBreaker('CURSOR', threshold=2, cooldown=cooldown)
+        self.failOnce(breaker)
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.failOnce(breaker)
+        self.assertEqual(breaker.state, breaker.OPEN)
+        return breaker
+
+    def testOpenFailsFast(self):
+        breaker = self.trip(cooldown=60)
+        self.assertRaises(CircuitOpenError, breaker.guard().__enter__)
+        self.assertEqual(breaker.stats()['rejected'], 1)
+        self.assertEqual(breaker.stats()['trips'], 1)
+
+    def testHalfOpenLetsOneProbeThrough(self):
+        breaker = self.trip()
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        with breaker.guard():
+            self.assertRaises(CircuitOpenError, breaker.guard().__enter__)
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertEqual(breaker.stats()['failures'], 0)
+
+    def testFailedProbeReopens(self):
+        breaker = self.trip()
+        time.sleep(0.06)
+        self.failOnce(breaker)
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertEqual(breaker.stats()['trips'], 2)
+        self.assertRaises(CircuitOpenError, breaker.guard().__enter__)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import gc
+import threading
+import unittest
+
+from flask_sapb1.connections import ConnectionTracker
+
+
+class Context(object):
+    pass
+
+
+class Adaptor(object):
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.disconnects = []
+
+    def disconnect(self):
+        self.disconnects.append(threading.current_thread().name)
+        self.tracker.unregister(self)
+
+
+class ConnectionTrackerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = ConnectionTracker()
+
+    def inThread(self, func):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(func()), name='other')
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def testRegisterAndReport(self):
+        context = Context()
+        com, cursor = Adaptor(self.tracker), Adaptor(self.tracker)
+        self.tracker.register(com, 'COM', owner=context)
+        self.tracker.register(cursor, 'CURSOR', owner=context)
+        self.assertEqual(self.tracker.counts(), {'COM': 1, 'CURSOR': 1})
+        report = self.tracker.report()
+        self.assertEqual(sorted(entry['type'] for entry in report), ['COM', 'CURSOR'])
+        self.assertEqual(report[0]['owner'], 'Context@{0:x}'.format(id(context)))
+        self.assertEqual(report[0]['thread'], threading.current_thread().name)
+        self.assertFalse(report[0]['orphaned'])
+        self.assertTrue(report[0]['age'] >= report[1]['age'])
+        del context
+        gc.collect()
+        self.assertTrue(all(entry['orphaned'] for entry in self.tracker.report()))
+        self.tracker.unregister(com)
+        self.assertEqual(self.tracker.counts(), {'CURSOR': 1})
+
+    def testReapOnlyQueues(self):
+        live, orphan = Adaptor(self.tracker), Adaptor(self.tracker)
+        context = Context()
+        self.tracker.register(live, 'CURSOR', owner=context)
+        self.tracker.register(orphan, 'COM')
+        self.assertEqual(self.tracker.reap(60), [])
+        queued = self.inThread(lambda: self.tracker.reap(0))
+        self.assertEqual([entry['id'] for entry in queued], [id(orphan)])
+        self.assertEqual(orphan.disconnects, [])
+        self.assertEqual(self.tracker.reap(0), [])
+        self.assertEqual([entry['queued'] for entry in self.tracker.report() if entry['id'] == id(orphan)], [True])
+
+    def testQueuedDisconnectedByOwnThread(self):
+        orphan = Adaptor(self.tracker)
+        self.tracker.register(orphan, 'COM')
+        self.tracker.reap(0)
+        self.assertEqual(self.inThread(self.tracker.disconnectQueued), [])
+        self.assertEqual(orphan.disconnects, [])
+        disconnected = self.tracker.disconnectQueued()
+        self.assertEqual([entry['id'] for entry in disconnected], [id(orphan)])
+        self.assertEqual(orphan.disconnects, [threading.current_thread().name])
+        self.assertEqual(self.tracker.counts(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
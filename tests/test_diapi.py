@@ -0,0 +1,34 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from flask_sapb1.flask_sapb1 import importDIAPI
+
+
+class ImportDIAPITestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'SAPbobsCOMTopLevel.py'), 'w') as f:
+            f.write("class constants:\n    BoRecordset = 300\n")
+        sys.path.insert(0, self.directory)
+
+    def tearDown(self):
+        sys.path.remove(self.directory)
+        sys.modules.pop('SAPbobsCOMTopLevel', None)
+        shutil.rmtree(self.directory)
+
+    def testPackagedModule(self):
+        self.assertEqual(importDIAPI('SAPbobsCOMFake').__name__, 'flask_sapb1.SAPbobsCOMFake')
+
+    def testTopLevelModule(self):
+        self.assertEqual(importDIAPI('SAPbobsCOMTopLevel').constants.BoRecordset, 300)
+
+    def testMissingModule(self):
+        self.assertRaises(ImportError, importDIAPI, 'SAPbobsCOMMissing')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask_sapb1 import mssqlfake
+from flask_sapb1.benchmark import makeApp
+
+
+class IsolationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=10, items=10)
+        self.statements = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def makeApp(self, **config):
+        app, ext = makeApp(self.path, **config)
+        ext.addSQLSink(lambda record: self.statements.append(record['sql']))
+        return app, ext
+
+    def levels(self):
+        prefix = 'SET TRANSACTION ISOLATION LEVEL '
+        return [sql[len(prefix):] for sql in self.statements if sql.startswith(prefix)]
+
+    def testLevelMapping(self):
+        app, ext = self.makeApp()
+        with app.app_context():
+            for level in ('NOLOCK', 'read uncommitted', 'READ COMMITTED SNAPSHOT', 'SNAPSHOT', 'REPEATABLE READ',
+                          'SERIALIZABLE'):
+                with ext.isolation(level):
+                    ext.getMainCurrency()
+        self.assertEqual(self.levels(), [
+            'READ UNCOMMITTED', 'READ COMMITTED', 'READ UNCOMMITTED', 'READ COMMITTED',
+            'SNAPSHOT', 'READ COMMITTED', 'REPEATABLE READ', 'READ COMMITTED', 'SERIALIZABLE', 'READ COMMITTED'])
+
+    def testPreviousLevelRestored(self):
+        app, ext = self.makeApp(ISOLATIONLEVEL='SNAPSHOT')
+        with app.app_context():
+            adaptor = ext.sqlServerAdaptor
+            self.assertEqual(adaptor.isolationLevel, 'SNAPSHOT')
+            with ext.isolation('SERIALIZABLE'):
+                self.assertEqual(adaptor.isolationLevel, 'SERIALIZABLE')
+                with ext.isolation('SERIALIZABLE'):
+                    pass
+                self.assertEqual(adaptor.isolationLevel, 'SERIALIZABLE')
+            self.assertEqual(adaptor.isolationLevel, 'SNAPSHOT')
+        self.assertEqual(self.levels(), ['SNAPSHOT', 'SERIALIZABLE', 'SNAPSHOT'])
+
+    def testUnknownLevelRejected(self):
+        app, ext = self.makeApp()
+        with app.app_context():
+            def enter():
+                with ext.isolation('DIRTY'):
+                    pass
+            self.assertRaises(ValueError, enter)
+            self.assertEqual(ext.sqlServerAdaptor.isolationLevel, None)
+        self.assertEqual(self.levels(), [])
+
+    def testOutsideContext(self):
+        app, ext = self.makeApp()
+        def enter():
+            with ext.isolation('SNAPSHOT'):
+                pass
+        self.assertRaises(RuntimeError, enter)
+
+    def testAppliedToSQLServerWithinReplicaReads(self):
+        app, ext = self.makeApp(REPLICA=os.path.join(self.directory, 'replica.db'), REPLICAINTERVAL=0)
+        with app.app_context():
+            ext._local.replicaReads = True
+            try:
+                with ext.isolation('SNAPSHOT'):
+                    self.assertEqual(ext.sqlServerAdaptor.isolationLevel, 'SNAPSHOT')
+                    self.assertEqual(ext.replicaAdaptor.isolationLevel, None)
+            finally:
+                ext._local.replicaReads = False
+        self.assertEqual(self.levels(), ['SNAPSHOT', 'READ COMMITTED'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from flask_sapb1 import mssqlfake
+from flask_sapb1.benchmark import makeApp
+from flask_sapb1.orderindex import OrderIndex
+
+
+class OrderIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = os.path.join(self.directory, 'orderindex.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testKeyedByCompany(self):
+        first = OrderIndex(self.index, 'FIRST')
+        second = OrderIndex(self.index, 'SECOND')
+        first.put('NumAtCard', 'FE-1', 10)
+        second.putMany('NumAtCard', {'FE-1': 20})
+        self.assertEqual(first.get('NumAtCard', 'FE-1'), '10')
+        self.assertEqual(second.get('NumAtCard', 'FE-1'), '20')
+        first.remove('NumAtCard', 'FE-1')
+        self.assertEqual(first.get('NumAtCard', 'FE-1'), None)
+        self.assertEqual(second.get('NumAtCard', 'FE-1'), '20')
+        first.close()
+        second.close()
+
+    def testEntriesWithoutCompanyDropped(self):
+        conn = sqlite3.connect(self.index)
+        conn.execute("CREATE TABLE orderindex (field TEXT NOT NULL, fe_order_id TEXT NOT NULL, "
+                     "doc_entry TEXT NOT NULL, PRIMARY KEY (field, fe_order_id))")
+        conn.execute("INSERT INTO orderindex VALUES ('NumAtCard', 'FE-1', '10')")
+        conn.commit()
+        conn.close()
+        index = OrderIndex(self.index, 'FIRST')
+        self.assertEqual(index.get('NumAtCard', 'FE-1'), None)
+        index.put('NumAtCard', 'FE-1', 10)
+        self.assertEqual(index.get('NumAtCard', 'FE-1'), '10')
+        index.close()
+
+
+class GetOrderIdTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = os.path.join(self.directory, 'orderindex.db')
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=10, customers=10, items=50)
+        self.app, self.ext = makeApp(self.path, ORDERINDEX=self.index)
+        self.statements = []
+        self.ext.addSQLSink(lambda record: self.statements.append(record['sql']))
+        conn = sqlite3.connect(self.path)
+        try:
+            self.docEntry, self.feOrderId = conn.execute(
+                "SELECT DocEntry, NumAtCard FROM ORDR ORDER BY DocEntry LIMIT 1").fetchone()
+        finally:
+            conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testHit(self):
+        with self.app.app_context():
+            self.ext.orderIndex.put('NumAtCard', self.feOrderId, 999)
+            self.assertEqual(self.ext.getOrderId({'fe_order_id': self.feOrderId}), '999')
+        self.assertEqual(self.statements, [])
+
+    def testMissFallsBackToSQLAndWritesBack(self):
+        with self.app.app_context():
+            self.assertEqual(self.ext.orderIndex.get('NumAtCard', self.feOrderId), None)
+            self.assertEqual(str(self.ext.getOrderId({'fe_order_id': self.feOrderId})), str(self.docEntry))
+            self.assertEqual(len(self.statements), 1)
+            self.assertEqual(self.ext.orderIndex.get('NumAtCard', self.feOrderId), str(self.docEntry))
+            self.assertEqual(str(self.ext.getOrderId({'fe_order_id': self.feOrderId})), str(self.docEntry))
+        self.assertEqual(len(self.statements), 1)
+
+    def testMissNotFound(self):
+        with self.app.app_context():
+            self.assertEqual(self.ext.getOrderId({'fe_order_id': 'UNKNOWN'}), None)
+            self.assertEqual(self.ext.orderIndex.get('NumAtCard', 'UNKNOWN'), None)
+
+    def testCompaniesSharingIndex(self):
+        other = os.path.join(self.directory, 'other.db')
+        mssqlfake.generate(other, orders=10, customers=10, items=50)
+        app, ext = makeApp(other, ORDERINDEX=self.index)
+        with self.app.app_context():
+            self.ext.orderIndex.put('NumAtCard', self.feOrderId, 999)
+        with app.app_context():
+            self.assertEqual(str(ext.getOrderId({'fe_order_id': self.feOrderId})), str(self.docEntry))
+        with self.app.app_context():
+            self.assertEqual(self.ext.getOrderId({'fe_order_id': self.feOrderId}), '999')
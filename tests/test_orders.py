@@ -0,0 +1,113 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from flask_sapb1 import mssqlfake
+from flask_sapb1.snapshots import InvalidOrderError
+from flask_sapb1.benchmark import makeApp
+
+
+class ValidateOrderLinesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=10, customers=10, items=50)
+        self.app, self.ext = makeApp(self.path, ITEMCACHE=60)
+        conn = sqlite3.connect(self.path)
+        try:
+            # An item with a special price for the first customer.
+            self.itemCode, self.listPrice = conn.execute(
+                "SELECT t0.ItemCode, t2.Price FROM OSPP t0 INNER JOIN OITM t1 ON t1.ItemCode = t0.ItemCode "
+                "INNER JOIN ITM1 t2 ON t2.ItemCode = t0.ItemCode AND t2.PriceList = t0.ListNum "
+                "WHERE t0.CardCode = 'C0000001' AND t1.validFor = 'Y' AND t1.frozenFor = 'N' "
+                "ORDER BY t0.ItemCode").fetchone()
+        finally:
+            conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def lines(self, **line):
+        line.setdefault('itemcode', self.itemCode)
+        line.setdefault('quantity', 2)
+        return [line]
+
+    def testPricedLikeB1(self):
+        items = self.lines()
+        with self.app.app_context():
+            special = self.ext.getPrice('C0000001', self.itemCode, 2)
+            wholesale = self.ext.getPrice('C0000010', self.itemCode, 2)
+            lines = self.ext.validateOrderLines(items, 'C0000001')
+            wholesaleLines = self.ext.validateOrderLines(items, 'C0000010')
+        self.assertEqual(special['Source'], 'special price')
+        self.assertNotEqual(float(special['Price']), self.listPrice)
+        self.assertEqual(lines[0]['price'], special['Price'])
+        self.assertAlmostEqual(lines[0]['linetotal'], float(special['Price']) * 2)
+        self.assertEqual(wholesaleLines[0]['price'], wholesale['Price'])
+        self.assertEqual(items, self.lines())
+
+    def testExplicitPriceKept(self):
+        with self.app.app_context():
+            lines = self.ext.validateOrderLines(self.lines(price='1.50', linetotal=3.0), 'C0000010')
+        self.assertEqual(lines, self.lines(price='1.50', linetotal=3.0))
+
+    def testRejectedLinesCountedByReasonCode(self):
+        with self.app.app_context():
+            try:
+                self.ext.validateOrderLines(self.lines(itemcode='UNKNOWN') + self.lines(), 'C9999999')
+            except InvalidOrderError as e:
+                errors = e.errors
+            else:
+                self.fail('InvalidOrderError not raised')
+        self.assertEqual(errors, [(0, 'UNKNOWN', 'unknown item'), (1, self.itemCode, 'no price for customer C9999999')])
+        samples = self.ext.metrics.counter('sapb1_order_lines_rejected_total').samples()
+        self.assertEqual(sorted(dict(labels)['reason'] for name, labels, value in samples),
+                         ['no price', 'unknown item'])
+
+
+class OrderIdsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=20, items=20)
+        self.app, self.ext = makeApp(self.path)
+        self.statements = []
+        self.ext.addSQLSink(lambda record: self.statements.append(record['sql']))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testDocEntrySelectedOnce(self):
+        with self.app.app_context():
+            orders = self.ext.getOrders(num=3, columns=['NumAtCard'])
+            feOrderIds = [order['NumAtCard'] for order in orders]
+            del self.statements[:]
+            found = self.ext.getOrderIds(feOrderIds + ['MISSING'])
+        self.assertEqual(sorted(found), sorted(feOrderIds))
+        self.assertEqual(found[feOrderIds[0]]['DocEntry'], '1')
+        selected = self.statements[0].split(' FROM ')[0][len('SELECT '):].split(' ,')
+        self.assertEqual(selected, ['DocEntry', 'DocStatus', 'CANCELED', 'NumAtCard'])
+
+    def testDocumentChainsAddDocEntry(self):
+        with self.app.app_context():
+            chains = self.ext.getDocumentChains(range(1, 21), columns=['DocNum'])
+            everything = self.ext.getDocumentChains(range(1, 21), columns=[])
+        deliveries = [delivery for chain in chains.values() for delivery in chain['deliveries']]
+        self.assertTrue(deliveries)
+        self.assertEqual(sorted(deliveries[0]), ['DocEntry', 'DocNum'])
+        deliveries = [delivery for chain in everything.values() for delivery in chain['deliveries']]
+        self.assertIn('CardCode', deliveries[0])
+        # SQL Server cannot apply DISTINCT to the ntext header columns read with t0.*.
+        chainStatements = [sql for sql in self.statements if 't0.*' in sql]
+        self.assertTrue(chainStatements)
+        for sql in chainStatements:
+            self.assertEqual(sql.count('DISTINCT'), 1)
+            self.assertIn('DISTINCT DocEntry, BaseEntry', sql)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import datetime
+import decimal
+import unittest
+
+from flask_sapb1.pricing import PriceSnapshot
+
+D = decimal.Decimal
+TODAY = datetime.date(2024, 6, 15)
+
+
+def partner(cardCode, listNum=1, groupCode=100, discRel='L'):
+    return {'Source': 'OCRD', 'CardCode': cardCode, 'ListNum': listNum, 'GroupCode': groupCode, 'DiscRel': discRel}
+
+
+def special(cardCode, itemCode, price, discount=None, listNum=1, autoUpdate='N'):
+    return {'Source': 'OSPP', 'CardCode': cardCode, 'ItemCode': itemCode, 'Price': price, 'Currency': 'EUR',
+            'Discount': discount, 'ListNum': listNum, 'AutoUpdt': autoUpdate, 'Valid': 'Y',
+            'ValidFrom': None, 'ValidTo': None}
+
+
+def period(cardCode, itemCode, lineNum, price, fromDate=None, toDate=None):
+    return {'Source': 'SPP1', 'CardCode': cardCode, 'ItemCode': itemCode, 'LINENUM': lineNum, 'Price': price,
+            'Currency': 'EUR', 'Discount': None, 'FromDate': fromDate, 'ToDate': toDate}
+
+
+def volume(cardCode, itemCode, lineNum, amount, price):
+    return {'Source': 'SPP2', 'CardCode': cardCode, 'ItemCode': itemCode, 'SPP1LNum': lineNum, 'Amount': amount,
+            'Price': price, 'Currency': 'EUR', 'Discount': None}
+
+
+def group(absEntry, type, objCode, lines):
+    rows = [{'Source': 'OEDG', 'AbsEntry': absEntry, 'Type': type, 'ObjCode': objCode,
+             'ValidFrom': None, 'ValidTo': None}]
+    rows.extend({'Source': 'EDG1', 'AbsEntry': absEntry, 'ObjType': objType, 'ObjKey': objKey, 'Discount': discount}
+                for objType, objKey, discount in lines)
+    return rows
+
+
+class PriceSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            partner('C1'), partner('C2'), partner('C3', groupCode=200),
+            {'Source': 'OITM', 'ItemCode': 'A', 'ItmsGrpCod': 10, 'FirmCode': -1},
+            {'Source': 'OITM', 'ItemCode': 'B', 'ItmsGrpCod': 10, 'FirmCode': -1},
+            {'Source': 'ITM1', 'ItemCode': 'A', 'PriceList': 1, 'Price': 100, 'Currency': 'EUR'},
+            {'Source': 'ITM1', 'ItemCode': 'B', 'PriceList': 1, 'Price': 50, 'Currency': 'EUR'},
+            # Customer special price of C1 for A.
+            special('C1', 'A', 80),
+            # Period and volume discounts of price list 1 for A and B.
+            special('*1', 'A', 95), period('*1', 'A', 0, 90), volume('*1', 'A', 0, 10, 85),
+            special('*1', 'B', 45),
+        ]
+        # Discount group of C2 for item A, of customer group 200 for item group 10.
+        self.rows.extend(group(1, 'S', 'C2', [('4', 'A', 20)]))
+        self.rows.extend(group(2, 'C', 200, [('52', 10, 10)]))
+        self.snapshot = PriceSnapshot()
+        self.snapshot.refresh(lambda watermark: self.rows)
+
+    def price(self, cardCode, itemCode, quantity=1):
+        result = self.snapshot.price(cardCode, itemCode, quantity, TODAY)
+        return None if result is None else (result['Price'], result['Source'])
+
+    def testCustomerSpecialPriceFirst(self):
+        self.assertEqual(self.price('C1', 'A'), (D(80), 'special price'))
+
+    def testDiscountGroupBeforePriceListSpecialPrice(self):
+        self.assertEqual(self.price('C2', 'A'), (D(80), 'discount group'))
+        self.assertEqual(self.price('C3', 'A'), (D(90), 'discount group'))
+        self.assertEqual(self.price('C3', 'B'), (D(45), 'discount group'))
+
+    def testPriceListPeriodAndVolumeDiscounts(self):
+        self.assertEqual(self.price('C1', 'B'), (D(45), 'special price'))
+        self.assertEqual(self.price('C2', 'B'), (D(45), 'special price'))
+        self.snapshot.refresh(lambda watermark: self.rows + [partner('C4')], force=True)
+        self.assertEqual(self.price('C4', 'A'), (D(90), 'period discount'))
+        self.assertEqual(self.price('C4', 'A', 10), (D(85), 'volume discount'))
+
+    def testPriceListPrice(self):
+        self.snapshot.refresh(lambda watermark: [row for row in self.rows if row['Source'] != 'OSPP'], force=True)
+        self.assertEqual(self.price('C1', 'A'), (D(100), 'price list'))
+        self.assertEqual(self.snapshot.price('C1', 'A', 1, TODAY)['Discount'], D(0))
+
+    def testUnknownCustomerOrItem(self):
+        self.assertEqual(self.price('C9', 'A'), None)
+        self.assertEqual(self.price('C1', 'Z'), None)
+
+    def testLoadedOnceWithoutInterval(self):
+        for interval in (0, None):
+            loads = []
+            snapshot = PriceSnapshot(interval)
+            for i in range(3):
+                snapshot.refresh(lambda watermark: loads.append(watermark) or self.rows)
+            self.assertEqual(len(loads), 1)
+            self.assertFalse(snapshot.stale())
+
+
+if __name__ == '__main__':
+    unittest.main()
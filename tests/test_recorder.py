@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask_sapb1 import mssqlfake, recorder
+from flask_sapb1.benchmark import customers, makeApp, orderPayload
+
+
+class RecorderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        self.log = os.path.join(self.directory, 'calls.jsonl')
+        mssqlfake.generate(self.path, orders=20, items=20)
+        self.app, self.ext = makeApp(self.path, RECORD=self.log, REPLICAINTERVAL=0,
+                                     REPLICA=os.path.join(self.directory, 'replica.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testArgumentsRecordedAsPassed(self):
+        order = orderPayload('RECORD-1', customers(self.path, 1)[0], 1)
+        order['billto_address'] = 'x' * 150
+        with self.app.app_context():
+            self.ext.insertOrder(order)
+        self.assertLess(len(order['billto_address']), 150)
+        records = recorder.load(self.log)
+        self.assertEqual([record['method'] for record in records], ['insertOrder'])
+        self.assertEqual(records[0]['args'][0]['billto_address'], recorder.pseudonym('x' * 150))
+        self.assertEqual(records[0]['args'][0]['fe_order_id'], 'RECORD-1')
+
+    def testPullReplicaNotRecorded(self):
+        with self.app.app_context():
+            self.ext.pullReplica()
+            self.ext.getMainCurrency()
+        self.assertEqual([record['method'] for record in recorder.load(self.log)], ['getMainCurrency'])
+
+    def testPositionalEmailPseudonymized(self):
+        email = customers(self.path, 1)[0][3]
+        with self.app.app_context():
+            self.ext.getCardCodeByEmail(email)
+        self.assertEqual(recorder.load(self.log)[0]['args'], [recorder.pseudonym(email)])
+
+    def testPreviousRecorderClosed(self):
+        with self.app.app_context():
+            first = self.ext.recorder
+            self.app.config['RECORD'] = os.path.join(self.directory, 'other.jsonl')
+            second = self.ext.recorder
+        self.assertTrue(first._file.closed)
+        self.assertFalse(second._file.closed)
+        second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
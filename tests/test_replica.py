@@ -0,0 +1,196 @@
+import datetime
+import decimal
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from flask_sapb1 import mssqlfake
+from flask_sapb1.benchmark import customers, makeApp, orderPayload
+from flask_sapb1.replica import Replica
+
+
+class RowsAdaptor(object):
+    """Cursor adaptor answering every statement with the same rows.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    @property
+    def sqlSrvCursor(self):
+        return self
+
+    def fetchmany(self, size=None):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+class ReplicaTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=100, items=50)
+        self.replica = Replica(os.path.join(self.directory, 'replica.db'), ['ORDR', 'RDR1', 'OCRD'])
+
+    def tearDown(self):
+        self.replica.close()
+        shutil.rmtree(self.directory)
+
+    def testIncrementalPull(self):
+        app, ext = makeApp(self.path)
+        with app.app_context():
+            pulled = self.replica.pull(ext.cursorAdaptor)
+        self.assertEqual(pulled['ORDR'], 100)
+        self.assertTrue(self.replica.loaded())
+        conn = sqlite3.connect(self.path)
+        later = datetime.datetime(2030, 1, 1)
+        conn.execute("UPDATE ORDR SET NumAtCard = 'CHANGED', UpdateDate = ? WHERE DocEntry = 5", (later,))
+        conn.execute("UPDATE RDR1 SET Quantity = 99 WHERE DocEntry = 5")
+        conn.commit()
+        conn.close()
+        with app.app_context():
+            pulled = self.replica.pull(ext.cursorAdaptor)
+        self.assertTrue(0 < pulled['ORDR'] < 100)
+        self.assertEqual(self.replica.state()['ORDR']['watermark'], later)
+        with app.app_context():
+            # Only the rows of the watermark day are read again.
+            self.assertEqual(self.replica.pull(ext.cursorAdaptor)['ORDR'], 1)
+        cursor = self.replica.connect().cursor(as_dict=True)
+        cursor.execute("SELECT NumAtCard FROM dbo.ORDR WHERE DocEntry = %(docEntry)s", {'docEntry': 5})
+        self.assertEqual(cursor.fetchone()['NumAtCard'], 'CHANGED')
+        cursor.execute("SELECT DISTINCT Quantity FROM dbo.RDR1 WHERE DocEntry = 5")
+        self.assertEqual([row['Quantity'] for row in cursor.fetchall()], [99])
+
+    def testDecimalsKeptExactly(self):
+        replica = Replica(os.path.join(self.directory, 'decimals.db'), ['OITM'])
+        adaptor = RowsAdaptor([{'ItemCode': 'A1', 'OnHand': decimal.Decimal('464.650000'), 'UpdateDate': None}])
+        replica.pull(adaptor)
+        cursor = replica.connect().cursor(as_dict=True)
+        cursor.execute("SELECT ItemCode, OnHand FROM dbo.OITM")
+        self.assertEqual(cursor.fetchall(), [{'ItemCode': 'A1', 'OnHand': decimal.Decimal('464.650000')}])
+        replica.close()
+
+    def testStreamedInChunks(self):
+        replica = Replica(os.path.join(self.directory, 'chunks.db'), ['OITM'], chunkSize=2)
+        # FrgnName is NULL in the first chunk and typed by the second one.
+        adaptor = RowsAdaptor([{'ItemCode': 'A{0}'.format(i), 'FrgnName': None if i < 2 else 'F{0}'.format(i),
+                                'Discount': None, 'UpdateDate': None} for i in range(5)])
+        self.assertEqual(replica.pull(adaptor), {'OITM': 5})
+        cursor = replica.connect().cursor(as_dict=True)
+        cursor.execute("SELECT ItemCode, FrgnName, Discount FROM dbo.OITM WHERE ItemCode IN ('A0', 'A4')")
+        self.assertEqual(sorted(cursor.fetchall(), key=lambda row: row['ItemCode']),
+                         [{'ItemCode': 'A0', 'FrgnName': None, 'Discount': None},
+                          {'ItemCode': 'A4', 'FrgnName': 'F4', 'Discount': None}])
+        replica.close()
+
+    def testDeletedRowsReconciled(self):
+        replica = Replica(os.path.join(self.directory, 'deleted.db'), ['OCRD', 'OCPR'], reconcileInterval=0)
+        app, ext = makeApp(self.path)
+        with app.app_context():
+            replica.pull(ext.cursorAdaptor)
+        conn = sqlite3.connect(self.path)
+        cntctCode = conn.execute("SELECT MIN(CntctCode) FROM OCPR").fetchone()[0]
+        conn.execute("DELETE FROM OCPR WHERE CntctCode = ?", (cntctCode,))
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM OCPR").fetchone()[0]
+        conn.close()
+        with app.app_context():
+            replica.pull(ext.cursorAdaptor)
+        cursor = replica.connect().cursor()
+        cursor.execute("SELECT COUNT(*) FROM dbo.OCPR WHERE CntctCode = %s", (cntctCode,))
+        self.assertEqual(cursor.fetchone()[0], 0)
+        cursor.execute("SELECT COUNT(*) FROM dbo.OCPR")
+        self.assertEqual(cursor.fetchone()[0], total)
+        replica.close()
+
+    def testDeletedRowsKeptUntilReconciled(self):
+        replica = Replica(os.path.join(self.directory, 'kept.db'), ['OCPR'], reconcileInterval=None)
+        app, ext = makeApp(self.path)
+        with app.app_context():
+            replica.pull(ext.cursorAdaptor)
+            conn = sqlite3.connect(self.path)
+            conn.execute("DELETE FROM OCPR")
+            conn.commit()
+            conn.close()
+            replica.pull(ext.cursorAdaptor)
+        cursor = replica.connect().cursor()
+        cursor.execute("SELECT COUNT(*) FROM dbo.OCPR")
+        self.assertTrue(cursor.fetchone()[0] > 0)
+        replica.reconcileInterval = 0
+        with app.app_context():
+            replica.pull(ext.cursorAdaptor)
+        cursor.execute("SELECT COUNT(*) FROM dbo.OCPR")
+        self.assertEqual(cursor.fetchone()[0], 0)
+        replica.close()
+
+
+class ReplicaReadsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=200, items=100)
+        self.app, self.ext = makeApp(self.path, REPLICA=os.path.join(self.directory, 'replica.db'),
+                                     REPLICAINTERVAL=0, REPLICAREADS=True)
+        with self.app.app_context():
+            self.ext.pullReplica()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def count(self, sql, params=()):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(sql, params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def testInsertOrderChecksDuplicatesOnSQLServer(self):
+        order = orderPayload('REPLICA-1', customers(self.path, 1)[0], 2)
+        with self.app.app_context():
+            docEntry = self.ext.insertOrder(dict(order))
+        with self.app.app_context():
+            self.assertEqual(self.ext.insertOrder(dict(order)), docEntry)
+            self.assertEqual(self.ext.getOrderId(order), docEntry)
+        self.assertEqual(self.count("SELECT COUNT(*) FROM ORDR WHERE NumAtCard = ?", ('REPLICA-1',)), 1)
+
+    def testInsertOrderForNewContact(self):
+        order = orderPayload('REPLICA-2', customers(self.path, 1)[0], 1)
+        order.update(billto_firstname='New', billto_lastname='Contact', billto_email='new.contact@example.com')
+        with self.app.app_context():
+            self.assertTrue(self.ext.insertOrder(order))
+        self.assertEqual(self.count("SELECT COUNT(*) FROM OCPR WHERE E_MailL = ?", ('new.contact@example.com',)), 1)
+
+    def readCounts(self):
+        return dict((dict(labels)['result'], value) for name, labels, value in
+                    self.ext.metrics.counter('sapb1_replica_reads_total').samples()
+                    if dict(labels)['method'] == 'getDocuments')
+
+    def testFallbackForTableNotReplicated(self):
+        with self.app.app_context():
+            quotations = self.ext.getDocuments('oQuotations', num=5)
+            invoices = self.ext.getDocuments('oInvoices', num=5, items=False)
+        self.assertEqual(quotations, [])
+        self.assertEqual(len(invoices), 5)
+        self.assertEqual(self.readCounts(), {'fallback': 1, 'replica': 1})
+
+    def testReadsServedByReplica(self):
+        order = orderPayload('REPLICA-3', customers(self.path, 1)[0], 1)
+        with self.app.app_context():
+            docEntry = self.ext.insertOrder(order)
+            params = {'DocEntry': {'value': docEntry}}
+            self.assertEqual(self.ext.getOrders(num=1, params=params), [])
+            with self.ext.fromReplica(False):
+                self.assertEqual(len(self.ext.getOrders(num=1, params=params)), 1)
+            self.ext.pullReplica()
+            self.assertEqual(self.ext.getOrders(num=1, params=params)[0]['NumAtCard'], 'REPLICA-3')
+
+
+if __name__ == '__main__':
+    unittest.main()
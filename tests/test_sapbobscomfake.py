@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from flask_sapb1 import SAPbobsCOMFake, mssqlfake
+
+
+class RecordsetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=20, items=20)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def company(self, companyDB):
+        company = SAPbobsCOMFake.Company()
+        company.CompanyDB = companyDB
+        self.assertEqual(company.Connect(), 0)
+        return company
+
+    def testDoQueryOnSQLiteStore(self):
+        recordset = self.company(self.path).GetBusinessObject(SAPbobsCOMFake.constants.BoRecordset)
+        recordset.DoQuery("SELECT TOP 5 DocEntry, NumAtCard FROM dbo.ORDR ORDER BY DocEntry")
+        self.assertEqual(recordset.RecordCount, 5)
+        self.assertEqual(recordset.Fields.Item('DocEntry').Value, 1)
+
+    def testNoRecordsetOnInMemoryStore(self):
+        company = self.company('')
+        self.assertRaises(RuntimeError, company.GetBusinessObject, SAPbobsCOMFake.constants.BoRecordset)
+
+    def testConcurrentQueriesAndUserFields(self):
+        store = SAPbobsCOMFake.sqliteStore(self.path)
+        errors = []
+        def work(i):
+            try:
+                for j in range(20):
+                    store._ensureColumn('ORDR', 'U_Worker{0}'.format(j % 4))
+                    columns, rows = store.query("SELECT TOP 3 DocEntry FROM dbo.ORDR ORDER BY DocEntry")
+                    assert [row[0] for row in rows] == [1, 2, 3]
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len([c for c in store._tableColumns('ORDR') if c.startswith('U_Worker')]), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
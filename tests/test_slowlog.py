@@ -0,0 +1,79 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask_sapb1 import mssqlfake
+from flask_sapb1.benchmark import customers, makeApp
+from flask_sapb1.recorder import pseudonym, sanitize
+from flask_sapb1.slowlog import DEFAULT_REDACT, REDACTED, redact, sensitive
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class RedactTestCase(unittest.TestCase):
+
+    def testWholeWords(self):
+        for key in ('billto_address', 'Address', 'billto_city', 'shipto_zipcode', 'ZipCode', 'billto_email',
+                    'E_Mail', 'E_MailL', 'billto_firstname', 'FirstName', 'Tel1', 'Phone2', 'password', 'name',
+                    'CardName'):
+            self.assertTrue(sensitive(key, DEFAULT_REDACT), key)
+        for key in ('addresses', 'addressColumns', 'CardCode', 'fe_order_id', 'ItemCode', 'CityCode', 'Hotel'):
+            self.assertFalse(sensitive(key, DEFAULT_REDACT), key)
+
+    def testRedact(self):
+        order = {'billto_city': 'Austin', 'billto_zipcode': '78701', 'card_code': 'C1',
+                 'items': [{'itemcode': 'A1', 'shipto_street': '1 Main St'}]}
+        self.assertEqual(redact([order], DEFAULT_REDACT), [{
+            'billto_city': REDACTED, 'billto_zipcode': REDACTED, 'card_code': 'C1',
+            'items': [{'itemcode': 'A1', 'shipto_street': REDACTED}]}])
+        self.assertEqual(redact({'addresses': True, 'addressColumns': ['City']}, DEFAULT_REDACT),
+                         {'addresses': True, 'addressColumns': ['City']})
+
+    def testEmailValues(self):
+        self.assertEqual(redact(['alice@example.com', 'C1', 5], DEFAULT_REDACT), [REDACTED, 'C1', 5])
+        self.assertEqual(redact({'cardcode': 'C1', 'note': ' bob@example.org '}, DEFAULT_REDACT),
+                         {'cardcode': 'C1', 'note': REDACTED})
+        self.assertEqual(redact('not@an-email', DEFAULT_REDACT), 'not@an-email')
+
+    def testSanitizeMatchesRedact(self):
+        value = {'billto_city': 'Austin', 'addressColumns': ['City'], 'E_MailL': 'a@b.com'}
+        self.assertEqual(sanitize(value), {'billto_city': pseudonym('Austin'), 'addressColumns': ['City'],
+                                           'E_MailL': pseudonym('a@b.com')})
+
+
+class SlowLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=20, items=20)
+        self.app, self.ext = makeApp(self.path, SLOWOPTHRESHOLD=0)
+        self.handler = ListHandler()
+        self.app.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.app.logger.removeHandler(self.handler)
+        shutil.rmtree(self.directory)
+
+    def testPositionalEmailRedacted(self):
+        email = customers(self.path, 1)[0][3]
+        with self.app.app_context():
+            self.assertTrue(self.ext.getCardCodeByEmail(email))
+        slow = [message for message in self.handler.messages if message.startswith('Slow ')]
+        self.assertTrue(any(message.startswith('Slow operation getCardCodeByEmail') for message in slow))
+        self.assertTrue(any(message.startswith('Slow statement') for message in slow))
+        self.assertFalse([message for message in slow if email in message])
+
+
+if __name__ == '__main__':
+    unittest.main()
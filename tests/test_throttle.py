@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from time import sleep, time
+
+from flask_sapb1 import mssqlfake
+from flask_sapb1.benchmark import makeApp
+from flask_sapb1.throttle import Budget, Limiter, PriorityScheduler, RateLimitExceeded
+
+
+class BudgetTestCase(unittest.TestCase):
+
+    def testBurstAdmitsImmediately(self):
+        budget = Budget(rate=10, burst=3, timeout=0.5)
+        for i in range(3):
+            self.assertLess(budget.acquire(), 0.05)
+            budget.release()
+
+    def testRateBelowOnePerSecond(self):
+        budget = Budget(rate=0.5, timeout=0.2)
+        self.assertEqual(budget.burst, 1)
+        self.assertLess(budget.acquire(), 0.05)
+        budget.release()
+        self.assertRaises(RateLimitExceeded, budget.acquire)
+        self.assertEqual(budget.stats()['timeouts'], 1)
+
+    def testRefill(self):
+        budget = Budget(rate=20, burst=1)
+        budget.acquire()
+        budget.release()
+        start = time()
+        budget.acquire()
+        budget.release()
+        self.assertGreaterEqual(time() - start, 0.03)
+
+    def testBurstBelowOneRejected(self):
+        self.assertRaises(ValueError, Budget, rate=1, burst=0.5)
+
+    def testConcurrencyCap(self):
+        budget = Budget(concurrency=1, timeout=0.1)
+        budget.acquire()
+        self.assertRaises(RateLimitExceeded, budget.acquire)
+        released = threading.Timer(0.05, budget.release)
+        released.start()
+        budget.timeout = 1
+        self.assertGreaterEqual(budget.acquire(), 0.03)
+        released.join()
+
+
+class LimiterTestCase(unittest.TestCase):
+
+    def testUnlimitedOperationType(self):
+        limiter = Limiter({'insertOrder': {'rate': 1}})
+        with limiter.acquire('sql') as waited:
+            self.assertEqual(waited, 0.0)
+
+    def testBlockHoldsSlot(self):
+        limiter = Limiter({'insertOrder': {'concurrency': 1, 'timeout': 0.05}})
+        with limiter.acquire('insertOrder'):
+            def second():
+                with limiter.acquire('insertOrder'):
+                    pass
+            self.assertRaises(RateLimitExceeded, second)
+        with limiter.acquire('insertOrder'):
+            pass
+
+
+class PrioritySchedulerTestCase(unittest.TestCase):
+
+    def testNoSlotsRejected(self):
+        self.assertRaises(ValueError, PriorityScheduler, 0)
+
+    def testInteractiveServedFirst(self):
+        scheduler = PriorityScheduler(1)
+        served = []
+        def run(priority):
+            with scheduler.slot(priority):
+                served.append(priority)
+        threads = []
+        with scheduler.slot('batch'):
+            for priority in ('batch', 'interactive'):
+                threads.append(threading.Thread(target=run, args=(priority,)))
+                threads[-1].start()
+                while scheduler.stats()[priority]['queued'] < 1:
+                    sleep(0.001)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(served, ['interactive', 'batch'])
+
+    def testReentrant(self):
+        scheduler = PriorityScheduler(1)
+        with scheduler.slot():
+            with scheduler.slot('batch') as waited:
+                self.assertEqual(waited, 0.0)
+        self.assertEqual(scheduler.stats()['busy'], 0)
+
+
+class SQLBudgetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'company.db')
+        mssqlfake.generate(self.path, orders=20, items=20)
+        self.app, self.ext = makeApp(self.path, DILIMITS={'sql': {'concurrency': 1, 'timeout': 0.1}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def otherContext(self):
+        errors = []
+        def read():
+            with self.app.app_context():
+                try:
+                    self.ext.getMainCurrency()
+                except RateLimitExceeded as e:
+                    errors.append(e)
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return errors
+
+    def testSlotHeldWhileReadingRows(self):
+        with self.app.app_context():
+            adaptor = self.ext.cursorAdaptor
+            adaptor.execute("SELECT DocEntry FROM dbo.ORDR ORDER BY DocEntry")
+            self.assertEqual(adaptor.sqlSrvCursor.fetchone()['DocEntry'], 1)
+            self.assertEqual(len(self.otherContext()), 1)
+            # The next statement of the same cursor does not wait for its own slot.
+            adaptor.execute("SELECT DocEntry FROM dbo.ORDR ORDER BY DocEntry")
+            self.assertEqual(len(list(adaptor.sqlSrvCursor)), 20)
+            self.assertEqual(self.otherContext(), [])
+            self.assertEqual(self.ext.limiter.stats()['sql']['inflight'], 0)
+
+    def testSlotReleasedAtTeardown(self):
+        with self.app.app_context():
+            self.ext.cursorAdaptor.execute("SELECT DocEntry FROM dbo.ORDR ORDER BY DocEntry")
+            self.ext.cursorAdaptor.sqlSrvCursor.fetchone()
+        self.assertEqual(self.otherContext(), [])
+
+    def testSlotReleasedOnError(self):
+        with self.app.app_context():
+            adaptor = self.ext.cursorAdaptor
+            self.assertRaises(Exception, adaptor.execute, "SELECT * FROM dbo.MISSING")
+            self.assertEqual(self.ext.limiter.stats()['sql']['inflight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from flask_sapb1.ttlcache import TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+
+    def testHitsAndExpiry(self):
+        calls = []
+        def load(keys):
+            calls.append(sorted(keys))
+            return dict((key, key.upper()) for key in keys if key != 'x')
+        cache = TTLCache(0.05)
+        self.assertEqual(cache.getMany(['a', 'b', 'x'], load), {'a': 'A', 'b': 'B', 'x': None})
+        self.assertEqual(cache.getMany(['a', 'x'], load), {'a': 'A', 'x': None})
+        self.assertEqual(calls, [['a', 'b', 'x']])
+        time.sleep(0.06)
+        cache.getMany(['a'], load)
+        self.assertEqual(calls, [['a', 'b', 'x'], ['a']])
+        self.assertEqual(cache.stats(), {'size': 3, 'hits': 2, 'misses': 4, 'shared': 0})
+
+    def testSingleFlight(self):
+        started, proceed = threading.Event(), threading.Event()
+        calls = []
+        def load(keys):
+            calls.append(sorted(keys))
+            started.set()
+            proceed.wait(1)
+            return dict((key, key.upper()) for key in keys)
+        cache = TTLCache(60)
+        results = []
+        leader = threading.Thread(target=lambda: results.append(cache.getMany(['a', 'b'], load)))
+        leader.start()
+        started.wait(1)
+        followers = [threading.Thread(target=lambda: results.append(cache.getMany(['a', 'b'], load)))
+                     for i in range(4)]
+        for follower in followers:
+            follower.start()
+        while cache.stats()['shared'] < 8:
+            time.sleep(0.001)
+        proceed.set()
+        for thread in [leader] + followers:
+            thread.join()
+        self.assertEqual(calls, [['a', 'b']])
+        self.assertEqual(results, [{'a': 'A', 'b': 'B'}] * 5)
+        self.assertEqual(cache.stats()['shared'], 8)
+
+    def testFailedLoadIsRetriedByWaiters(self):
+        started, proceed = threading.Event(), threading.Event()
+        calls = []
+        def load(keys):
+            calls.append(sorted(keys))
+            if len(calls) == 1:
+                started.set()
+                proceed.wait(1)
+                raise RuntimeError('connection lost')
+            return dict((key, key.upper()) for key in keys)
+        cache = TTLCache(60)
+        errors = []
+        def lead():
+            try:
+                cache.getMany(['a'], load)
+            except RuntimeError as e:
+                errors.append(e)
+        leader = threading.Thread(target=lead)
+        leader.start()
+        started.wait(1)
+        results = []
+        follower = threading.Thread(target=lambda: results.append(cache.getMany(['a'], load)))
+        follower.start()
+        while cache.stats()['shared'] < 1:
+            time.sleep(0.001)
+        proceed.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(results, [{'a': 'A'}])
+        self.assertEqual(calls, [['a'], ['a']])
+
+
+if __name__ == '__main__':
+    unittest.main()